@@ -0,0 +1,247 @@
+# ------------------------------------- AST NODES -------------------------------------------
+# Every grammar action builds one of these classes. They use __slots__ so a node costs a
+# single small object instead of the attribute dict + adjacency entries of a graph node.
+# The "type" attribute keeps the names the networkx parse graph used.
+
+class Node:
+    __slots__ = ('lineno',)
+    type = None
+
+    def children(self):
+        return ()
+
+    def label(self):
+        return self.type
+
+    def __repr__(self):
+        slots = [f for cls in reversed(type(self).__mro__) for f in getattr(cls, '__slots__', ()) if f != 'lineno']
+        fields = ', '.join(repr(getattr(self, f)) for f in slots)
+        return f'{self.__class__.__name__}({fields})'
+
+class Const(Node):
+    __slots__ = ('value',)
+    type = 'NUMBER'
+
+    def __init__(self, value, lineno=0):
+        self.value = value
+        self.lineno = lineno
+
+    def label(self):
+        return f'NUM_{self.value}'
+
+class Str(Node):
+    __slots__ = ('value',)
+    type = 'STRING'
+
+    def __init__(self, value, lineno=0):
+        self.value = value
+        self.lineno = lineno
+
+    def label(self):
+        return f'str_{self.value}'
+
+class Name(Node):
+    __slots__ = ('name',)
+    type = 'VARIABLE'
+
+    def __init__(self, name, lineno=0):
+        self.name = name
+        self.lineno = lineno
+
+    def label(self):
+        return f'VAR_{self.name}'
+
+class BinOp(Node):
+    # op is one of PLUS, MINUS, TIMES, DIVIDE, POWER
+    __slots__ = ('op', 'left', 'right')
+    labels = {'PLUS': '+', 'MINUS': '-', 'TIMES': '*', 'DIVIDE': '/', 'POWER': 'POW'}
+
+    def __init__(self, op, left, right, lineno=0):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.lineno = lineno
+
+    @property
+    def type(self):
+        return self.op
+
+    def children(self):
+        return (self.left, self.right)
+
+    def label(self):
+        return self.labels[self.op]
+
+class Compare(Node):
+    # op is one of GT, LT, GE, LE, EQ, NE
+    __slots__ = ('op', 'left', 'right')
+    labels = {'GT': '>', 'LT': '<', 'GE': '>=', 'LE': '<=', 'EQ': '==', 'NE': '!='}
+
+    def __init__(self, op, left, right, lineno=0):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.lineno = lineno
+
+    @property
+    def type(self):
+        return self.op
+
+    def children(self):
+        return (self.left, self.right)
+
+    def label(self):
+        return self.labels[self.op]
+
+class BoolOp(Node):
+    # op is one of AND, OR
+    __slots__ = ('op', 'left', 'right')
+    labels = {'AND': '&&', 'OR': '||'}
+
+    def __init__(self, op, left, right, lineno=0):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.lineno = lineno
+
+    @property
+    def type(self):
+        return self.op
+
+    def children(self):
+        return (self.left, self.right)
+
+    def label(self):
+        return self.labels[self.op]
+
+class Group(Node):
+    __slots__ = ('expr',)
+    type = 'GROUP'
+
+    def __init__(self, expr, lineno=0):
+        self.expr = expr
+        self.lineno = lineno
+
+    def children(self):
+        return (self.expr,)
+
+    def label(self):
+        return '( )'
+
+class Call(Node):
+    __slots__ = ('name', 'args')
+    type = 'FUNCTION_CALL'
+
+    def __init__(self, name, args, lineno=0):
+        self.name = name
+        self.args = args
+        self.lineno = lineno
+
+    def children(self):
+        return tuple(self.args)
+
+    def label(self):
+        return f'FUN_{self.name}'
+
+class If(Node):
+    __slots__ = ('cond', 'then', 'orelse')
+    type = 'IF'
+
+    def __init__(self, cond, then, orelse, lineno=0):
+        self.cond = cond
+        self.then = then
+        self.orelse = orelse
+        self.lineno = lineno
+
+    def children(self):
+        return (self.cond, self.then, self.orelse)
+
+class Ternary(If):
+    __slots__ = ()
+    type = 'TERNARY'
+
+    def label(self):
+        return '?'
+
+class Assign(Node):
+    __slots__ = ('name', 'value')
+    type = 'ASSIGN'
+
+    def __init__(self, name, value, lineno=0):
+        self.name = name
+        self.value = value
+        self.lineno = lineno
+
+    def children(self):
+        return (self.value,)
+
+    def label(self):
+        return '='
+
+class Flow(Node):
+    # source -> stage(args) -> stage(args), every stage is a Call without the image argument
+    __slots__ = ('source', 'stages')
+    type = 'FLOW'
+
+    def __init__(self, source, stages, lineno=0):
+        self.source = source
+        self.stages = stages
+        self.lineno = lineno
+
+    def children(self):
+        return (self.source,) + tuple(self.stages)
+
+    def label(self):
+        return '->'
+
+class Block(Node):
+    # Statements of a program in source order, the value of the last one is the result
+    __slots__ = ('statements',)
+    type = 'BLOCK'
+
+    def __init__(self, statements, lineno=0):
+        self.statements = statements
+        self.lineno = lineno
+
+    def children(self):
+        return tuple(self.statements)
+
+    def label(self):
+        return ';'
+
+# ------------------------------------- HELPERS ---------------------------------------------
+def count_nodes(node):
+    total = 0
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        total += 1
+        pending.extend(current.children())
+    return total
+
+# ------------------------------------- GRAPH CONVERSION ------------------------------------
+def to_graph(node):
+    '''
+    Builds the networkx parse graph the draw option displays, with an INITIAL root.
+    Node attributes match the ones the grammar actions used to create.
+    '''
+    import networkx as nx
+
+    graph = nx.Graph()
+    graph.add_node(0, type='INITIAL', label='INIT', counter=0)
+    pending = [(node, 0)]
+    counter = 1
+    while pending:
+        current, parent = pending.pop()
+        node_id = counter
+        counter += 1
+        value = getattr(current, 'value', None) if isinstance(current, (Const, Str)) else getattr(current, 'name', '')
+        graph.add_node(node_id, type=current.type, label=current.label(), value=value, counter=node_id)
+        graph.add_edge(parent, node_id)
+        if isinstance(current, Assign):
+            graph.add_node(counter, type='VARIABLE_ASSIGN', label=f'VAR_{current.name}', value=current.name, counter=counter)
+            graph.add_edge(node_id, counter)
+            counter += 1
+        for child in reversed(current.children()):
+            pending.append((child, node_id))
+    return graph
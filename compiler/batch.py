@@ -0,0 +1,225 @@
+import argparse
+import glob
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from pipeline import Pipeline
+from image_io import IOStats, ImageReader, ImageWriter
+from buffers import BufferPool, PoolStats
+
+# ------------------------------------- BATCH RESULTS ---------------------------------------
+# output is the written path, error is None when the file was processed correctly
+BatchResult = namedtuple('BatchResult', ['path', 'output', 'error', 'seconds'])
+
+# ------------------------------------- JOBS ------------------------------------------------
+class BatchJob:
+    '''
+    Work applied to every file of a batch, compiled once per process.
+    job is either a Pipeline, a flow ("f(a) -> g(b)") or a script. Scripts see the loaded
+    image as "image" and its path as "path", the value of the last statement is saved.
+    With cache_dir compiled scripts are shared between processes through that directory.
+    With buffer_pool the job's cv2 calls write into recycled arrays (see buffers.py), pool
+    holds the BufferPool and its counters.
+    '''
+    def __init__(self, job, mode='flow', cache_dir=None, buffer_pool=False):
+        # Imported here so worker processes only build the parser when they need it
+        from translator import Interpreter
+        from program_cache import ProgramCache, program_cache
+
+        cache = program_cache if cache_dir is None else ProgramCache(directory=cache_dir)
+        self.pool = BufferPool() if buffer_pool else None
+        self.interpreter = Interpreter(cache=cache, pool=self.pool)
+        self.mode = mode
+        self.pipeline = None
+        self.program = None
+
+        if isinstance(job, Pipeline):
+            self.pipeline = job if self.pool is None else Pipeline(job.stages, self.pool)
+        elif mode == 'flow':
+            self.pipeline = self.interpreter.flow(job)
+            if not isinstance(self.pipeline, Pipeline):
+                raise ValueError(f"Unable to build flow {job!r}")
+        else:
+            self.program = self.interpreter.load(job)
+            if self.program is None:
+                raise ValueError(f"Unable to parse script {job!r}")
+
+    def apply(self, image, path):
+        if self.pipeline is not None:
+            return self.pipeline(image)
+        self.interpreter.symbol_table["image"] = image
+        self.interpreter.symbol_table["path"] = path
+        return self.interpreter.execute(self.program)
+
+    def process_many(self, paths, output_dir, extension=None, read_ahead=4, write_behind=4, io_threads=2, stats=None):
+        '''
+        Loads, applies the job to and saves every path, yielding a BatchResult each. Images
+        are prefetched by an ImageReader and written by an ImageWriter so disk I/O overlaps
+        with the job. Results keep input order, a failing file is reported in its result.
+        '''
+        pending = deque()
+        with ImageReader(paths, read_ahead, io_threads, stats) as reader, \
+             ImageWriter(write_behind, io_threads, reader.stats) as writer:
+            for path, image, error in reader:
+                start = time.perf_counter()
+                if error is None and image is None:
+                    error = "unable to read image"
+                if error is None:
+                    try:
+                        result = self.apply(image, path)
+                        if isinstance(result, str) and result == "Error":
+                            error = "job failed"
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                if error is not None:
+                    pending.append([path, None, None, error, start, None])
+                else:
+                    output = output_path(path, output_dir, extension)
+                    pending.append([path, output, writer.write(output, result), None, start, result])
+                result = None
+
+                while pending and (pending[0][2] is None or pending[0][2].done()):
+                    yield self.finish(pending.popleft())
+
+            while pending:
+                yield self.finish(pending.popleft())
+
+    def finish(self, entry):
+        # entry is [path, output, write future, error, start, result]
+        result = entry.pop()
+        done = finish_write(*entry)
+        if self.pool is not None and done.error is None:
+            # Written, the result can hold a later image's when it is a temporary
+            self.pool.recycle(result)
+        return done
+
+def output_path(path, output_dir, extension):
+    name = os.path.basename(path)
+    if extension:
+        name = os.path.splitext(name)[0] + extension
+    return os.path.join(output_dir, name)
+
+def finish_write(path, output, future, error, start):
+    if future is not None:
+        try:
+            if future.result() is False:
+                error = "unable to write " + output
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    if error is not None:
+        return BatchResult(path, None, error, time.perf_counter() - start)
+    return BatchResult(path, output, None, time.perf_counter() - start)
+
+# ------------------------------------- WORKER PROCESSES ------------------------------------
+# Each worker process compiles the job once in its initializer
+worker_job = None
+
+def init_worker(job, mode, cache_dir=None, buffer_pool=False):
+    global worker_job
+    worker_job = BatchJob(job, mode, cache_dir, buffer_pool)
+
+def process_chunk(paths, output_dir, extension, read_ahead, write_behind):
+    stats = IOStats()
+    pool_before = worker_job.pool.stats.as_dict() if worker_job.pool is not None else None
+    results = list(worker_job.process_many(paths, output_dir, extension, read_ahead, write_behind, stats=stats))
+    pool_stats = None
+    if pool_before is not None:
+        # The counters of this chunk only, the pool lives as long as the worker
+        pool_stats = {field: value - pool_before[field] for field, value in worker_job.pool.stats.as_dict().items()}
+    return results, stats.as_dict(), pool_stats
+
+# ------------------------------------- BATCH API -------------------------------------------
+def expand_inputs(pattern):
+    if isinstance(pattern, str):
+        return sorted(glob.glob(pattern, recursive=True))
+    paths = []
+    for p in pattern:
+        paths.extend(sorted(glob.glob(p, recursive=True)))
+    return paths
+
+def run_batch(job, pattern, output_dir, workers=None, chunksize=1, mode='flow', extension=None,
+              read_ahead=4, write_behind=4, io_stats=None, cache_dir=None, buffer_pool=False, pool_stats=None):
+    '''
+    Applies job to every file matching pattern (a glob or a list of globs) and writes the
+    results into output_dir. Yields a BatchResult per file as soon as its chunk finishes,
+    a failing file is reported in its result and never stops the batch.
+    workers=0 runs everything in the calling process. Reads and writes inside a worker are
+    overlapped with processing, pass an IOStats as io_stats to collect the queue metrics.
+    With cache_dir a script compiled by an earlier run or worker is loaded without parsing.
+    With buffer_pool every process recycles the job's arrays, pass a PoolStats as
+    pool_stats to collect the allocations avoided.
+    '''
+    paths = expand_inputs(pattern)
+    os.makedirs(output_dir, exist_ok=True)
+    chunksize = max(1, int(chunksize))
+    if io_stats is None:
+        io_stats = IOStats()
+
+    if workers == 0:
+        local_job = BatchJob(job, mode, cache_dir, buffer_pool)
+        yield from local_job.process_many(paths, output_dir, extension, read_ahead, write_behind, stats=io_stats)
+        if pool_stats is not None and local_job.pool is not None:
+            pool_stats.merge(local_job.pool.stats)
+        return
+
+    chunks = [paths[i:i + chunksize] for i in range(0, len(paths), chunksize)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(job, mode, cache_dir, buffer_pool)) as executor:
+        futures = {executor.submit(process_chunk, chunk, output_dir, extension, read_ahead, write_behind): chunk
+                   for chunk in chunks}
+        for future in as_completed(futures):
+            try:
+                results, stats, chunk_pool_stats = future.result()
+                io_stats.merge(stats)
+                if pool_stats is not None and chunk_pool_stats is not None:
+                    pool_stats.merge(chunk_pool_stats)
+            except Exception as e:
+                results = [BatchResult(path, None, f"{type(e).__name__}: {e}", 0.0) for path in futures[future]]
+            for result in results:
+                yield result
+
+# ------------------------------------- CLI -------------------------------------------------
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='translator.py batch', description='Apply a flow or script to many images')
+    arg_parser.add_argument('job', help='flow like "cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)", a script statement or a file containing it')
+    arg_parser.add_argument('inputs', nargs='+', help='glob(s) of input images')
+    arg_parser.add_argument('-o', '--output', required=True, help='output directory')
+    arg_parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (0 runs in process, default cpu count)')
+    arg_parser.add_argument('-c', '--chunksize', type=int, default=1, help='files sent to a worker at a time')
+    arg_parser.add_argument('--script', action='store_true', help='treat job as a script statement instead of a flow')
+    arg_parser.add_argument('--ext', default=None, help='output extension, for example .png')
+    arg_parser.add_argument('--read-ahead', type=int, default=4, help='images decoded ahead of processing per worker')
+    arg_parser.add_argument('--write-behind', type=int, default=4, help='pending image writes per worker')
+    arg_parser.add_argument('--io-stats', action='store_true', help='print read/write queue metrics')
+    arg_parser.add_argument('--program-cache', default=None, help='directory where compiled scripts are shared between workers')
+    arg_parser.add_argument('--buffer-pool', action='store_true', help='reuse cv2 output arrays between images and report the allocations avoided')
+    return arg_parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    job = args.job
+    if os.path.isfile(job):
+        with open(job) as f:
+            job = f.read().strip()
+    mode = 'script' if args.script else 'flow'
+
+    done = 0
+    errors = 0
+    start = time.perf_counter()
+    stats = IOStats()
+    pool_stats = PoolStats() if args.buffer_pool else None
+    for result in run_batch(job, args.inputs, args.output, args.workers, args.chunksize, mode, args.ext,
+                            args.read_ahead, args.write_behind, stats, args.program_cache, args.buffer_pool, pool_stats):
+        if result.error is None:
+            done += 1
+            print(f"ok    {result.path} -> {result.output} ({result.seconds:.3f}s)")
+        else:
+            errors += 1
+            print(f"error {result.path}: {result.error}")
+    print(f"Finished, {done} processed, {errors} errors in {time.perf_counter() - start:.2f}s")
+    if args.io_stats:
+        print(stats.report())
+    if pool_stats is not None:
+        print(pool_stats.report())
+    return 1 if errors else 0
@@ -0,0 +1,58 @@
+'''
+Deep expression benchmark for the non-recursive compiler, optimizer and VM.
+
+Left recursive rules make "x + x + ... + x" a left-deep chain of PLUS nodes,
+"max(x, x, ..., x)" a call with a very long argument list and "((((x))))" a
+chain of GROUP nodes, so depth grows linearly with the script length.
+The recursive visit_node is timed too while it stays under the recursion limit.
+
+    python benchmarks/bench_deep.py [depth ...]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translator import Interpreter, visit_node
+from optimizer import optimize
+from bytecode import compile_tree
+
+
+def shapes(depth):
+    return {
+        'sum chain': " + ".join(["x"] * depth),
+        'argument list': "max(" + ", ".join(["x"] * depth) + ")",
+        'nested groups': "(" * depth + "x" + ")" * depth,
+        'folded constants': " + ".join(["1"] * depth),
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    depths = [int(d) for d in sys.argv[1:]] or [10000, 100000]
+    interpreter = Interpreter({"x": 1})
+    print(f"{'shape':<18}{'depth':>8}{'parse':>10}{'optimize':>10}{'compile':>10}{'execute':>10}{'visit_node':>12}  (ms)")
+    for depth in depths:
+        for name, source in shapes(depth).items():
+            tree, parse_time = timed(interpreter.parse, source)
+            optimized, optimize_time = timed(optimize, tree)
+            program, compile_time = timed(compile_tree, optimized)
+            result, execute_time = timed(interpreter.execute, program)
+            try:
+                expected, visit_time = timed(visit_node, tree, interpreter.symbol_table)
+                assert expected == result
+                visit = f"{visit_time * 1000:>12.1f}"
+            except RecursionError:
+                visit = f"{'recursion':>12}"
+            print(f"{name:<18}{depth:>8}{parse_time * 1000:>10.1f}{optimize_time * 1000:>10.1f}"
+                  f"{compile_time * 1000:>10.1f}{execute_time * 1000:>10.1f}{visit}")
+
+
+if __name__ == '__main__':
+    main()
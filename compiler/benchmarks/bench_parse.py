@@ -0,0 +1,56 @@
+'''
+Parse benchmark: slotted AST against the networkx parse graph.
+
+The graph column builds the same nx.Graph the grammar actions used to fill
+node by node (via to_graph), so it measures what every parse used to pay.
+
+    python benchmarks/bench_parse.py [terms] [repeats]
+'''
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translator import parser
+from ast_nodes import count_nodes, to_graph
+
+
+def long_expression(terms):
+    parts = []
+    for i in range(terms):
+        parts.append(f"({i} + x{i % 7}) * 2")
+    return "y = " + " + ".join(parts)
+
+
+def measure(build, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        build()
+    elapsed = (time.perf_counter() - start) / repeats
+
+    tracemalloc.start()
+    result = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def main():
+    terms = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    source = long_expression(terms)
+
+    ast_time, ast_peak, tree = measure(lambda: parser.parse(source), repeats)
+    graph_time, graph_peak, _ = measure(lambda: to_graph(parser.parse(source)), repeats)
+
+    print(f"nodes per parse: {count_nodes(tree)}")
+    print(f"{'':<14}{'time (ms)':>12}{'peak (KiB)':>14}")
+    print(f"{'ast':<14}{ast_time * 1000:>12.2f}{ast_peak / 1024:>14.1f}")
+    print(f"{'networkx':<14}{graph_time * 1000:>12.2f}{graph_peak / 1024:>14.1f}")
+    print(f"speedup {graph_time / ast_time:.2f}x, memory {graph_peak / ast_peak:.2f}x less")
+
+
+if __name__ == '__main__':
+    main()
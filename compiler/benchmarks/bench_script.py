@@ -0,0 +1,69 @@
+'''
+Script benchmark: a generated script fed line by line against run_file.
+
+The per line column parses, compiles and runs every statement on its own, the way
+the REPL used to be the only way to feed a file. run_file parses the whole file
+once into a single program.
+
+    python benchmarks/bench_script.py [statements] [repeats]
+'''
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translator import Interpreter
+
+
+def generated_script(statements):
+    lines = ['x0 = 1']
+    for i in range(1, statements):
+        lines.append(f'x{i} = (x{i - 1} + {i}) * 2 - x{i - 1}')
+    return '\n'.join(lines) + '\n'
+
+
+def per_line(source):
+    interpreter = Interpreter()
+    result = None
+    for line in source.splitlines():
+        result = interpreter.run(line)
+    return result
+
+
+def whole_file(path):
+    return Interpreter().run_file(path)
+
+
+def measure(run, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    statements = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    source = generated_script(statements)
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write(source)
+    try:
+        line_time, line_result = measure(lambda: per_line(source), repeats)
+        file_time, file_result = measure(lambda: whole_file(f.name), repeats)
+    finally:
+        os.unlink(f.name)
+
+    assert line_result == file_result
+    print(f"statements: {statements}")
+    print(f"{'':<14}{'time (ms)':>12}{'statements/s':>16}")
+    print(f"{'per line':<14}{line_time * 1000:>12.1f}{statements / line_time:>16.0f}")
+    print(f"{'run_file':<14}{file_time * 1000:>12.1f}{statements / file_time:>16.0f}")
+    print(f"speedup {line_time / file_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
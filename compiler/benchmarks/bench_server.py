@@ -0,0 +1,86 @@
+'''
+Server load generator: starts an EvaluationServer on a free localhost port and sends
+requests from concurrent clients, reporting throughput and latency percentiles.
+The baseline column runs a few of the same jobs the old way, one python process per
+job (python translator.py run script.txt).
+
+    python benchmarks/bench_server.py [requests] [clients] [workers]
+'''
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+COMPILER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COMPILER_DIR)
+
+import numpy as np
+import cv2
+
+from server import EvaluationServer, ServerClient
+
+SCRIPT = "gray = img -> cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+async def client(host, port, count, image_path, latencies):
+    connection = await ServerClient.connect(host, port)
+    try:
+        for i in range(count):
+            start = time.perf_counter()
+            response = await connection.request(id=i, script=SCRIPT, images={'img': image_path})
+            latencies.append(time.perf_counter() - start)
+            assert response['ok'], response
+    finally:
+        await connection.close()
+
+
+async def load(requests, clients, workers, image_path):
+    server = EvaluationServer(workers, timeout=30.0, port=0)
+    host, port = await server.start()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, requests // clients, image_path, latencies) for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    await server.close()
+    return elapsed, latencies
+
+
+def process_per_job(jobs, image_path):
+    with tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False) as f:
+        f.write(f'img = load_image("{image_path}")\n{SCRIPT}\n')
+    try:
+        start = time.perf_counter()
+        for _ in range(jobs):
+            subprocess.run([sys.executable, 'translator.py', 'run', f.name], cwd=COMPILER_DIR,
+                           capture_output=True, check=True)
+        return (time.perf_counter() - start) / jobs
+    finally:
+        os.unlink(f.name)
+
+
+def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    with tempfile.TemporaryDirectory() as directory:
+        image_path = os.path.join(directory, 'input.png')
+        cv2.imwrite(image_path, np.random.default_rng(0).integers(0, 256, (240, 320, 3), dtype=np.uint8))
+        elapsed, latencies = asyncio.run(load(requests, clients, workers, image_path))
+        per_job = process_per_job(5, image_path)
+
+    print(f"requests {len(latencies)}, clients {clients}, workers {workers}")
+    print(f"throughput      {len(latencies) / elapsed:>10.1f} requests/s")
+    print(f"latency p50     {percentile(latencies, 0.5) * 1000:>10.2f} ms")
+    print(f"latency p99     {percentile(latencies, 0.99) * 1000:>10.2f} ms")
+    print(f"process per job {per_job * 1000:>10.2f} ms ({1 / per_job:.1f} jobs/s)")
+
+
+if __name__ == '__main__':
+    main()
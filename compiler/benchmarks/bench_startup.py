@@ -0,0 +1,60 @@
+'''
+Cold start benchmark: a fresh interpreter process evaluating one statement.
+
+    lazy        import translator as it is now, run "x = 2 ^ 3 + max(1, 2)"
+    eager       same, importing cv2, numpy, matplotlib and networkx first, like
+                translator used to at module level
+    regenerate  lazy, but the LALR tables are rebuilt from the grammar instead of
+                loaded from parsetab.py (what a stale or missing table costs)
+    first_call  lazy, then one cv2 call, the point where cv2 is imported now
+
+Every case runs in a new python process, the best of repeats is reported.
+
+    python benchmarks/bench_startup.py [repeats]
+'''
+import os
+import subprocess
+import sys
+import time
+
+COMPILER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+EAGER_IMPORTS = ("import cv2, numpy, matplotlib.pyplot, networkx\n"
+                 "from networkx.drawing.nx_pydot import graphviz_layout\n")
+
+REGENERATE = ("import sys, ply.yacc\n"
+              "build = ply.yacc.yacc\n"
+              "ply.yacc.yacc = lambda **kw: build(module=sys.modules['translator'], tabmodule='missing_parsetab', **kw)\n")
+
+CASES = {
+    'lazy': "import translator\ntranslator.Interpreter().run('x = 2 ^ 3 + max(1, 2)')\n",
+    'eager': EAGER_IMPORTS + "import translator\ntranslator.Interpreter().run('x = 2 ^ 3 + max(1, 2)')\n",
+    'regenerate': REGENERATE + "import translator\ntranslator.Interpreter().run('x = 2 ^ 3 + max(1, 2)')\n",
+    'first_call': "import translator\ntranslator.Interpreter().run('flip(gen_matrix(2, 2, 1, 2, 3, 4), 0)')\n",
+}
+
+
+def cold_start(script, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', script], cwd=COMPILER_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    baseline = cold_start('pass\n', repeats)
+    print(f"empty interpreter {baseline * 1000:.1f} ms")
+    print(f"{'':<14}{'total (ms)':>12}{'over python (ms)':>18}")
+    results = {}
+    for name, script in CASES.items():
+        results[name] = cold_start(script, repeats)
+        print(f"{name:<14}{results[name] * 1000:>12.1f}{(results[name] - baseline) * 1000:>18.1f}")
+    print(f"lazy start up is {(results['eager'] - baseline) / (results['lazy'] - baseline):.1f}x faster than eager")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+'''
+Strip benchmark: latency of one large image through a flow, full frame against
+run_strips with 1, 2, 4, ... worker threads up to the number of cores.
+
+    python benchmarks/bench_strips.py [megapixels] [repeats]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from translator import Interpreter
+from tiling import run_strips
+
+FLOW = "cvtColor(6) -> GaussianBlur(gen_vector(9, 9), 0) -> dilate(gen_matrix(3, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1)) -> medianBlur(5)"
+
+
+def measure(run, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    megapixels = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    image = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    pipeline = Interpreter().flow(FLOW)
+
+    full_time, expected = measure(lambda: pipeline(image), repeats)
+    print(f"image {width}x{height}, {os.cpu_count()} cores")
+    print(f"{'':<14}{'time (ms)':>12}{'speedup':>10}")
+    print(f"{'full frame':<14}{full_time * 1000:>12.1f}{1:>10.2f}")
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        strip_time, result = measure(lambda: run_strips(pipeline, image, workers), repeats)
+        assert np.array_equal(result, expected)
+        print(f"{f'{workers} threads':<14}{strip_time * 1000:>12.1f}{full_time / strip_time:>10.2f}")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
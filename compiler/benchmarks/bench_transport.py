@@ -0,0 +1,56 @@
+'''
+Transport benchmark: images sent to a pool of worker processes and back, pickled
+against shared memory descriptors, for a few image sizes. The job is a single cheap
+cv2 call so the time is mostly moving pixels between processes. With shared memory
+each image is still copied twice, once into its input segment by the parent and once
+into its result segment by the worker. Pickling copies it several times each way.
+
+    python benchmarks/bench_transport.py [images] [repeats]
+'''
+import gc
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from transport import SharedImages, map_images
+
+FLOW = "bitwise_not()"
+MEGAPIXELS = (0.3, 2, 12, 50)
+
+
+def measure(images, transport, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        shared = SharedImages()
+        start = time.perf_counter()
+        results = list(map_images(FLOW, images, workers=2, transport=transport, shared=shared))
+        best = min(best, time.perf_counter() - start)
+        assert all(np.array_equal(result, ~image) for result, image in zip(results, images))
+        del results
+        gc.collect()
+        shared.close()
+    return best
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    rng = np.random.default_rng(0)
+    print(f"{count} images per run, 2 worker processes, {os.cpu_count()} cores")
+    print("shared: one copy into the input segment, one into the result segment")
+    print(f"{'image':<14}{'pickle (ms)':>14}{'shared (ms)':>14}{'speedup':>10}")
+    for megapixels in MEGAPIXELS:
+        width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+        height = int(width * 3 / 4)
+        images = [rng.integers(0, 256, (height, width, 3), dtype=np.uint8) for _ in range(count)]
+        pickled = measure(images, 'pickle', repeats)
+        shared = measure(images, 'shared', repeats)
+        print(f"{f'{width}x{height}':<14}{pickled * 1000:>14.1f}{shared * 1000:>14.1f}{pickled / shared:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+'''
+Benchmark suite: throughput of every stage, written to JSON and compared against a
+stored baseline to catch performance regressions. Runs offline, images are synthetic.
+
+    lexer         tokens/s through the lexer
+    parser        statements/s through parser.parse (lexing included)
+    build         nodes/s through optimize + compile_tree
+    vm            nodes/s executing a compiled program
+    visit_node    nodes/s through the reference tree walker
+    gen_matrix    calls/s building a 32x32 matrix, gen_vector a 2 element vector
+    flow_*        images/s through OpenCV flows on 512x512 random images
+    arithmetic    images/s through a fused image expression, saturating
+
+Every benchmark repeats its operation for at least --min-time seconds, the best of
+--repeats rounds is kept. Rates are higher is better.
+
+    python benchmarks/suite.py run [-o results.json] [--quick] [-k name]
+    python benchmarks/suite.py compare baseline.json [current.json] [--threshold 0.1]
+
+compare runs the suite when current.json is not given and exits with status 1 when a
+benchmark is slower than the baseline by more than the threshold.
+'''
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import cv2
+
+from translator import Interpreter, lexer, parser, visit_node
+from ast_nodes import count_nodes
+from optimizer import optimize
+from bytecode import compile_tree
+from library import gen_matrix, gen_vector
+from buffers import BufferPool
+
+FLOWS = {
+    'flow_blur': "cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)",
+    'flow_threshold': "cvtColor(6) -> adaptiveThreshold(255, 0, 0, 11, 2)",
+    'flow_edges': "cvtColor(6) -> Canny(50, 150) -> dilate(gen_matrix(3, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1))",
+    'flow_resize': "resize(gen_vector(256, 256)) -> flip(1) -> cvtColor(40)",
+}
+
+
+# ------------------------------------- WORKLOADS -------------------------------------------
+def generated_script(statements):
+    # Arithmetic, comparisons, conditionals and calls, one statement per line
+    lines = ['x0 = 1']
+    for i in range(1, statements):
+        previous = f'x{i - 1}'
+        if i % 4 == 0:
+            lines.append(f'x{i} = if ({previous} > {i}): {previous} - {i} else: {previous} + {i}')
+        elif i % 4 == 1:
+            lines.append(f'x{i} = max({previous}, {i}) * 2 - {previous}')
+        elif i % 4 == 2:
+            lines.append(f'x{i} = ({previous} + {i}) * ({i} - 1) / {i}')
+        else:
+            lines.append(f'x{i} = (({previous} > 0) && ({i} > 1))?({previous}):({i})')
+    return '\n'.join(lines) + '\n'
+
+
+def synthetic_image(size=512, seed=0):
+    # Smooth gradients plus noise, so blurs, thresholds and edges all have work to do
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    base = np.stack([x * 255 // size, y * 255 // size, (x + y) * 255 // (2 * size)], axis=-1)
+    noise = rng.integers(0, 64, size=(size, size, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+
+def measure(operation, units, min_time, repeats):
+    '''
+    Returns the best rate (units per second) of repeats rounds, every round calls
+    operation as many times as it takes to last min_time seconds.
+    '''
+    operation()
+    best = 0.0
+    for _ in range(repeats):
+        calls = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            operation()
+            calls += 1
+            elapsed = time.perf_counter() - start
+        best = max(best, units * calls / elapsed)
+    return best
+
+
+# ------------------------------------- BENCHMARKS ------------------------------------------
+def benchmarks(quick):
+    statements = 200 if quick else 2000
+    source = generated_script(statements)
+    interpreter = Interpreter(cache=None)
+    tree = interpreter.parse(source)
+    nodes = count_nodes(tree)
+    optimized = optimize(tree)
+    # The vm runs the optimized tree, folded constants are nodes it never sees
+    vm_nodes = count_nodes(optimized)
+    program = compile_tree(optimized)
+
+    own_lexer = lexer.clone()
+    own_parser = copy.copy(parser)
+    token_count = len(list(tokens(own_lexer, source)))
+
+    def run_lexer():
+        for _ in tokens(own_lexer, source):
+            pass
+
+    def run_parser():
+        own_lexer.lineno = 1
+        own_parser.parse(source, lexer=own_lexer)
+
+    def run_vm():
+        interpreter.execute(program)
+
+    def run_visit():
+        visit_node(tree, dict(interpreter.symbol_table))
+
+    def run_build():
+        compile_tree(optimize(tree))
+
+    values = list(range(32 * 32))
+    suite = {
+        'lexer': (run_lexer, token_count, 'tokens/s'),
+        'parser': (run_parser, statements, 'statements/s'),
+        'build': (run_build, nodes, 'nodes/s'),
+        'vm': (run_vm, vm_nodes, 'nodes/s'),
+        'visit_node': (run_visit, nodes, 'nodes/s'),
+        'gen_matrix': (lambda: gen_matrix(32, 32, *values), 1, 'calls/s'),
+        'gen_vector': (lambda: gen_vector(5, 5), 1, 'calls/s'),
+    }
+
+    image = synthetic_image(256 if quick else 512)
+    for name, flow in FLOWS.items():
+        pipeline = interpreter.flow(flow)
+        suite[name] = (lambda pipeline=pipeline: pipeline(image), 1, 'images/s')
+    pooled = Interpreter(cache=None, pool=BufferPool()).flow(FLOWS['flow_edges'])
+    suite['flow_edges_pooled'] = (lambda: pooled(image), 1, 'images/s')
+
+    images = Interpreter({'a': image, 'b': image[::-1]}, cache=None, arithmetic='saturate')
+    expression = images.compile(images.parse('a * 2 - b / 3 + 1'))
+    suite['arithmetic'] = (lambda: images.execute(expression), 1, 'images/s')
+    return suite
+
+
+def tokens(own_lexer, source):
+    own_lexer.lineno = 1
+    own_lexer.input(source)
+    return iter(own_lexer.token, None)
+
+
+def run_suite(quick=False, selected=None, min_time=None, repeats=None):
+    min_time = min_time if min_time is not None else (0.05 if quick else 0.3)
+    repeats = repeats if repeats is not None else (2 if quick else 5)
+    results = {}
+    for name, (operation, units, unit) in benchmarks(quick).items():
+        if selected and not any(s in name for s in selected):
+            continue
+        results[name] = {'rate': measure(operation, units, min_time, repeats), 'unit': unit}
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'machine': platform.machine(),
+            'quick': quick,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+# ------------------------------------- COMPARISON ------------------------------------------
+def compare(baseline, current, threshold=0.1):
+    '''
+    Returns (name, baseline_rate, current_rate, change, status) rows, change is the
+    relative rate difference and status is "regression" when the rate dropped by more
+    than threshold, "improved" when it grew by more than threshold, else "ok".
+    Benchmarks missing on either side are reported as "missing" / "new".
+    '''
+    rows = []
+    old = baseline['results']
+    new = current['results']
+    for name in sorted(set(old) | set(new)):
+        if name not in new:
+            rows.append((name, old[name]['rate'], None, None, 'missing'))
+            continue
+        if name not in old:
+            rows.append((name, None, new[name]['rate'], None, 'new'))
+            continue
+        change = new[name]['rate'] / old[name]['rate'] - 1 if old[name]['rate'] else 0.0
+        if change < -threshold:
+            status = 'regression'
+        elif change > threshold:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, old[name]['rate'], new[name]['rate'], change, status))
+    return rows
+
+
+def print_results(report):
+    print(f"{'benchmark':<16}{'rate':>16}  unit")
+    for name, result in report['results'].items():
+        print(f"{name:<16}{result['rate']:>16,.1f}  {result['unit']}")
+
+
+def print_comparison(rows):
+    print(f"{'benchmark':<16}{'baseline':>16}{'current':>16}{'change':>10}  status")
+    for name, old, new, change, status in rows:
+        old_text = f"{old:,.1f}" if old is not None else '-'
+        new_text = f"{new:,.1f}" if new is not None else '-'
+        change_text = f"{change:+.1%}" if change is not None else '-'
+        print(f"{name:<16}{old_text:>16}{new_text:>16}{change_text:>10}  {status}")
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Throughput benchmarks with baseline comparison')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    run_command = commands.add_parser('run', help='run the suite')
+    run_command.add_argument('-o', '--output', help='write the results to this JSON file')
+
+    compare_command = commands.add_parser('compare', help='compare results against a baseline')
+    compare_command.add_argument('baseline', help='JSON written by run')
+    compare_command.add_argument('current', nargs='?', help='JSON written by run, the suite runs when omitted')
+    compare_command.add_argument('--threshold', type=float, default=0.1, help='relative slowdown flagged as a regression')
+
+    for command in (run_command, compare_command):
+        command.add_argument('--quick', action='store_true', help='smaller workloads and shorter rounds')
+        command.add_argument('-k', dest='selected', action='append', help='only benchmarks whose name contains this')
+        command.add_argument('--min-time', type=float, default=None, help='seconds every round lasts at least')
+        command.add_argument('--repeats', type=int, default=None, help='rounds per benchmark, the best one is kept')
+    args = arg_parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_suite(args.quick, args.selected, args.min_time, args.repeats)
+        print_results(report)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.quick, args.selected, args.min_time, args.repeats)
+        if args.selected:
+            baseline['results'] = {name: result for name, result in baseline['results'].items() if name in current['results']}
+    if baseline['meta'].get('quick') != current['meta'].get('quick'):
+        print("Warning: comparing a --quick run with a full run, workload sizes differ")
+    rows = compare(baseline, current, args.threshold)
+    print_comparison(rows)
+    regressions = [row[0] for row in rows if row[4] == 'regression']
+    if regressions:
+        print(f"{len(regressions)} regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,186 @@
+import sys
+import threading
+import weakref
+
+from library import cv2_registry
+
+# ------------------------------------- DESTINATIONS ----------------------------------------
+# cv2 functions that write their result into an optional output array, by the position of
+# that argument (the source is 0) and its keyword. A call given fewer arguments than that
+# position gets an array from the pool as its output instead of a new one. When the array
+# doesn't match the shape or type of the result cv2 allocates a new one, so a wrong guess
+# only costs the allocation it meant to save. threshold, split and the like return
+# something else than one array and aren't listed.
+
+DESTINATIONS = {
+    'cvtColor': (2, 'dst'),
+    'GaussianBlur': (3, 'dst'),
+    'blur': (2, 'dst'),
+    'medianBlur': (2, 'dst'),
+    'bilateralFilter': (4, 'dst'),
+    'boxFilter': (3, 'dst'),
+    'filter2D': (3, 'dst'),
+    'dilate': (2, 'dst'),
+    'erode': (2, 'dst'),
+    'morphologyEx': (3, 'dst'),
+    'Sobel': (4, 'dst'),
+    'Scharr': (4, 'dst'),
+    'Laplacian': (2, 'dst'),
+    'Canny': (3, 'edges'),
+    'adaptiveThreshold': (6, 'dst'),
+    'equalizeHist': (1, 'dst'),
+    'inRange': (3, 'dst'),
+    'bitwise_not': (1, 'dst'),
+    'convertScaleAbs': (1, 'dst'),
+    'LUT': (2, 'dst'),
+    'resize': (2, 'dst'),
+    'flip': (2, 'dst'),
+    'pyrDown': (1, 'dst'),
+    'pyrUp': (1, 'dst'),
+}
+
+def destination(name, fn, argc):
+    # Keyword taking the output array of fn, None when it has none or the call passes it
+    rule = DESTINATIONS.get(name)
+    if rule is None or argc > rule[0]:
+        return None
+    # Only the cv2 function itself, not a symbol table entry that shadows its name
+    return rule[1] if fn is cv2_registry.functions.get(name) else None
+
+def consumes(name, fn):
+    # True when fn is a cv2 function of DESTINATIONS: it keeps no reference to its
+    # arguments, so temporaries passed to it are dead once it returns
+    return name in DESTINATIONS and fn is cv2_registry.functions.get(name)
+
+# ------------------------------------- POOL STATS ------------------------------------------
+class PoolStats:
+    '''
+    Counters of a BufferPool. reused arrays are allocations avoided, allocated ones were
+    taken from an empty pool. recycled counts arrays given back, rejected outputs cv2
+    didn't use (shape or type guessed wrong), dropped arrays that didn't fit in the pool.
+    '''
+    fields = ('calls', 'reused', 'allocated', 'recycled', 'rejected', 'dropped')
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, 0)
+
+    def merge(self, other):
+        other_values = other if isinstance(other, dict) else other.as_dict()
+        for field in self.fields:
+            setattr(self, field, getattr(self, field) + other_values[field])
+        return self
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    def report(self):
+        return (f"buffer pool: {self.reused} allocations avoided, {self.allocated} allocated for "
+                f"{self.calls} calls, {self.recycled} arrays recycled, {self.rejected} rejected, {self.dropped} dropped")
+
+# ------------------------------------- BUFFER POOL -----------------------------------------
+class BufferPool:
+    '''
+    Free arrays keyed by (shape, dtype), handed to cv2 calls as their output array and
+    given back once nothing references them. max_bytes limits the memory held by free
+    arrays. The output shape of a call is learned the first time it runs on a given
+    input shape, key identifies the call (a pipeline stage, a call site).
+    Only temporaries go back to the pool: arrays a pooled call returned that nothing but
+    the VM stack or the stage loop holds. Storing one to a name or passing it to anything
+    else than a cv2 function of DESTINATIONS claims it and it is never recycled.
+    '''
+    MAX_SHAPES = 4096
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.free = {}
+        self.free_bytes = 0
+        self.shapes = {}
+        # Temporaries by id, an entry goes away with its array
+        self.temporaries = weakref.WeakValueDictionary()
+        self.stats = PoolStats()
+        self.lock = threading.Lock()
+
+    def take(self, shape, dtype):
+        with self.lock:
+            arrays = self.free.get((shape, dtype))
+            if arrays:
+                array = arrays.pop()
+                self.free_bytes -= array.nbytes
+                self.stats.reused += 1
+                return array
+            self.stats.allocated += 1
+        return sys.modules['numpy'].empty(shape, dtype)
+
+    def give(self, array):
+        # Only plain writable arrays owning their memory, a view would keep its base alive
+        if array.base is not None or not array.flags.writeable or not array.flags.c_contiguous:
+            return False
+        with self.lock:
+            if self.free_bytes + array.nbytes > self.max_bytes:
+                self.stats.dropped += 1
+                return False
+            self.free.setdefault((array.shape, array.dtype.str), []).append(array)
+            self.free_bytes += array.nbytes
+            self.stats.recycled += 1
+        return True
+
+    def claim(self, value):
+        # value is held by a name or by code the pool knows nothing about from now on
+        if self.temporaries:
+            with self.lock:
+                if self.temporaries.get(id(value)) is value:
+                    del self.temporaries[id(value)]
+
+    def recycle(self, value):
+        '''
+        Gives value back when it is a temporary: its holder (the VM, the stage loop, a
+        batch job) is done with it and nothing else got it.
+        '''
+        with self.lock:
+            if self.temporaries.get(id(value)) is not value:
+                return
+            del self.temporaries[id(value)]
+        self.give(value)
+
+    def call(self, key, name, fn, args):
+        # fn(*args) with an output array from the pool when fn takes one, the result is
+        # a temporary until it is claimed
+        keyword = destination(name, fn, len(args))
+        numpy = sys.modules.get('numpy')
+        if keyword is None or numpy is None or type(args[0]) is not numpy.ndarray:
+            return fn(*args)
+        source = args[0]
+        signature = (key, source.shape, source.dtype.str)
+        # Strips run the same pooled pipeline on several threads, counters and the learned
+        # shapes change under the lock, the cv2 call runs outside it
+        with self.lock:
+            self.stats.calls += 1
+            output = self.shapes.get(signature)
+        if output is None:
+            result = fn(*args)
+        else:
+            dst = self.take(*output)
+            result = fn(*args, **{keyword: dst})
+            if result is not dst:
+                with self.lock:
+                    self.stats.rejected += 1
+                self.give(dst)
+            del dst
+        if type(result) is numpy.ndarray:
+            with self.lock:
+                if len(self.shapes) >= self.MAX_SHAPES:
+                    self.shapes.clear()
+                self.shapes[signature] = (result.shape, result.dtype.str)
+                self.temporaries[id(result)] = result
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.free.clear()
+            self.free_bytes = 0
+            self.shapes.clear()
+            self.temporaries.clear()
+
+    def report(self):
+        return self.stats.report()
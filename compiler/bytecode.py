@@ -0,0 +1,623 @@
+import bisect
+import operator
+import sys
+from library import resolve_function, cv2_registry
+from ast_nodes import Const, Str, Name, Assign, Group, BinOp, Compare, BoolOp, If, Ternary, Call, Flow, Block
+from pipeline import build_pipeline
+import elementwise
+from memo import is_pure
+from buffers import consumes
+
+# ------------------------------------- OPCODES ---------------------------------------------
+LOAD_CONST = 0
+LOAD_NAME = 1
+STORE_NAME = 2
+BINARY_OP = 3
+COMPARE_OP = 4
+LOGICAL_OP = 5
+SELECT = 6
+CALL = 7
+BUILD_PIPELINE = 8
+RUN_PIPELINE = 9
+JUMP = 10
+POP_JUMP_IF_FALSE = 11
+POP_JUMP_IF_TRUE = 12
+TO_BOOL = 13
+POP_TOP = 14
+ELEMENTWISE = 15
+
+OPNAMES = ['LOAD_CONST', 'LOAD_NAME', 'STORE_NAME', 'BINARY_OP', 'COMPARE_OP', 'LOGICAL_OP', 'SELECT', 'CALL',
+           'BUILD_PIPELINE', 'RUN_PIPELINE', 'JUMP', 'POP_JUMP_IF_FALSE', 'POP_JUMP_IF_TRUE', 'TO_BOOL',
+           'POP_TOP', 'ELEMENTWISE']
+
+# Operand tables, the argument of BINARY_OP / COMPARE_OP / LOGICAL_OP indexes these lists
+BINARY_TYPES = ['PLUS', 'MINUS', 'TIMES', 'DIVIDE', 'POWER']
+BINARY_FUNCTIONS = [operator.add, operator.sub, operator.mul, operator.truediv, pow]
+
+COMPARE_TYPES = ['GT', 'LT', 'GE', 'LE', 'EQ', 'NE']
+COMPARE_FUNCTIONS = [operator.gt, operator.lt, operator.ge, operator.le, operator.eq, operator.ne]
+
+LOGICAL_TYPES = ['AND', 'OR']
+LOGICAL_FUNCTIONS = [
+    lambda a, b: True if a and b else False,
+    lambda a, b: True if a or b else False,
+]
+
+# Placeholder in a call site whose cv2 function hasn't been looked up yet
+UNBOUND = object()
+
+# ------------------------------------- PROGRAM ---------------------------------------------
+class Program:
+    '''
+    Flat instruction sequence produced by compile_tree.
+    code holds pairs (opcode, argument), consts and names are the pools the arguments
+    point to, calls holds one [function_name, argc, bound_function, lineno] entry per call
+    site and flows one list of (function_name, argc) stages per pipeline.
+    line_starts / line_numbers is the line table: the code of the statement on line
+    line_numbers[i] starts at line_starts[i]. Jump arguments are absolute positions in code.
+    When lazy is set IF, TERNARY, AND and OR only evaluate the branch or operand they need.
+    With fusion + - * / subtrees over names and numbers start with an ELEMENTWISE guard,
+    fused holds their [leaves, postfix, end, names] recipes (see elementwise.py).
+    '''
+    __slots__ = ('code', 'consts', 'names', 'calls', 'flows', 'fused', 'const_index', 'name_index', 'line_starts',
+                 'line_numbers', 'lazy', 'fusion_roots')
+
+    def __init__(self, lazy=True):
+        self.lazy = lazy
+        self.fused = []
+        self.fusion_roots = ()
+        self.code = []
+        self.consts = []
+        self.names = []
+        self.calls = []
+        self.flows = []
+        self.const_index = {}
+        self.name_index = {}
+        self.line_starts = []
+        self.line_numbers = []
+
+    def emit(self, opcode, arg=0):
+        self.code.append(opcode)
+        self.code.append(arg)
+        return len(self.code) - 2
+
+    def patch(self, position, target=None):
+        # Points the jump emitted at position to target, the current end of code by default
+        self.code[position + 1] = len(self.code) if target is None else target
+
+    def add_const(self, value):
+        # Keyed by type as well so 1, 1.0 and True stay different entries
+        key = (type(value), value)
+        if key not in self.const_index:
+            self.const_index[key] = len(self.consts)
+            self.consts.append(value)
+        return self.const_index[key]
+
+    def add_name(self, name):
+        if name not in self.name_index:
+            self.name_index[name] = len(self.names)
+            self.names.append(name)
+        return self.name_index[name]
+
+    def __getstate__(self):
+        # Bound functions are not stored, a loaded program binds its call sites again
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['calls'] = [(name, argc, lineno) for name, argc, _, lineno in self.calls]
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+        self.calls = [[name, argc, UNBOUND, lineno] for name, argc, lineno in state['calls']]
+
+    def mark_line(self, lineno):
+        # The code emitted from now on belongs to line lineno
+        position = len(self.code)
+        if self.line_starts and self.line_starts[-1] == position:
+            self.line_numbers[-1] = lineno
+        elif not self.line_numbers or self.line_numbers[-1] != lineno:
+            self.line_starts.append(position)
+            self.line_numbers.append(lineno)
+
+    def line_at(self, position):
+        index = bisect.bisect_right(self.line_starts, position) - 1
+        return self.line_numbers[index] if index >= 0 else None
+
+    def add_call(self, name, argc, bound=UNBOUND, lineno=0):
+        self.calls.append([name, argc, bound, lineno])
+        return len(self.calls) - 1
+
+    def add_flow(self, stages):
+        self.flows.append(stages)
+        return len(self.flows) - 1
+
+    def disassemble(self):
+        # Columns: source line (where a statement starts), instruction index, opcode, detail
+        starts = dict(zip(self.line_starts, self.line_numbers))
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op == LOAD_CONST:
+                detail = repr(self.consts[arg])
+            elif op in (LOAD_NAME, STORE_NAME):
+                detail = self.names[arg]
+            elif op == BINARY_OP:
+                detail = BINARY_TYPES[arg]
+            elif op == COMPARE_OP:
+                detail = COMPARE_TYPES[arg]
+            elif op == LOGICAL_OP:
+                detail = LOGICAL_TYPES[arg]
+            elif op == CALL:
+                detail = f'{self.calls[arg][0]}/{self.calls[arg][1]}'
+            elif op in (JUMP, POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE):
+                detail = f'-> {arg // 2}'
+            elif op == BUILD_PIPELINE:
+                detail = ' -> '.join(f'{name}/{argc}' for name, argc in self.flows[arg])
+            elif op == ELEMENTWISE:
+                detail = f'{len(self.fused[arg][0])} leaves, else -> {self.fused[arg][2] // 2}'
+            else:
+                detail = ''
+            lines.append(f'{starts.get(pc, ""):>4} {pc // 2:4d} {OPNAMES[op]:<12} {detail}')
+        return '\n'.join(lines)
+
+# ------------------------------------- COMPILER --------------------------------------------
+# The compiler never recurses: work is a stack holding AST nodes still to compile and
+# (function, arguments) tuples to run on the program once the items scheduled before
+# them are done. Arbitrarily deep trees only grow that list, never the Python call stack.
+# With spans every compiled node adds (node_type, first_position, end_position), the code a
+# node and its children compiled to is always one contiguous range.
+def compile_tree(node, lazy=True, spans=None, fuse=True):
+    program = Program(lazy)
+    if fuse:
+        program.fusion_roots = fusion_roots(node)
+    program.mark_line(node.lineno)
+    work = [node]
+    while work:
+        item = work.pop()
+        if type(item) is tuple:
+            item[0](program, *item[1:])
+        else:
+            if spans is not None:
+                work.append((close_span, spans, item.type, len(program.code)))
+            COMPILERS[type(item)](program, item, work)
+    program.fusion_roots = ()
+    return program
+
+def close_span(program, spans, node_type, start):
+    spans.append((node_type, start, len(program.code)))
+
+def schedule(work, *items):
+    # Items run in the given order
+    work.extend(reversed(items))
+
+def emit(program, opcode, arg=0):
+    program.emit(opcode, arg)
+
+def emit_jump(program, labels, label, opcode):
+    labels[label] = program.emit(opcode)
+
+def patch_jump(program, labels, label):
+    program.patch(labels[label])
+
+def compile_const(program, node, work):
+    program.emit(LOAD_CONST, program.add_const(node.value))
+
+def compile_name(program, node, work):
+    program.emit(LOAD_NAME, program.add_name(node.name))
+
+def compile_assign(program, node, work):
+    schedule(work, node.value, (emit, STORE_NAME, program.add_name(node.name)))
+
+def compile_group(program, node, work):
+    work.append(node.expr)
+
+def compile_binop(program, node, work):
+    if id(node) in program.fusion_roots:
+        compile_elementwise(program, *elementwise_recipe(node))
+        return
+    schedule(work, node.left, node.right, (emit, BINARY_OP, BINARY_TYPES.index(node.op)))
+
+# + - * / are fused, ^ is left out: NumPy powers of images overflow in surprising ways
+ELEMENTWISE_TYPES = BINARY_TYPES[:4]
+
+def fusion_roots(node):
+    '''
+    Ids of the largest + - * / subtrees with two operators or more whose leaves are names
+    and numbers, at least one of them a name. A single operator has no temporaries to
+    save. Worked out for the whole tree in one pass, children first.
+    '''
+    order = []
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        order.append(current)
+        pending.extend(current.children())
+
+    # (only names and numbers below, at least one name below, operators below)
+    state = {}
+    for current in reversed(order):
+        kind = type(current)
+        if kind is Name:
+            state[id(current)] = (True, True, 0)
+        elif kind is Const:
+            state[id(current)] = (True, False, 0)
+        elif kind is Group:
+            state[id(current)] = state[id(current.expr)]
+        elif kind is BinOp and current.op in ELEMENTWISE_TYPES:
+            left = state[id(current.left)]
+            right = state[id(current.right)]
+            state[id(current)] = (left[0] and right[0], left[1] or right[1], left[2] + right[2] + 1)
+        else:
+            state[id(current)] = (False, False, 0)
+
+    roots = set()
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        fusable, has_name, operators = state[id(current)]
+        if type(current) is BinOp and fusable and has_name and operators >= 2:
+            roots.add(id(current))
+        else:
+            pending.extend(current.children())
+    return roots
+
+def elementwise_recipe(node):
+    # (leaves, postfix) of a fusion root, leaves holds (is_name, name_or_value) pairs
+    leaves = []
+    postfix = []
+    pending = [(node, False)]
+    while pending:
+        current, expanded = pending.pop()
+        if type(current) is Group:
+            pending.append((current.expr, False))
+        elif type(current) is BinOp and current.op in ELEMENTWISE_TYPES:
+            if expanded:
+                postfix.append(-1 - BINARY_TYPES.index(current.op))
+            else:
+                pending.append((current, True))
+                pending.append((current.right, False))
+                pending.append((current.left, False))
+        elif type(current) is Name:
+            postfix.append(len(leaves))
+            leaves.append((True, current.name))
+        else:
+            postfix.append(len(leaves))
+            leaves.append((False, current.value))
+    return leaves, postfix
+
+def compile_elementwise(program, leaves, postfix):
+    # The guard takes the place of the load of the first leaf, the rest of the subtree
+    # follows as regular instructions for scalar operands
+    names = tuple(dict.fromkeys(value for is_name, value in leaves if is_name))
+    recipe = [leaves, postfix, 0, names]
+    program.fused.append(recipe)
+    program.emit(ELEMENTWISE, len(program.fused) - 1)
+    for item in postfix[1:]:
+        if item < 0:
+            program.emit(BINARY_OP, -1 - item)
+        elif leaves[item][0]:
+            program.emit(LOAD_NAME, program.add_name(leaves[item][1]))
+        else:
+            program.emit(LOAD_CONST, program.add_const(leaves[item][1]))
+    recipe[2] = len(program.code)
+
+def compile_compare(program, node, work):
+    schedule(work, node.left, node.right, (emit, COMPARE_OP, COMPARE_TYPES.index(node.op)))
+
+def compile_boolop(program, node, work):
+    if not program.lazy:
+        schedule(work, node.left, node.right, (emit, LOGICAL_OP, LOGICAL_TYPES.index(node.op)))
+        return
+
+    # left, jump to the short circuit result if it decides, else right converted to bool
+    labels = [0, 0]
+    schedule(work,
+             node.left,
+             (emit_jump, labels, 0, POP_JUMP_IF_FALSE if node.op == 'AND' else POP_JUMP_IF_TRUE),
+             node.right,
+             (emit, TO_BOOL),
+             (emit_jump, labels, 1, JUMP),
+             (patch_jump, labels, 0),
+             (emit, LOAD_CONST, program.add_const(node.op == 'OR')),
+             (patch_jump, labels, 1))
+
+def compile_if(program, node, work):
+    if not program.lazy:
+        schedule(work, node.cond, node.then, node.orelse, (emit, SELECT))
+        return
+
+    labels = [0, 0]
+    schedule(work,
+             node.cond,
+             (emit_jump, labels, 0, POP_JUMP_IF_FALSE),
+             node.then,
+             (emit_jump, labels, 1, JUMP),
+             (patch_jump, labels, 0),
+             node.orelse,
+             (patch_jump, labels, 1))
+
+def compile_call(program, node, work):
+    schedule(work, *node.args, (emit, CALL, program.add_call(node.name, len(node.args), lineno=node.lineno)))
+
+def compile_flow(program, node, work):
+    # Stage arguments are evaluated once, when the pipeline is built
+    args = [arg for stage in node.stages for arg in stage.args]
+    stages = [(stage.name, len(stage.args)) for stage in node.stages]
+    schedule(work, *args, (emit, BUILD_PIPELINE, program.add_flow(stages)), node.source, (emit, RUN_PIPELINE))
+
+def compile_block(program, node, work):
+    # Every statement but the last drops its value, each one gets a line table entry
+    items = []
+    for statement in node.statements:
+        if items:
+            items.append((emit, POP_TOP))
+        items.append((mark_line, statement.lineno))
+        items.append(statement)
+    schedule(work, *items)
+
+def mark_line(program, lineno):
+    program.mark_line(lineno)
+
+COMPILERS = {
+    Const: compile_const,
+    Str: compile_const,
+    Name: compile_name,
+    Assign: compile_assign,
+    Group: compile_group,
+    BinOp: compile_binop,
+    Compare: compile_compare,
+    BoolOp: compile_boolop,
+    If: compile_if,
+    Ternary: compile_if,
+    Call: compile_call,
+    Flow: compile_flow,
+    Block: compile_block,
+}
+
+# ------------------------------------- FUNCTION CALLS --------------------------------------
+def call_function(symbol_table, v, args):
+    fn = resolve_function(symbol_table, v)
+    if fn is None:
+        return "Error"
+
+    try:
+        return fn(*args)
+    except Exception as e:
+        print(f"Error calling function {v} "  , e)
+        return "Error"
+
+# ------------------------------------- VIRTUAL MACHINE -------------------------------------
+def op_load_const(vm, stack, arg, program):
+    stack.append(program.consts[arg])
+
+def op_load_name(vm, stack, arg, program):
+    stack.append(vm.symbol_table[program.names[arg]])
+
+def op_store_name(vm, stack, arg, program):
+    vm.symbol_table[program.names[arg]] = stack[-1]
+
+# With a BufferPool a named value is never a temporary, whether the script named it or
+# the caller put it in the symbol table
+def op_load_name_pooled(vm, stack, arg, program):
+    value = vm.symbol_table[program.names[arg]]
+    vm.pool.claim(value)
+    stack.append(value)
+
+def op_store_name_pooled(vm, stack, arg, program):
+    vm.pool.claim(stack[-1])
+    vm.symbol_table[program.names[arg]] = stack[-1]
+
+def op_binary(vm, stack, arg, program):
+    b = stack.pop()
+    stack[-1] = BINARY_FUNCTIONS[arg](stack[-1], b)
+
+def op_binary_saturate(vm, stack, arg, program):
+    # A single + - * / outside of a fused subtree, with images it saturates as well
+    b = stack.pop()
+    a = stack[-1]
+    if arg < len(ELEMENTWISE_TYPES) and 'numpy' in sys.modules:
+        ndarray = sys.modules['numpy'].ndarray
+        if isinstance(a, ndarray) or isinstance(b, ndarray):
+            result = elementwise.evaluate([0, 1, -1 - arg], [a, b], True)
+            if result is not None:
+                stack[-1] = result
+                return
+    stack[-1] = BINARY_FUNCTIONS[arg](a, b)
+
+def op_compare(vm, stack, arg, program):
+    b = stack.pop()
+    stack[-1] = COMPARE_FUNCTIONS[arg](stack[-1], b)
+
+def op_logical(vm, stack, arg, program):
+    b = stack.pop()
+    stack[-1] = LOGICAL_FUNCTIONS[arg](stack[-1], b)
+
+def op_select(vm, stack, arg, program):
+    false_value = stack.pop()
+    true_value = stack.pop()
+    stack[-1] = true_value if stack[-1] else false_value
+
+def op_call(vm, stack, arg, program):
+    site = program.calls[arg]
+    name, argc, bound, lineno = site
+    if argc:
+        args = stack[-argc:]
+        del stack[-argc:]
+    else:
+        args = []
+
+    fn = vm.symbol_table.get(name, bound)
+    if fn is UNBOUND:
+        # cv2 functions are resolved the first time the call site runs without a symbol
+        # table entry and stay bound to it, so compiling never has to import cv2
+        fn = site[2] = cv2_registry.lookup_callable(name)
+    if fn is None or not callable(fn):
+        # Unknown or non callable names go through the regular lookup for its error messages
+        if vm.pool is not None:
+            for value in args:
+                vm.pool.claim(value)
+        stack.append(call_function(vm.symbol_table, name, args))
+        return
+    if vm.pool is not None:
+        op_call_pooled(vm, stack, site, fn, args)
+        return
+    try:
+        if vm.memo is not None and is_pure(name, fn):
+            stack.append(vm.memo.call(fn, args))
+        else:
+            stack.append(fn(*args))
+    except Exception as e:
+        print(f"Error calling function {name} on line {lineno} "  , e)
+        stack.append("Error")
+
+def op_call_pooled(vm, stack, site, fn, args):
+    # The rest of op_call with a BufferPool. Temporaries among the arguments, like the
+    # result of a nested call, go back to the pool once a cv2 function consumed them,
+    # any other callee may keep them and claims them
+    name, argc, bound, lineno = site
+    pool = vm.pool
+    memoized = vm.memo is not None and is_pure(name, fn)
+    consumed = not memoized and consumes(name, fn)
+    if not consumed:
+        for value in args:
+            pool.claim(value)
+    try:
+        if memoized:
+            result = vm.memo.call(fn, args)
+        else:
+            result = pool.call(id(site), name, fn, args)
+    except Exception as e:
+        print(f"Error calling function {name} on line {lineno} "  , e)
+        stack.append("Error")
+        return
+    stack.append(result)
+    if consumed:
+        for value in args:
+            if value is not result:
+                pool.recycle(value)
+
+def op_build_pipeline(vm, stack, arg, program):
+    specs = []
+    for name, argc in reversed(program.flows[arg]):
+        if argc:
+            args = stack[-argc:]
+            del stack[-argc:]
+        else:
+            args = []
+        if vm.pool is not None:
+            # Held by the stage from now on
+            for value in args:
+                vm.pool.claim(value)
+        specs.append((name, args))
+    specs.reverse()
+    stack.append(build_pipeline(vm.symbol_table, specs, vm.pool))
+
+def op_run_pipeline(vm, stack, arg, program):
+    image = stack.pop()
+    pipeline = stack[-1]
+    if vm.pool is not None:
+        # image leaves the stack, a stage may keep it
+        vm.pool.claim(image)
+    stack[-1] = pipeline(image) if callable(pipeline) else pipeline
+
+# Jump handlers return the next position, every other handler returns None
+def op_jump(vm, stack, arg, program):
+    return arg
+
+def op_pop_jump_if_false(vm, stack, arg, program):
+    if not stack.pop():
+        return arg
+
+def op_pop_jump_if_true(vm, stack, arg, program):
+    if stack.pop():
+        return arg
+
+def op_to_bool(vm, stack, arg, program):
+    stack[-1] = True if stack[-1] else False
+
+def op_pop_top(vm, stack, arg, program):
+    stack.pop()
+
+# Names bound to these never hold an array, checking them first keeps the guard cheap
+SCALAR_TYPES = frozenset([int, float, bool, str])
+
+def op_elementwise(vm, stack, arg, program):
+    # Unless a leaf is an array it loads the first leaf and falls through to the regular
+    # instructions
+    recipe = program.fused[arg]
+    table = vm.symbol_table
+    for name in recipe[3]:
+        if type(table.get(name)) not in SCALAR_TYPES:
+            result = fused_result(vm, recipe[0], recipe[1], table)
+            if result is not None:
+                stack.append(result)
+                return recipe[2]
+            break
+    is_name, value = recipe[0][0]
+    stack.append(table[value] if is_name else value)
+
+def fused_result(vm, leaves, postfix, table):
+    # No array can exist before numpy is imported
+    numpy = sys.modules.get('numpy')
+    if numpy is None:
+        return None
+    values = []
+    for is_name, value in leaves:
+        if is_name:
+            if value not in table:
+                return None
+            value = table[value]
+        values.append(value)
+    if not any(isinstance(value, numpy.ndarray) for value in values):
+        return None
+    return elementwise.evaluate(postfix, values, vm.saturate)
+
+DISPATCH = [op_load_const, op_load_name, op_store_name, op_binary, op_compare, op_logical, op_select, op_call,
+            op_build_pipeline, op_run_pipeline, op_jump, op_pop_jump_if_false, op_pop_jump_if_true, op_to_bool,
+            op_pop_top, op_elementwise]
+
+SATURATE_DISPATCH = list(DISPATCH)
+SATURATE_DISPATCH[BINARY_OP] = op_binary_saturate
+
+ARITHMETIC_MODES = ('wrap', 'saturate')
+
+class VM:
+    '''
+    Stack machine that runs a Program against a symbol table.
+    Every opcode is an index into DISPATCH, so executing an instruction is a list lookup
+    instead of a chain of string comparisons.
+    When an instruction raises, the exception propagates and error_line is the source
+    line of the statement that was running. arithmetic is 'wrap' (NumPy semantics) or
+    'saturate' (OpenCV semantics) for + - * / on images, saturate runs with its own
+    dispatch table so wrap pays nothing for it. With a memo (MemoCache) calls to pure
+    functions reuse earlier results, with a pool (BufferPool) cv2 calls write into
+    recycled arrays.
+    '''
+    def __init__(self, symbol_table, arithmetic='wrap', memo=None, pool=None):
+        if arithmetic not in ARITHMETIC_MODES:
+            raise ValueError(f"arithmetic must be one of {ARITHMETIC_MODES}, got {arithmetic!r}")
+        self.symbol_table = symbol_table
+        self.saturate = arithmetic == 'saturate'
+        self.dispatch = SATURATE_DISPATCH if self.saturate else DISPATCH
+        self.memo = memo
+        self.pool = pool
+        if pool is not None:
+            self.dispatch = list(self.dispatch)
+            self.dispatch[LOAD_NAME] = op_load_name_pooled
+            self.dispatch[STORE_NAME] = op_store_name_pooled
+        self.error_line = None
+
+    def run(self, program):
+        code = program.code
+        dispatch = self.dispatch
+        stack = []
+        pc = 0
+        end = len(code)
+        try:
+            while pc < end:
+                jump = dispatch[code[pc]](self, stack, code[pc + 1], program)
+                pc = pc + 2 if jump is None else jump
+        except Exception:
+            self.error_line = program.line_at(pc)
+            raise
+        return stack[-1] if stack else None
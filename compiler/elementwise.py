@@ -0,0 +1,115 @@
+import operator
+from library import np, cv2
+
+# ------------------------------------- FUSED ELEMENTWISE -----------------------------------
+# Arithmetic subtrees (+ - * /, two operators or more) whose leaves are names and numbers compile to a recipe:
+# postfix lists the leaf indices (>= 0) and operators (-1 - index into OPERATORS) in
+# evaluation order. When a leaf is an image the whole subtree is evaluated here in one
+# pass over blocks of rows, so the temporaries are block sized and the only full size
+# allocation is the result, instead of one full size temporary per operator.
+#
+#   wrap      the NumPy result of the unfused expression, bit for bit (uint8 + uint8 wraps)
+#   saturate  a single operator comes here too (see op_binary_saturate), integer images are computed in float64, rounded half to even and clipped to
+#             the range of their dtype like OpenCV arithmetic, a division by zero gives 0
+
+OPERATORS = [operator.add, operator.sub, operator.mul, operator.truediv]
+UFUNCS = ['add', 'subtract', 'multiply', 'divide']
+ADD, SUBTRACT, MULTIPLY, DIVIDE = -1, -2, -3, -4
+
+# Elements per block, small enough for the temporaries to stay in cache
+BLOCK_ELEMENTS = 1 << 16
+
+def evaluate(postfix, values, saturate=False):
+    '''
+    Returns the value of the recipe for the given leaf values, or None when it can't
+    be fused (non numeric arrays) and the regular instructions have to run.
+    '''
+    arrays = [value for value in values if isinstance(value, np.ndarray)]
+    if any(array.dtype.kind not in 'biuf' for array in arrays):
+        return None
+    if saturate and all(array.dtype.kind in 'iu' for array in arrays):
+        dtype = np.result_type(*arrays)
+        result = opencv_arithmetic(postfix, values, arrays, dtype)
+        if result is not None:
+            return result
+        return blocked(postfix, values, arrays, dtype)
+    return blocked(postfix, values, arrays, None)
+
+def opencv_arithmetic(postfix, values, arrays, dtype):
+    # a + b and a - b of two images of the same shape and type are one saturating cv2 call
+    if len(postfix) != 3 or len(arrays) != 2 or postfix[2] not in (ADD, SUBTRACT):
+        return None
+    left, right = values[postfix[0]], values[postfix[1]]
+    if left.shape != right.shape or left.dtype != right.dtype or dtype.name not in ('uint8', 'uint16', 'int16'):
+        return None
+    try:
+        return cv2.add(left, right) if postfix[2] == ADD else cv2.subtract(left, right)
+    except cv2.error:
+        return None
+
+def blocked(postfix, values, arrays, saturate_dtype):
+    shape = arrays[0].shape
+    if arrays[0].ndim == 0 or shape[0] == 0 or any(array.shape != shape for array in arrays):
+        # Leaves that broadcast against each other are evaluated as a single block
+        return finish(run(postfix, values, saturate_dtype), saturate_dtype, cast=True)
+
+    step = max(1, BLOCK_ELEMENTS // max(1, arrays[0][0].size))
+    out = None
+    for start in range(0, shape[0], step):
+        rows = slice(start, start + step)
+        block_values = [value[rows] if isinstance(value, np.ndarray) else value for value in values]
+        block = finish(run(postfix, block_values, saturate_dtype), saturate_dtype)
+        if out is None:
+            out = np.empty(shape[:1] + block.shape[1:], dtype=saturate_dtype or block.dtype)
+        out[rows] = block
+    return out
+
+def run(postfix, values, saturate_dtype):
+    '''
+    Evaluates the recipe on one block. In saturate mode operators compute in float64 and
+    write into a temporary one of their operands already owns when there is one.
+    '''
+    if saturate_dtype is None:
+        stack = []
+        for item in postfix:
+            if item >= 0:
+                stack.append(values[item])
+            else:
+                right = stack.pop()
+                stack[-1] = OPERATORS[-1 - item](stack[-1], right)
+        return stack[-1]
+
+    # Stack entries are (value, owned), owned values are float64 temporaries of this block
+    stack = []
+    for item in postfix:
+        if item >= 0:
+            stack.append((values[item], False))
+            continue
+        right, right_owned = stack.pop()
+        left, left_owned = stack.pop()
+        shape = np.broadcast_shapes(np.shape(left), np.shape(right))
+        out = None
+        if left_owned and left.shape == shape:
+            out = left
+        elif right_owned and right.shape == shape:
+            out = right
+        # Like cv2.divide, x / 0 is 0
+        zeros = right == 0 if item == DIVIDE else None
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            out = getattr(np, UFUNCS[-1 - item])(left, right, out=out, dtype=np.float64)
+        if zeros is not None and np.any(zeros):
+            if isinstance(out, np.ndarray):
+                out[np.broadcast_to(zeros, shape)] = 0
+            else:
+                out = np.float64(0)
+        stack.append((out, isinstance(out, np.ndarray)))
+    return stack[-1][0]
+
+def finish(result, saturate_dtype, cast=False):
+    # Rounds and clips a float64 saturate result in place, wrap results are left untouched
+    if saturate_dtype is None:
+        return result
+    info = np.iinfo(saturate_dtype)
+    np.rint(result, out=result)
+    np.clip(result, info.min, info.max, out=result)
+    return result.astype(saturate_dtype) if cast else result
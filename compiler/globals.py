@@ -1,5 +0,0 @@
-import networkx as nx
-
-# --------------------- GLOBAL VARIBLES -------------------------------
-NODE_COUNTER = 0
-parseGraph = nx.Graph()
@@ -0,0 +1,144 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from library import load_image, save_image
+
+# ------------------------------------- I/O METRICS -----------------------------------------
+class IOStats:
+    '''
+    Counters shared by ImageReader and ImageWriter.
+    read depth is how many prefetched images were already decoded when the consumer asked
+    for the next one (always 0 means reads are the bottleneck, always the read-ahead size
+    means the queue could be smaller). write depth is how many writes were still pending
+    when a new one was queued. Stall times are seconds the consumer spent blocked.
+    '''
+    fields = ('reads', 'writes', 'read_stall', 'write_stall', 'read_depth_total', 'read_depth_max',
+              'write_depth_total', 'write_depth_max')
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, 0)
+
+    def merge(self, other):
+        if isinstance(other, dict):
+            other_values = other
+        else:
+            other_values = other.as_dict()
+        for field in self.fields:
+            if field.endswith('_max'):
+                setattr(self, field, max(getattr(self, field), other_values[field]))
+            else:
+                setattr(self, field, getattr(self, field) + other_values[field])
+        return self
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    def report(self):
+        mean_read = self.read_depth_total / self.reads if self.reads else 0
+        mean_write = self.write_depth_total / self.writes if self.writes else 0
+        return (f"reads {self.reads} (stall {self.read_stall:.3f}s, ready depth mean {mean_read:.2f} max {self.read_depth_max})\n"
+                f"writes {self.writes} (stall {self.write_stall:.3f}s, pending depth mean {mean_write:.2f} max {self.write_depth_max})")
+
+# ------------------------------------- READ AHEAD ------------------------------------------
+def read_one(loader, path):
+    try:
+        return path, loader(path), None
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+
+class ImageReader:
+    '''
+    Iterates over (path, image, error) tuples in input order while up to read_ahead
+    images are being decoded on a thread pool, so image N+1 loads while N is processed.
+    '''
+    def __init__(self, paths, read_ahead=4, threads=2, stats=None, loader=load_image):
+        self.paths = list(paths)
+        self.read_ahead = max(1, read_ahead)
+        self.stats = stats if stats is not None else IOStats()
+        self.loader = loader
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def __iter__(self):
+        pending = deque()
+        remaining = iter(self.paths)
+        for path in remaining:
+            pending.append(self.executor.submit(read_one, self.loader, path))
+            if len(pending) >= self.read_ahead:
+                break
+
+        stats = self.stats
+        while pending:
+            ready = sum(1 for f in pending if f.done())
+            stats.read_depth_total += ready
+            stats.read_depth_max = max(stats.read_depth_max, ready)
+
+            future = pending.popleft()
+            if not future.done():
+                start = time.perf_counter()
+                item = future.result()
+                stats.read_stall += time.perf_counter() - start
+            else:
+                item = future.result()
+            stats.reads += 1
+
+            path = next(remaining, None)
+            if path is not None:
+                pending.append(self.executor.submit(read_one, self.loader, path))
+            yield item
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ------------------------------------- WRITE BEHIND ----------------------------------------
+class ImageWriter:
+    '''
+    Queues image writes on a thread pool so encoding image N-1 overlaps with processing
+    image N. write blocks only when write_behind writes are already pending.
+    Every write returns a future with the save_image result.
+    '''
+    def __init__(self, write_behind=4, threads=2, stats=None, saver=save_image):
+        self.write_behind = max(1, write_behind)
+        self.stats = stats if stats is not None else IOStats()
+        self.saver = saver
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+
+    def write(self, path, image):
+        stats = self.stats
+        while self.pending and self.pending[0].done():
+            self.pending.popleft()
+        if len(self.pending) >= self.write_behind:
+            start = time.perf_counter()
+            self.pending.popleft().exception()
+            stats.write_stall += time.perf_counter() - start
+
+        depth = len(self.pending)
+        stats.write_depth_total += depth
+        stats.write_depth_max = max(stats.write_depth_max, depth)
+        stats.writes += 1
+
+        future = self.executor.submit(self.saver, path, image)
+        self.pending.append(future)
+        return future
+
+    def flush(self):
+        while self.pending:
+            self.pending.popleft().exception()
+
+    def close(self):
+        self.flush()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
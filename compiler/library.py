@@ -1,14 +1,205 @@
-import numpy as np
-import cv2 
-import matplotlib.pyplot as plt
+import importlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+# ---------------------------------- LAZY MODULES -----------------------------------------
+class LazyModule:
+    '''
+    Stands in for a module until one of its attributes is used, then imports it.
+    numpy, cv2 and matplotlib take most of the start up time and a lot of runs
+    (plain arithmetic, batch workers still building their job) never touch them.
+    '''
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return f"<lazy module '{self.__dict__['_name']}' ({state})>"
+
+np = LazyModule('numpy')
+cv2 = LazyModule('cv2')
+plt = LazyModule('matplotlib.pyplot')
+
+# ---------------------------------- DECODED IMAGE CACHE ----------------------------------
+def read_only(image):
+    # A view that can't be made writable again, its owner is read-only too
+    if image is None:
+        return None
+    image.flags.writeable = False
+    return image.view()
+
+class ImageCache:
+    '''
+    LRU cache of decoded images keyed by resolved path and checked against the file's
+    mtime and size, so an edited file is decoded again. Every load returns a read-only
+    view, cached or not (too large, cache disabled, unreadable stat), so whether a
+    script may draw on a loaded image never depends on the cache: it draws on a
+    copy_image of it. max_bytes limits the memory held by decoded pixels, 0 disables
+    the cache.
+    '''
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def load(self, path, loader):
+        try:
+            key = os.path.realpath(path)
+            info = os.stat(key)
+            stamp = (info.st_mtime_ns, info.st_size)
+        except OSError:
+            with self.lock:
+                self.misses += 1
+            return read_only(loader(path))
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == stamp:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1].view()
+            self.misses += 1
+
+        image = loader(path)
+        if image is None or self.max_bytes <= 0 or image.nbytes > self.max_bytes:
+            return read_only(image)
+
+        image.flags.writeable = False
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1].nbytes
+            self.entries[key] = (stamp, image)
+            self.current_bytes += image.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+        return image.view()
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.entries and self.current_bytes > max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes}
+
+image_cache = ImageCache()
+
+# ---------------------------------- RAW IMAGE CONTAINER ----------------------------------
+# A .cvraw file is a 64 byte header followed by the pixels as one contiguous C ordered
+# buffer, so it can be mapped with numpy.memmap without decoding or copying.
+# Header: magic, dtype (uint8 or float32), ndim and up to three dimensions.
+RAW_EXTENSION = '.cvraw'
+RAW_MAGIC = b'CVRAW001'
+RAW_HEADER = struct.Struct('<8s8sI3Q')
+RAW_OFFSET = 64
+RAW_DTYPES = {'uint8': b'uint8', 'float32': b'float32'}
+
+def is_raw(path):
+    return path.lower().endswith(RAW_EXTENSION)
+
+def load_raw(path):
+    with open(path, 'rb') as f:
+        header = f.read(RAW_HEADER.size)
+    if len(header) < RAW_HEADER.size:
+        print(f"Error {path} is not a raw image")
+        return None
+    magic, dtype, ndim, *shape = RAW_HEADER.unpack(header)
+    if magic != RAW_MAGIC or not 2 <= ndim <= 3:
+        print(f"Error {path} is not a raw image")
+        return None
+    dtype = np.dtype(dtype.rstrip(b'\0').decode())
+    # mode 'r' maps the file read-only, processes mapping the same file share its pages
+    mapped = np.memmap(path, dtype=dtype, mode='r', offset=RAW_OFFSET, shape=tuple(shape[:ndim]))
+    return mapped.view(np.ndarray)
+
+def save_raw(filename, image):
+    image = np.ascontiguousarray(image)
+    if image.dtype.name not in RAW_DTYPES or not 2 <= image.ndim <= 3:
+        print(f"Error raw images must be 2 or 3 dimensional uint8 or float32, got {image.dtype} {image.shape}")
+        return False
+    shape = list(image.shape) + [0] * (3 - image.ndim)
+    header = RAW_HEADER.pack(RAW_MAGIC, RAW_DTYPES[image.dtype.name], image.ndim, *shape)
+    with open(filename, 'wb') as f:
+        f.write(header.ljust(RAW_OFFSET, b'\0'))
+        image.tofile(f)
+    return True
+
+def create_raw(filename, shape, dtype):
+    # Writable map of a new raw image, for outputs written a piece at a time
+    dtype = np.dtype(dtype)
+    if dtype.name not in RAW_DTYPES or not 2 <= len(shape) <= 3:
+        print(f"Error raw images must be 2 or 3 dimensional uint8 or float32, got {dtype} {tuple(shape)}")
+        return None
+    dimensions = list(shape) + [0] * (3 - len(shape))
+    header = RAW_HEADER.pack(RAW_MAGIC, RAW_DTYPES[dtype.name], len(shape), *dimensions)
+    with open(filename, 'wb') as f:
+        f.write(header.ljust(RAW_OFFSET, b'\0'))
+    return np.memmap(filename, dtype=dtype, mode='r+', offset=RAW_OFFSET, shape=tuple(shape))
+
+def convert_to_raw(path, raw_path=None):
+    path = path.strip()
+    if raw_path is None:
+        raw_path = os.path.splitext(path)[0] + RAW_EXTENSION
+    image = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+    if image is None:
+        print(f"Error unable to read {path}")
+        return None
+    if image.dtype != np.uint8 and image.dtype != np.float32:
+        image = image.astype(np.float32)
+    if not save_raw(raw_path, image):
+        return None
+    return raw_path
 
 def load_image(path):
+    # Always read-only (see ImageCache), copy_image gives an image that can be drawn on
     path = path.strip()
-    return cv2.imread(path)
+    if is_raw(path):
+        return load_raw(path)
+    return image_cache.load(path, cv2.imread)
 
 
+def copy_image(image):
+    return image.copy()
+
 def save_image(filename, image):
-    cv2.imwrite(filename, image)
+    if is_raw(filename):
+        return save_raw(filename, image)
+    return cv2.imwrite(filename, image)
 
 def show_image(img):
     cv2.imshow('window' , img)
@@ -16,17 +207,76 @@ def show_image(img):
     cv2.destroyAllWindows()
     return img
 
+# ---------------------------------- FUNCTION REGISTRY ------------------------------------
+def pure(fn):
+    # Marks fn as pure: same arguments, same result and no side effects (see memo.py)
+    fn.__pure__ = True
+    return fn
+
+class FunctionRegistry:
+    '''
+    Index of the attributes of a module (cv2 by default) filled lazily: the first lookup
+    of a name does the getattr, later lookups of the same name, found or not, are one
+    dict access. preload indexes every public callable up front.
+    '''
+    def __init__(self, module=None):
+        self.module = module
+        self.functions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, function_name):
+        functions = self.functions
+        if function_name in functions:
+            self.hits += 1
+            return functions[function_name]
+        self.misses += 1
+        module = self.module if self.module is not None else cv2
+        fn = getattr(module, function_name, None)
+        functions[function_name] = fn
+        return fn
+
+    def lookup_callable(self, function_name):
+        fn = self.lookup(function_name)
+        return fn if callable(fn) else None
+
+    def preload(self):
+        module = self.module if self.module is not None else cv2
+        for name in dir(module):
+            if not name.startswith('_') and name not in self.functions:
+                fn = getattr(module, name, None)
+                if callable(fn):
+                    self.functions[name] = fn
+        return len(self.functions)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.functions)}
+
+cv2_registry = FunctionRegistry()
+
 def search_cv2(function_name):
-    try:
-        return getattr(cv2, function_name) 
-    except:
-        return None    
-    return None
+    return cv2_registry.lookup(function_name)
+
+def resolve_function(symbol_table, function_name):
+    if function_name in symbol_table:
+        fn = symbol_table[function_name]
+    else:
+        fn = search_cv2(function_name)
+        if fn is None:
+            print(f"Error {function_name} IS NOT on symbol table ")
+            return None
+
+    if not callable(fn):
+        print(f"Error  function {function_name} IS NOT a function ")
+        return None
+    return fn
 
+@pure
 def gen_matrix(a,b,*args):
     s = np.array(args)
     return s.reshape(int(a),int(b))
 
+@pure
 def gen_vector(*args):
     s = np.array(args)
     return s
@@ -0,0 +1,152 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+from library import cv2_registry, pure
+
+# ------------------------------------- PURE FUNCTIONS --------------------------------------
+# A pure function returns the same value for the same arguments and changes nothing else,
+# so a script that repeats a call (the same cvtColor in several statements or in both
+# branches of a conditional) can reuse the first result. Symbol table callables opt in
+# with @pure (library.py), cv2 functions by name through PURE_CV2 (their attributes
+# can't be set).
+
+PURE_CV2 = frozenset([
+    'cvtColor', 'GaussianBlur', 'blur', 'medianBlur', 'bilateralFilter', 'boxFilter', 'filter2D',
+    'resize', 'flip', 'rotate', 'transpose', 'warpAffine', 'warpPerspective', 'Canny', 'Sobel',
+    'Scharr', 'Laplacian', 'threshold', 'adaptiveThreshold', 'dilate', 'erode', 'morphologyEx',
+    'equalizeHist', 'inRange', 'add', 'subtract', 'multiply', 'divide', 'addWeighted', 'absdiff',
+    'bitwise_and', 'bitwise_or', 'bitwise_xor', 'bitwise_not', 'split', 'merge', 'normalize',
+    'getStructuringElement', 'getGaussianKernel', 'getRotationMatrix2D', 'pyrDown', 'pyrUp',
+])
+
+def is_pure(name, fn):
+    if getattr(fn, '__pure__', False):
+        return True
+    # Only the cv2 function itself, not a symbol table entry that shadows its name
+    return name in PURE_CV2 and fn is cv2_registry.functions.get(name)
+
+# ------------------------------------- FINGERPRINTS ----------------------------------------
+class Uncacheable(Exception):
+    pass
+
+def fingerprint(value, pins, max_hash_bytes):
+    '''
+    Hashable key for an argument. Arrays whose whole buffer is read-only (decoded images
+    from the image cache, memoized results) are keyed by the identity of the array that
+    owns the buffer plus the view's layout, the owner is appended to pins so its id can't
+    be reused while the entry lives. Writable arrays up to max_hash_bytes are keyed by a
+    hash of their bytes, hashing a larger one costs more than most cv2 calls it would
+    save. Raises Uncacheable for values that can't be keyed.
+    '''
+    kind = type(value)
+    if kind in (int, float, bool, str, bytes) or value is None:
+        return (kind.__name__, value)
+    if kind in (tuple, list):
+        return (kind.__name__,) + tuple(fingerprint(item, pins, max_hash_bytes) for item in value)
+
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        layout = (value.dtype.str, value.shape, value.strides)
+        owner = value
+        while isinstance(owner.base, numpy.ndarray):
+            owner = owner.base
+        if not value.flags.writeable and not owner.flags.writeable and owner.base is None:
+            pins.append(owner)
+            return ('array', id(owner), value.__array_interface__['data'][0]) + layout
+        if value.dtype.hasobject or value.nbytes > max_hash_bytes:
+            raise Uncacheable()
+        digest = hashlib.blake2b(numpy.ascontiguousarray(value).data, digest_size=16).digest()
+        return ('bytes', digest) + layout
+    if numpy is not None and isinstance(value, numpy.generic):
+        return (kind.__name__, value.item())
+    raise Uncacheable()
+
+def result_size(value):
+    # Bytes a cached result holds, arrays by their buffer and everything else as small
+    if isinstance(value, (tuple, list)):
+        return sum(result_size(item) for item in value) + 64
+    return getattr(value, 'nbytes', 64)
+
+def freeze(value):
+    # Cached arrays are read-only, a cv2 call with dst can't modify what later hits return
+    if isinstance(value, (tuple, list)):
+        return type(value)(freeze(item) for item in value)
+    numpy = sys.modules.get('numpy')
+    if numpy is not None and isinstance(value, numpy.ndarray):
+        value.flags.writeable = False
+    return value
+
+# ------------------------------------- RESULT CACHE ----------------------------------------
+class MemoCache:
+    '''
+    LRU cache of pure call results keyed by function and argument fingerprints.
+    max_bytes limits the memory held by results, a result larger than that is never
+    cached. Results are stored read-only and, being read-only, later calls that take
+    them as arguments are keyed by identity without hashing any pixels. Calls with a
+    writable array larger than max_hash_bytes run without the cache.
+    '''
+    def __init__(self, max_bytes=256 * 1024 * 1024, max_hash_bytes=1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_hash_bytes = max_hash_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def call(self, fn, args):
+        pins = []
+        try:
+            key = (fn, tuple(fingerprint(arg, pins, self.max_hash_bytes) for arg in args))
+        except Uncacheable:
+            self.uncacheable += 1
+            return fn(*args)
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        result = fn(*args)
+        size = result_size(result)
+        # A function handing back one of its arguments would freeze the caller's array
+        if self.max_bytes <= 0 or size > self.max_bytes or any(result is arg for arg in args):
+            return result
+
+        result = freeze(result)
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self.entries[key] = (result, size, pins)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted
+                self.evictions += 1
+        return result
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            while self.entries and self.current_bytes > max_bytes:
+                _, (_, evicted, _) = self.entries.popitem(last=False)
+                self.current_bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'uncacheable': self.uncacheable,
+                'evictions': self.evictions, 'entries': len(self.entries), 'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes}
@@ -0,0 +1,126 @@
+import operator
+from ast_nodes import Const, Str, Name, Assign, Group, BinOp, Compare, BoolOp, If, Ternary, Call, Flow, Block
+from bytecode import BINARY_TYPES, BINARY_FUNCTIONS, COMPARE_TYPES, COMPARE_FUNCTIONS, LOGICAL_TYPES, LOGICAL_FUNCTIONS
+
+# ------------------------------------- OPTIMIZER -------------------------------------------
+# Rewrites a parse tree before it is compiled:
+#   - arithmetic, comparisons and && / || whose operands are literals are computed once
+#   - IF and TERNARY nodes with a literal condition are replaced by the selected branch
+#   - GROUP nodes are dropped, parentheses already shaped the tree
+# Folding uses the same operator functions as the VM so 4 / 2 stays 2.0 and 2 ^ 3 stays 8.
+# Untouched subtrees are shared with the input tree, changed nodes are new objects.
+
+# Results larger than this are left for run time instead of being stored in the program
+MAX_FOLDED_LENGTH = 10000
+MAX_FOLDED_EXPONENT = 1024
+
+def optimize(node):
+    # Children are optimized before their parents without recursion: reversed pre-order
+    # visits every child before the node that owns it
+    order = []
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        order.append(current)
+        pending.extend(current.children())
+
+    results = {}
+    for current in reversed(order):
+        results[id(current)] = OPTIMIZERS[type(current)](current, results)
+    return results[id(node)]
+
+def is_literal(node):
+    return type(node) is Const or type(node) is Str
+
+def literal(value, lineno):
+    if isinstance(value, str):
+        return Str(value, lineno)
+    return Const(value, lineno)
+
+def fold(function, left, right):
+    '''
+    Returns the folded literal value, or None when the operation has to stay in the
+    program (it raises, like a division by zero, or the result would be too big).
+    '''
+    if function is pow and isinstance(right.value, int) and abs(right.value) > MAX_FOLDED_EXPONENT:
+        return None
+    if function is operator.mul:
+        text, count = (left.value, right.value) if isinstance(left.value, str) else (right.value, left.value)
+        if isinstance(text, str) and isinstance(count, int) and len(text) * count > MAX_FOLDED_LENGTH:
+            return None
+    try:
+        value = function(left.value, right.value)
+    except Exception:
+        return None
+    if not isinstance(value, (bool, int, float, str)):
+        return None
+    return (value,)
+
+def optimize_leaf(node, results):
+    return node
+
+def optimize_group(node, results):
+    return results[id(node.expr)]
+
+def optimize_assign(node, results):
+    value = results[id(node.value)]
+    if value is node.value:
+        return node
+    return Assign(node.name, value, node.lineno)
+
+def optimize_operator(types, functions):
+    def optimize_binary(node, results):
+        left = results[id(node.left)]
+        right = results[id(node.right)]
+        if is_literal(left) and is_literal(right):
+            folded = fold(functions[types.index(node.op)], left, right)
+            if folded is not None:
+                return literal(folded[0], node.lineno)
+        if left is node.left and right is node.right:
+            return node
+        return type(node)(node.op, left, right, node.lineno)
+    return optimize_binary
+
+def optimize_if(node, results):
+    cond = results[id(node.cond)]
+    then = results[id(node.then)]
+    orelse = results[id(node.orelse)]
+    if is_literal(cond):
+        return then if cond.value else orelse
+    if cond is node.cond and then is node.then and orelse is node.orelse:
+        return node
+    return type(node)(cond, then, orelse, node.lineno)
+
+def optimize_call(node, results):
+    args = [results[id(a)] for a in node.args]
+    if all(a is b for a, b in zip(args, node.args)):
+        return node
+    return Call(node.name, args, node.lineno)
+
+def optimize_flow(node, results):
+    stages = [results[id(stage)] for stage in node.stages]
+    if all(a is b for a, b in zip(stages, node.stages)):
+        return node
+    return Flow(node.source, stages, node.lineno)
+
+def optimize_block(node, results):
+    statements = [results[id(statement)] for statement in node.statements]
+    if all(a is b for a, b in zip(statements, node.statements)):
+        return node
+    return Block(statements, node.lineno)
+
+OPTIMIZERS = {
+    Const: optimize_leaf,
+    Str: optimize_leaf,
+    Name: optimize_leaf,
+    Group: optimize_group,
+    Assign: optimize_assign,
+    BinOp: optimize_operator(BINARY_TYPES, BINARY_FUNCTIONS),
+    Compare: optimize_operator(COMPARE_TYPES, COMPARE_FUNCTIONS),
+    BoolOp: optimize_operator(LOGICAL_TYPES, LOGICAL_FUNCTIONS),
+    If: optimize_if,
+    Ternary: optimize_if,
+    Call: optimize_call,
+    Flow: optimize_flow,
+    Block: optimize_block,
+}
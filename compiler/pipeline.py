@@ -0,0 +1,93 @@
+import time
+
+from library import resolve_function
+from buffers import consumes
+from streams import FrameSource, FrameStream
+
+# ------------------------------------- PIPELINE --------------------------------------------
+class Pipeline:
+    '''
+    Image flow compiled from "src -> f(a) -> g(b)".
+    Every stage function is resolved once when the pipeline is built, calling the
+    pipeline threads an image through the stages, the output of each stage becomes the
+    first argument of the next one. The same pipeline can be applied to any number of images.
+    Applied to a frame source or stream it returns a FrameStream that runs lazily.
+    With a pool (BufferPool) stages write into arrays from the pool and an intermediate
+    result goes back to it once the next stage, a cv2 function, consumed it, so running
+    the pipeline over images of the same size stops allocating them.
+    '''
+    __slots__ = ('stages', 'pool')
+
+    def __init__(self, stages, pool=None):
+        # stages holds (function_name, function, extra_arguments) tuples
+        self.stages = stages
+        self.pool = pool
+
+    def __call__(self, image, on_stage=None):
+        '''
+        Runs the stages on image. on_stage(name, nanoseconds) is called after every
+        stage, failed ones included, the profiler times stages with it.
+        '''
+        if isinstance(image, (FrameSource, FrameStream)):
+            return (image if isinstance(image, FrameStream) else FrameStream(image)).then(self)
+        if self.pool is not None or on_stage is not None:
+            return self.run_stages(image, on_stage)
+        for name, fn, args in self.stages:
+            try:
+                image = fn(image, *args)
+            except Exception as e:
+                print(f"Error calling function {name} "  , e)
+                return "Error"
+        return image
+
+    def run_stages(self, image, on_stage):
+        # The loop of __call__ with the pool and the stage hook, kept out of the plain path
+        pool = self.pool
+        clock = time.perf_counter_ns
+        source = image
+        for stage in self.stages:
+            name, fn, args = stage
+            start = clock()
+            try:
+                if pool is None:
+                    result = fn(image, *args)
+                else:
+                    result = pool.call(id(stage), name, fn, (image,) + args)
+            except Exception as e:
+                if on_stage is not None:
+                    on_stage(name, clock() - start)
+                print(f"Error calling function {name} "  , e)
+                return "Error"
+            if on_stage is not None:
+                on_stage(name, clock() - start)
+            if pool is not None and image is not source and image is not result:
+                # An intermediate a cv2 stage consumed is dead, any other stage may keep it
+                if consumes(name, fn):
+                    pool.recycle(image)
+                else:
+                    pool.claim(image)
+            image = result
+        return image
+
+    def map(self, images):
+        for image in images:
+            yield self(image)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def __repr__(self):
+        return 'Pipeline(' + ' -> '.join(name for name, _, _ in self.stages) + ')'
+
+def build_pipeline(symbol_table, specs, pool=None):
+    '''
+    specs is a list of (function_name, arguments) pairs, returns "Error" when one of the
+    functions can't be resolved, like a failed function call does.
+    '''
+    stages = []
+    for name, args in specs:
+        fn = resolve_function(symbol_table, name)
+        if fn is None:
+            return "Error"
+        stages.append((name, fn, tuple(args)))
+    return Pipeline(stages, pool)
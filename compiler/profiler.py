@@ -0,0 +1,187 @@
+import json
+import time
+from contextlib import contextmanager
+
+from bytecode import VM, CALL, RUN_PIPELINE, compile_tree
+from optimizer import optimize
+from pipeline import Pipeline
+
+# ------------------------------------- PROFILER --------------------------------------------
+# Opt-in: Profiler.run goes through its own lexing, parsing and VM loop, the regular
+# Interpreter.run path and VM.run are never instrumented, so disabled costs nothing.
+#   phases     lex, parse, build (optimize + compile) and execute
+#   nodes      per node type: compiled, the nodes of that type in the program (not how
+#              many times they ran), self time of the instructions the node emitted
+#              itself and cumulative time including its children
+#   functions  per function name: calls and time, for CALL instructions and flow stages
+# Times are kept in nanoseconds and reported in milliseconds.
+
+class Profiler:
+    def __init__(self):
+        self.phases = {}
+        self.nodes = {}
+        self.functions = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] += time.perf_counter_ns() - start
+
+    def add_function(self, name, elapsed):
+        entry = self.functions.get(name)
+        if entry is None:
+            entry = self.functions[name] = [0, 0]
+        entry[0] += 1
+        entry[1] += elapsed
+
+    def run(self, interpreter, data):
+        '''
+        Lexes, parses, compiles and executes data in interpreter's session recording
+        every phase. Returns the program value, None on syntax errors (counted in
+        interpreter.lexer.syntax_errors like Interpreter.build does, an input cut short
+        included). Exceptions raised by the program propagate like in Interpreter.execute.
+        '''
+        lexer = interpreter.lexer
+        lexer.lineno = 1
+        lexer.syntax_errors = 0
+        with self.phase('lex'):
+            lexer.input(data)
+            tokens = list(iter(lexer.token, None))
+
+        remaining = iter(tokens)
+        with self.phase('parse'):
+            tree = interpreter.parser.parse(lexer=lexer, tokenfunc=lambda: next(remaining, None))
+        interpreter.count_end_error(tree, data)
+        if tree is None or lexer.syntax_errors:
+            return None
+
+        spans = []
+        with self.phase('build'):
+            if interpreter.optimize:
+                tree = optimize(tree)
+            program = compile_tree(tree, interpreter.lazy, spans, interpreter.fuse)
+
+        vm = ProfiledVM(interpreter.symbol_table, self, interpreter.arithmetic, interpreter.memo, interpreter.pool)
+        try:
+            with self.phase('execute'):
+                return vm.run(program)
+        finally:
+            self.add_nodes(spans, vm.times)
+
+    def add_nodes(self, spans, times):
+        # Spans are properly nested, sorted by start (outer first) the innermost open span
+        # owns the instruction: that is the node that emitted it
+        prefix = [0]
+        for elapsed in times:
+            prefix.append(prefix[-1] + elapsed)
+        spans = sorted(spans, key=lambda span: (span[1], -span[2]))
+
+        open_spans = []
+        covered = {}
+        index = 0
+        for position in range(len(times)):
+            while open_spans and open_spans[-1][2] <= position * 2:
+                open_spans.pop()
+            while index < len(spans) and spans[index][1] <= position * 2:
+                span = spans[index]
+                index += 1
+                if span[2] > position * 2:
+                    open_spans.append(span)
+            if open_spans:
+                self.node_entry(open_spans[-1][0])[1] += times[position]
+
+        for node_type, start, end in spans:
+            entry = self.node_entry(node_type)
+            entry[0] += 1
+            # A node nested in another of the same type is already part of its time
+            if start >= covered.get(node_type, -1):
+                entry[2] += prefix[end // 2] - prefix[start // 2]
+                covered[node_type] = end
+
+    def node_entry(self, node_type):
+        entry = self.nodes.get(node_type)
+        if entry is None:
+            entry = self.nodes[node_type] = [0, 0, 0]
+        return entry
+
+    # ------------------------------- OUTPUT ----------------------------------------------
+    def as_dict(self):
+        return {
+            'phases': {name: {'calls': calls, 'seconds': ns / 1e9} for name, (calls, ns) in self.phases.items()},
+            'nodes': {name: {'compiled': count, 'self_seconds': own / 1e9, 'cumulative_seconds': total / 1e9}
+                      for name, (count, own, total) in self.nodes.items()},
+            'functions': {name: {'calls': calls, 'seconds': ns / 1e9} for name, (calls, ns) in self.functions.items()},
+        }
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, sort_keys=True)
+
+    def report(self):
+        lines = [f"{'phase':<16}{'calls':>8}{'time (ms)':>12}"]
+        for name, (calls, ns) in self.phases.items():
+            lines.append(f"{name:<16}{calls:>8}{ns / 1e6:>12.3f}")
+
+        lines.append('')
+        lines.append(f"{'node type':<16}{'compiled':>9}{'self (ms)':>12}{'cumulative (ms)':>18}")
+        for name, (count, own, total) in sorted(self.nodes.items(), key=lambda item: -item[1][1]):
+            lines.append(f"{name:<16}{count:>9}{own / 1e6:>12.3f}{total / 1e6:>18.3f}")
+
+        if self.functions:
+            lines.append('')
+            lines.append(f"{'function':<16}{'calls':>8}{'time (ms)':>12}{'mean (us)':>12}")
+            for name, (calls, ns) in sorted(self.functions.items(), key=lambda item: -item[1][1]):
+                lines.append(f"{name:<16}{calls:>8}{ns / 1e6:>12.3f}{ns / calls / 1e3:>12.1f}")
+        return '\n'.join(lines)
+
+# ------------------------------------- PROFILED VM -----------------------------------------
+def op_run_pipeline_profiled(vm, stack, arg, program):
+    # Pipeline.__call__ itself, timing every stage as a function call
+    image = stack.pop()
+    pipeline = stack[-1]
+    if isinstance(pipeline, Pipeline):
+        stack[-1] = pipeline(image, vm.profiler.add_function)
+    else:
+        stack[-1] = pipeline(image) if callable(pipeline) else pipeline
+
+class ProfiledVM(VM):
+    '''
+    VM whose loop times every instruction, times holds the nanoseconds spent in each
+    instruction (indexed by position // 2) once run returns.
+    '''
+    def __init__(self, symbol_table, profiler, arithmetic='wrap', memo=None, pool=None):
+        super().__init__(symbol_table, arithmetic, memo, pool)
+        self.dispatch = list(self.dispatch)
+        self.dispatch[RUN_PIPELINE] = op_run_pipeline_profiled
+        self.profiler = profiler
+        self.times = []
+
+    def run(self, program):
+        code = program.code
+        calls = program.calls
+        dispatch = self.dispatch
+        add_function = self.profiler.add_function
+        clock = time.perf_counter_ns
+        times = self.times = [0] * (len(code) // 2)
+        stack = []
+        pc = 0
+        end = len(code)
+        try:
+            while pc < end:
+                op = code[pc]
+                start = clock()
+                jump = dispatch[op](self, stack, code[pc + 1], program)
+                elapsed = clock() - start
+                times[pc >> 1] += elapsed
+                if op == CALL:
+                    add_function(calls[code[pc + 1]][0], elapsed)
+                pc = pc + 2 if jump is None else jump
+        except Exception:
+            self.error_line = program.line_at(pc)
+            raise
+        return stack[-1] if stack else None
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# ------------------------------------- PROGRAM CACHE ---------------------------------------
+class ProgramCache:
+    '''
+    LRU cache of compiled programs keyed by a hash of the source text, the compiler
+    version (grammar tables plus the code that builds programs) and the compile flags.
+    With a directory, programs are also pickled there so a fresh process, a batch worker
+    for example, loads them without lexing or parsing. Entries live in one folder per
+    compiler version, a grammar change never reads an old program.
+    max_entries limits the programs kept in memory, 0 disables the memory cache.
+    '''
+    def __init__(self, max_entries=512, directory=None):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.disk_writes = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(source, version, *flags):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(version.encode())
+        digest.update(repr(flags).encode())
+        digest.update(b'\0')
+        digest.update(source.encode())
+        return version, digest.hexdigest()
+
+    def load(self, key, compiler):
+        '''
+        Returns the program cached under key, else compiler() which is stored when it
+        isn't None. Syntax errors are never cached, they are reported on every load.
+        '''
+        with self.lock:
+            program = self.entries.get(key)
+            if program is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return program
+            self.misses += 1
+
+        program = self.read(key)
+        if program is not None:
+            self.disk_hits += 1
+        else:
+            program = compiler()
+            if program is None:
+                return None
+            self.write(key, program)
+
+        if self.max_entries > 0:
+            with self.lock:
+                self.entries[key] = program
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return program
+
+    # ------------------------------- ON DISK STORE ----------------------------------------
+    def path(self, key):
+        version, digest = key
+        return os.path.join(self.directory, version, digest + '.pickle')
+
+    def read(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as f:
+                stored_key, program = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return program if stored_key == key else None
+
+    def write(self, key, program):
+        if self.directory is None:
+            return
+        path = self.path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written to a temporary name first so other processes never read half a file
+            fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((key, program), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+            self.disk_writes += 1
+        except OSError as e:
+            print(f"Error unable to store compiled program in {self.directory}: {e}")
+
+    # ------------------------------- MAINTENANCE ------------------------------------------
+    def resize(self, max_entries):
+        with self.lock:
+            self.max_entries = max_entries
+            while self.entries and len(self.entries) > max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def invalidate(self, keep_version=None):
+        '''
+        Drops every program in memory and on disk. With keep_version only the entries of
+        other compiler versions are removed, the stale ones left after a grammar change.
+        '''
+        with self.lock:
+            for key in [key for key in self.entries if key[0] != keep_version]:
+                del self.entries[key]
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        for version in os.listdir(self.directory):
+            if version != keep_version:
+                shutil.rmtree(os.path.join(self.directory, version), ignore_errors=True)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                'disk_writes': self.disk_writes, 'evictions': self.evictions, 'entries': len(self.entries),
+                'hit_rate': (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+program_cache = ProgramCache()
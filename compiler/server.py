@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from library import np, load_image, save_image
+
+# ------------------------------------- EVALUATION SERVER -----------------------------------
+# A long running process that evaluates scripts sent over a local TCP socket, so the
+# imports, the parse tables and the compiled programs are paid for once instead of per job.
+# The protocol is one JSON object per line each way, any number of requests per connection:
+#
+#   {"id": 1, "script": "gray = img -> cvtColor(6)", "images": {"img": "a.png"},
+#    "symbols": {"k": 3}, "output": "gray.png", "timeout": 5}
+#   {"id": 1, "ok": true, "result": {"shape": [480, 640], "dtype": "uint8"}, "output": "gray.png", "seconds": 0.004}
+#
+# images are loaded with load_image (through the shared decoded image cache) and bound
+# to their names, symbols are plain values, output saves an image result. Every request
+# runs in an interpreter of the pool with a fresh symbol table, nothing leaks between
+# requests. A request that runs longer than its timeout is answered with an error. One
+# still waiting for a worker never runs, a running one stops at its next step (loading
+# the images, executing, writing the output) but its script runs to the end, threads
+# can't be killed.
+
+DEFAULT_PORT = 8765
+
+def to_json(value):
+    # Script values as JSON, arrays are described by shape and dtype
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if 'numpy' in sys.modules:
+        if isinstance(value, np.ndarray):
+            return {'shape': list(value.shape), 'dtype': str(value.dtype)}
+        if isinstance(value, np.generic):
+            return value.item()
+    return repr(value)
+
+def check_request(request):
+    # Raises ValueError naming the first field of the wrong type
+    if not isinstance(request, dict):
+        raise ValueError("a request must be a JSON object")
+    for field in ('script', 'output'):
+        if request.get(field) is not None and not isinstance(request[field], str):
+            raise ValueError(f"{field} must be a string")
+    for field in ('symbols', 'images'):
+        if request.get(field) is not None and not isinstance(request[field], dict):
+            raise ValueError(f"{field} must be an object")
+    if not all(isinstance(path, str) for path in (request.get('images') or {}).values()):
+        raise ValueError("images must map names to paths")
+    timeout = request.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+        raise ValueError("timeout must be a positive number of seconds")
+
+def past(deadline):
+    return deadline is not None and time.monotonic() >= deadline
+
+class InterpreterPool:
+    '''
+    Interpreters built and warmed up front (parser copies, cv2 and numpy imported, a
+    first script compiled) handed out to one request at a time. symbols is the table
+    every request starts from, the builtins plus the options' symbols.
+    '''
+    def __init__(self, size, **options):
+        from translator import Interpreter
+
+        self.available = queue.Queue()
+        self.symbols = None
+        for _ in range(size):
+            interpreter = Interpreter(**options)
+            if self.symbols is None:
+                self.symbols = dict(interpreter.symbol_table)
+            interpreter.run('warm = gen_vector(1, 2); warm = search_cv2("cvtColor")')
+            self.available.put(interpreter)
+
+    def acquire(self):
+        return self.available.get()
+
+    def release(self, interpreter):
+        self.available.put(interpreter)
+
+class EvaluationServer:
+    '''
+    asyncio front end of an InterpreterPool: connections are served on the event loop,
+    scripts run on workers threads (cv2 releases the GIL). options go to every
+    Interpreter of the pool.
+    '''
+    def __init__(self, workers=4, timeout=30.0, host='127.0.0.1', port=DEFAULT_PORT, **options):
+        self.workers = workers
+        self.timeout = timeout
+        self.host = host
+        self.port = port
+        self.pool = InterpreterPool(workers, **options)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.server = None
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.host, self.port = self.server.sockets[0].getsockname()[:2]
+        return self.host, self.port
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    check_request(request)
+                except ValueError as e:
+                    self.requests += 1
+                    self.errors += 1
+                    response = {'ok': False, 'error': f"bad request: {e}"}
+                    if isinstance(request, dict) and 'id' in request:
+                        response['id'] = request['id']
+                else:
+                    try:
+                        response = await self.evaluate(request)
+                    except Exception as e:
+                        # Whatever fails, the client gets an answer and the connection stays
+                        self.errors += 1
+                        response = {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+                        if 'id' in request:
+                            response['id'] = request['id']
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def evaluate(self, request):
+        self.requests += 1
+        start = time.perf_counter()
+        if request.get('stats'):
+            response = {'ok': True, 'result': self.stats()}
+        else:
+            loop = asyncio.get_running_loop()
+            timeout = request.get('timeout', self.timeout)
+            future = loop.run_in_executor(self.executor, self.run_request, request, time.monotonic() + timeout)
+            try:
+                response = await asyncio.wait_for(asyncio.shield(future), timeout)
+            except asyncio.TimeoutError:
+                # Drops the request if it is still queued, a running one checks its deadline
+                future.cancel()
+                self.timeouts += 1
+                response = {'ok': False, 'error': "timeout"}
+        if not response['ok']:
+            self.errors += 1
+        response['seconds'] = time.perf_counter() - start
+        if 'id' in request:
+            response['id'] = request['id']
+        return response
+
+    def run_request(self, request, deadline=None):
+        # Runs in a worker thread with an interpreter of its own, returns before every step
+        # once deadline (a time.monotonic() value) has passed, the client got its answer
+        expired = {'ok': False, 'error': "timeout"}
+        interpreter = self.pool.acquire()
+        try:
+            interpreter.symbol_table = dict(self.pool.symbols)
+            interpreter.symbol_table.update(request.get('symbols') or {})
+            for name, path in (request.get('images') or {}).items():
+                if past(deadline):
+                    return expired
+                image = load_image(path)
+                if image is None:
+                    return {'ok': False, 'error': f"unable to read image {path}"}
+                interpreter.symbol_table[name] = image
+
+            interpreter.lexer.syntax_errors = 0
+            program = interpreter.load(request.get('script', ''))
+            if interpreter.lexer.syntax_errors:
+                return {'ok': False, 'error': f"{interpreter.lexer.syntax_errors} syntax errors"}
+            if past(deadline):
+                return expired
+            try:
+                result = interpreter.execute(program) if program is not None else None
+            except Exception as e:
+                return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+            if isinstance(result, str) and result == "Error":
+                return {'ok': False, 'error': "the script failed"}
+
+            response = {'ok': True, 'result': to_json(result)}
+            output = request.get('output')
+            if output is not None and 'numpy' in sys.modules and isinstance(result, np.ndarray):
+                if past(deadline):
+                    return expired
+                if not save_image(output, result):
+                    return {'ok': False, 'error': f"unable to write {output}"}
+                response['output'] = output
+            return response
+        finally:
+            interpreter.symbol_table = {}
+            self.pool.release(interpreter)
+
+    def stats(self):
+        return {'requests': self.requests, 'errors': self.errors, 'timeouts': self.timeouts,
+                'workers': self.workers, 'idle': self.pool.available.qsize()}
+
+# ------------------------------------- CLIENT ----------------------------------------------
+class ServerClient:
+    '''
+    One connection to an EvaluationServer, requests are answered in order.
+    '''
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host='127.0.0.1', port=DEFAULT_PORT):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def request(self, **request):
+        self.writer.write(json.dumps(request).encode() + b'\n')
+        await self.writer.drain()
+        return json.loads(await self.reader.readline())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+# ------------------------------------- CLI -------------------------------------------------
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='translator.py serve', description='Evaluate scripts sent over a local socket')
+    arg_parser.add_argument('--host', default='127.0.0.1', help='address to listen on, localhost by default')
+    arg_parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='TCP port')
+    arg_parser.add_argument('-j', '--workers', type=int, default=4, help='interpreters evaluating requests at the same time')
+    arg_parser.add_argument('--timeout', type=float, default=30.0, help='seconds a request may run')
+    return arg_parser
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+
+    async def serve():
+        server = EvaluationServer(args.workers, args.timeout, args.host, args.port)
+        host, port = await server.start()
+        print(f"Serving on {host}:{port} with {args.workers} interpreters")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
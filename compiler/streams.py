@@ -0,0 +1,294 @@
+import glob
+import os
+import queue
+import threading
+import time
+
+from library import cv2, load_image, save_image
+
+# ------------------------------------- FRAME STREAMS ---------------------------------------
+# A flow applied to a frame source doesn't run right away, it gives a FrameStream that
+# runs when it is saved or iterated:
+#
+#     video = open_video("camera.avi")
+#     gray = video -> cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)
+#     save_video(gray, "gray.avi")
+#
+# Decoding, processing and encoding run on three threads connected by bounded queues.
+# A full queue blocks the stage before it (backpressure), except for live sources
+# (cameras) which can't wait: their oldest queued frame is dropped and counted instead.
+
+DEFAULT_FPS = 30.0
+DEFAULT_FOURCC = 'MJPG'
+
+class StreamStats:
+    '''
+    Counters of one stream run. read frames are either processed or dropped, processed
+    ones either written or counted as errors when a stage failed. fps is processed
+    frames per second of wall time, input_fps the rate the source declares.
+    '''
+    fields = ('read', 'processed', 'written', 'dropped', 'errors', 'seconds', 'input_fps', 'queue_max')
+
+    def __init__(self):
+        for field in self.fields:
+            setattr(self, field, 0)
+
+    @property
+    def fps(self):
+        return self.processed / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        values = {field: getattr(self, field) for field in self.fields}
+        values['fps'] = self.fps
+        return values
+
+    def report(self):
+        return (f"frames read {self.read}, processed {self.processed}, written {self.written}, "
+                f"dropped {self.dropped}, errors {self.errors} in {self.seconds:.2f}s "
+                f"({self.fps:.1f} fps, source {self.input_fps:.1f} fps)")
+
+# ------------------------------------- SOURCES ---------------------------------------------
+class FrameSource:
+    '''
+    Frames of a video file or camera (cv2.VideoCapture) or of an image sequence, a glob
+    pattern like "frames/*.png" or a list of paths read with load_image in sorted order.
+    Cameras, given by index, are live: frames that can't be queued are dropped.
+    '''
+    def __init__(self, source, live=None, fps=None):
+        if isinstance(source, str) and source.strip().isdigit():
+            source = int(source)
+        self.source = source
+        self.live = isinstance(source, int) if live is None else live
+        self.requested_fps = fps
+
+    def is_sequence(self):
+        if isinstance(self.source, (list, tuple)):
+            return True
+        return isinstance(self.source, str) and glob.has_magic(self.source)
+
+    def paths(self):
+        if isinstance(self.source, (list, tuple)):
+            return list(self.source)
+        return sorted(glob.glob(self.source))
+
+    def frames(self):
+        # Generator of frames, the capture is released when it is closed
+        if self.is_sequence():
+            for path in self.paths():
+                frame = load_image(path)
+                if frame is not None:
+                    yield frame
+            return
+
+        capture = cv2.VideoCapture(self.source)
+        try:
+            if not capture.isOpened():
+                print(f"Error unable to open video {self.source}")
+                return
+            self.requested_fps = self.requested_fps or capture.get(cv2.CAP_PROP_FPS) or None
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    return
+                yield frame
+        finally:
+            capture.release()
+
+    @property
+    def fps(self):
+        return self.requested_fps or DEFAULT_FPS
+
+    def __iter__(self):
+        return FrameStream(self).run()
+
+    def __repr__(self):
+        return f"FrameSource({self.source!r})"
+
+class FrameStream:
+    '''
+    A frame source followed by the pipelines applied to it, runs lazily. Applying
+    another pipeline gives a new stream with one more pipeline.
+    '''
+    def __init__(self, source, pipelines=()):
+        self.source = source
+        self.pipelines = tuple(pipelines)
+
+    def then(self, pipeline):
+        return FrameStream(self.source, self.pipelines + (pipeline,))
+
+    def process(self, frame):
+        for pipeline in self.pipelines:
+            frame = pipeline(frame)
+            if isinstance(frame, str) and frame == "Error":
+                return None
+        return frame
+
+    def run(self, writer=None, queue_size=4, drop=None, stats=None):
+        '''
+        Generator of processed frames. Frames are decoded on a thread ahead of processing
+        and, with a writer, encoded on another one, each side of processing has a queue of
+        queue_size frames. drop defaults to the source being live.
+        '''
+        stats = stats if stats is not None else StreamStats()
+        drop = self.source.live if drop is None else drop
+        decoded = queue.Queue(max(1, queue_size))
+        stop = threading.Event()
+        start = time.perf_counter()
+
+        decoder = threading.Thread(target=decode, args=(self.source, decoded, stop, drop, stats), daemon=True)
+        decoder.start()
+        encoder = None
+        failed = threading.Event()
+        if writer is not None:
+            encoded = queue.Queue(max(1, queue_size))
+            encoder = threading.Thread(target=encode, args=(self.source, writer, encoded, failed, stats), daemon=True)
+            encoder.start()
+
+        try:
+            while True:
+                frame = decoded.get()
+                if frame is END:
+                    break
+                frame = self.process(frame)
+                if frame is None:
+                    stats.errors += 1
+                    continue
+                stats.processed += 1
+                if encoder is not None:
+                    if failed.is_set():
+                        # Nothing more can be written, the stream stops here
+                        break
+                    encoded.put(frame)
+                yield frame
+        finally:
+            stop.set()
+            # Unblocks a decoder waiting on a full queue
+            while decoder.is_alive():
+                try:
+                    decoded.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            if encoder is not None:
+                encoded.put(END)
+                encoder.join()
+            stats.input_fps = self.source.fps
+            stats.seconds = time.perf_counter() - start
+
+    def __iter__(self):
+        return self.run()
+
+    def __repr__(self):
+        return f"FrameStream({self.source!r}, {len(self.pipelines)} pipelines)"
+
+END = object()
+
+def decode(source, decoded, stop, drop, stats):
+    frames = source.frames()
+    try:
+        for frame in frames:
+            if stop.is_set():
+                break
+            stats.read += 1
+            if drop:
+                while True:
+                    try:
+                        decoded.put_nowait(frame)
+                        break
+                    except queue.Full:
+                        try:
+                            decoded.get_nowait()
+                            stats.dropped += 1
+                        except queue.Empty:
+                            pass
+            else:
+                decoded.put(frame)
+            stats.queue_max = max(stats.queue_max, decoded.qsize())
+    finally:
+        frames.close()
+        decoded.put(END)
+
+def encode(source, writer, encoded, failed, stats):
+    # A writer that raises or returns False sets failed and the thread keeps taking frames until END, so
+    # the processing loop never blocks on a full queue nobody reads
+    try:
+        while True:
+            frame = encoded.get()
+            if frame is END:
+                break
+            if failed.is_set():
+                continue
+            if writer.fps is None:
+                # Known once the source is open, before its first frame was decoded
+                writer.fps = source.fps
+            try:
+                # A writer returning False failed too, the frames after it would be lost
+                if not writer.write(frame):
+                    raise OSError("the writer didn't write it")
+                stats.written += 1
+            except Exception as e:
+                print(f"Error writing frame {stats.written} to {writer.path}: {type(e).__name__}: {e}")
+                stats.errors += 1
+                failed.set()
+    finally:
+        writer.close()
+
+# ------------------------------------- WRITERS ---------------------------------------------
+class FrameWriter:
+    '''
+    Writes frames to a video with cv2.VideoWriter (fourcc MJPG by default), opened with
+    the size and color of the first frame, or to an image sequence when path has a
+    "{}" placeholder for the frame number, "out/frame_{:05d}.png" for example.
+    fps None takes the rate of the stream's source.
+    '''
+    def __init__(self, path, fps=None, fourcc=DEFAULT_FOURCC):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+        self.count = 0
+
+    def write(self, frame):
+        # Raises OSError when the frame can't be written
+        if '{' in self.path:
+            path = self.path.format(self.count)
+            if not save_image(path, frame):
+                raise OSError(f"unable to write image {path}")
+            self.count += 1
+            return True
+        if self.writer is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            height, width = frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps or DEFAULT_FPS,
+                                          (width, height), frame.ndim == 3)
+        if not self.writer.isOpened():
+            raise OSError(f"unable to open video {self.path} for writing")
+        self.writer.write(frame)
+        self.count += 1
+        return True
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+# ------------------------------------- BUILTINS --------------------------------------------
+def open_video(source):
+    return FrameSource(source)
+
+def save_video(stream, path, fps=None, queue_size=4):
+    '''
+    Runs a stream (or a bare source) writing every processed frame to path, returns
+    the StreamStats as a dict.
+    '''
+    if isinstance(stream, FrameSource):
+        stream = FrameStream(stream)
+    if not isinstance(stream, FrameStream):
+        print(f"Error save_video needs a video stream, got {type(stream).__name__}")
+        return "Error"
+    stats = StreamStats()
+    writer = FrameWriter(path, fps)
+    for _ in stream.run(writer, queue_size, stats=stats):
+        pass
+    return stats.as_dict()
@@ -2,17 +2,31 @@ import pytest
 import networkx as nx
 import numpy as np
 import cv2 
-from translator import lexer, parser, add_node, execute_parse_tree_testing
-from globals import NODE_COUNTER, parseGraph
+from translator import lexer, parser, execute_parse_tree_testing, visit_node, symbol_table
+from ast_nodes import Assign, BinOp, Block, Const, count_nodes, to_graph
+from optimizer import optimize
+from bytecode import compile_tree, VM, LOAD_CONST, BINARY_OP, SELECT, UNBOUND
+import os
+import threading
+from batch import run_batch, main as batch_main
+from image_io import IOStats, ImageReader, ImageWriter
+from concurrent.futures import ProcessPoolExecutor
+from library import ImageCache, FunctionRegistry, load_image, save_image, convert_to_raw, save_raw, load_raw
+from translator import Interpreter, compiler_version
+from program_cache import ProgramCache
+from profiler import Profiler
+from memo import MemoCache
+import json
 
-# Reset the global variables before each test
+# The parse pipeline keeps no module level counters or graphs any more, the only shared
+# state left in the default session is the lexer position
 @pytest.fixture(autouse=True)
 def reset_globals():
-    global NODE_COUNTER, parseGraph
-    NODE_COUNTER = 0
-    parseGraph.clear()
-    assert NODE_COUNTER == 0
-    assert len(parseGraph) == 0
+    lexer.lineno = 1
+
+@pytest.fixture
+def interpreter():
+    return Interpreter()
 
 # --------------------- TEST CASES FOR LEXER --------------------
 @pytest.mark.parametrize("test_input,expected_output", [
@@ -33,7 +47,9 @@ def reset_globals():
     ("if(2==2): 3 else: 1+1", [('IF', 'if'), ('LPAREN', '('), ('NUMBER', 2), ('EQ', '=='), ('NUMBER', 2), ('RPAREN', ')'), ('COLON', ':'), ('NUMBER', 3), ('ELSE', 'else'), ('COLON', ':'), ('NUMBER', 1), ('PLUS', '+'), ('NUMBER', 1)]),
     ("(2==2) && (1!=1)", [('LPAREN', '('), ('NUMBER', 2), ('EQ', '=='), ('NUMBER', 2), ('RPAREN', ')'), ('AND', '&&'), ('LPAREN', '('), ('NUMBER', 1), ('NE', '!='), ('NUMBER', 1), ('RPAREN', ')')]),
     ("(2==2) || (1!=1)", [('LPAREN', '('), ('NUMBER', 2), ('EQ', '=='), ('NUMBER', 2), ('RPAREN', ')'), ('OR', '||'), ('LPAREN', '('), ('NUMBER', 1), ('NE', '!='), ('NUMBER', 1), ('RPAREN', ')')]),
-    ("(3 + 4) * 5", [('LPAREN', '('), ('NUMBER', 3), ('PLUS', '+'), ('NUMBER', 4), ('RPAREN', ')'), ('TIMES', '*'), ('NUMBER', 5)])
+    ("(3 + 4) * 5", [('LPAREN', '('), ('NUMBER', 3), ('PLUS', '+'), ('NUMBER', 4), ('RPAREN', ')'), ('TIMES', '*'), ('NUMBER', 5)]),
+    ("f(\"a\", \"b\")", [('VARIABLE', 'f'), ('LPAREN', '('), ('STRING', 'a'), ('COMMA', ','), ('STRING', 'b'), ('RPAREN', ')')]),
+    ("a = 1; b # note\n\n3", [('VARIABLE', 'a'), ('SETTO', '='), ('NUMBER', 1), ('SEMI', ';'), ('VARIABLE', 'b'), ('NEWLINE', '\n\n'), ('NUMBER', 3)])
 ])
 
 def test_lexer(test_input, expected_output):
@@ -67,11 +83,9 @@ def test_lexer(test_input, expected_output):
 ])
 
 def test_simple_arithmetic(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     assert str(tree_result) == expected_output
 
 # Test cases for variable assignment
@@ -87,11 +101,9 @@ def test_simple_arithmetic(test_input, expected_output, reset_globals):
 ])
 
 def test_variable_assignment(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     assert str(tree_result) == expected_output
 
 # Test cases for comparison operators
@@ -111,11 +123,9 @@ def test_variable_assignment(test_input, expected_output, reset_globals):
 ])
 
 def test_comparison_operators(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     assert str(tree_result) == expected_output
 
 # Test cases for logical operators
@@ -135,11 +145,9 @@ def test_comparison_operators(test_input, expected_output, reset_globals):
 ])
 
 def test_logical_operators(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     assert str(tree_result) == expected_output
     
 # Test cases for string handling
@@ -149,11 +157,9 @@ def test_logical_operators(test_input, expected_output, reset_globals):
 ])
 
 def test_string_handling(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     assert str(tree_result) == expected_output
     
 # Test cases for function calls
@@ -168,11 +174,9 @@ def test_string_handling(test_input, expected_output, reset_globals):
 ])
 
 def test_function_calls(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
     if isinstance(expected_output, np.ndarray):
         assert np.array_equal(tree_result, expected_output)
     else:
@@ -205,9 +209,1301 @@ def test_function_calls(test_input, expected_output, reset_globals):
 ])
 
 def test_conditional_statements(test_input, expected_output, reset_globals):
-    root = add_node({"type": "INITIAL", "label": "INIT"})
     result = parser.parse(test_input)
-    parseGraph.add_edge(root["counter"], result["counter"])
-    print("Graph structure (detailed):", parseGraph.nodes(data=True))
-    tree_result = execute_parse_tree_testing(parseGraph)
-    assert str(tree_result) == expected_output
\ No newline at end of file
+    print("Parse tree:", result)
+    tree_result = execute_parse_tree_testing(result)
+    assert str(tree_result) == expected_output
+
+# --------------------- TEST CASES FOR BYTECODE VM --------------------
+# The VM must return the same value the tree walker returns
+@pytest.mark.parametrize("test_input", [
+    "2 * (3 + 4) - 5 / 2",
+    "(2 ^ 3) + (4 * 5)",
+    "((5 > 3) && (2 > 3)) || ((4 > 2) && (1 < 5))",
+    "if (1!=1): 8-10 else: 9+14",
+    "(33 > 22)?(3):(0)",
+    "max(1, max(2, 3))",
+    "vm_x = 3 * 7",
+    "\"Hola\"",
+])
+
+def test_vm_matches_visit_node(test_input, reset_globals):
+    result = parser.parse(test_input)
+    expected = visit_node(result)
+    program = compile_tree(result)
+    assert VM(symbol_table).run(program) == expected
+
+def test_vm_program_layout(reset_globals):
+    program = compile_tree(parser.parse("(1 > 0)?(2 + 2):(2)"), lazy=False)
+    # Repeated literals share a single constant pool entry
+    assert program.consts == [1, 0, 2]
+    assert program.code[-2] == SELECT
+    assert program.code[0::2].count(BINARY_OP) == 1
+    assert "LOAD_CONST" in program.disassemble()
+
+def test_vm_assignment_and_lookup(reset_globals):
+    program = compile_tree(parser.parse("vm_y = 10 / 4"))
+    table = {}
+    assert VM(table).run(program) == 2.5
+    assert table == {"vm_y": 2.5}
+
+# --------------------- TEST CASES FOR AST --------------------
+def test_ast_nodes_from_parser(reset_globals):
+    tree = parser.parse("2 * (3 + 4)")
+    assert isinstance(tree, BinOp) and tree.op == "TIMES"
+    assert isinstance(tree.left, Const) and tree.left.value == 2
+    assert count_nodes(tree) == 6
+    # Slotted nodes carry no per-instance dict
+    assert not hasattr(tree, "__dict__")
+
+def test_ast_to_graph(reset_globals):
+    graph = to_graph(parser.parse("x = max(1, 2)"))
+    types = [data["type"] for _, data in graph.nodes(data=True)]
+    assert types == ["INITIAL", "ASSIGN", "VARIABLE_ASSIGN", "FUNCTION_CALL", "NUMBER", "NUMBER"]
+    assert graph.number_of_edges() == 5
+
+# --------------------- TEST CASES FOR INTERPRETER --------------------
+def test_interpreter_parse_compile_execute(interpreter):
+    tree = interpreter.parse("w = 2 ^ 5")
+    program = interpreter.compile(tree)
+    assert interpreter.execute(program) == 32
+    assert interpreter.symbol_table["w"] == 32
+
+def test_interpreters_are_isolated():
+    first = Interpreter()
+    second = Interpreter()
+    first.run("shared = 1")
+    second.run("shared = 2")
+    assert first.symbol_table["shared"] == 1
+    assert second.symbol_table["shared"] == 2
+    assert "shared" not in symbol_table
+
+def test_interpreters_in_threads():
+    results = {}
+
+    def session(n):
+        interp = Interpreter({"base": n})
+        for _ in range(200):
+            interp.run("acc = (base > 3)?(base * 2 + 1):(base * 2)")
+        results[n] = interp.symbol_table["acc"]
+
+    threads = [threading.Thread(target=session, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == {n: n * 2 + (1 if n > 3 else 0) for n in range(8)}
+
+# --------------------- TEST CASES FOR SCRIPTS --------------------
+SCRIPT = '''# generated script
+a = 2
+b = a * 10; c = b + 1
+
+d = if (c > 20): c - 1 else: 0
+d * 2
+'''
+
+def test_program_statements(interpreter):
+    tree = interpreter.parse(SCRIPT)
+    assert isinstance(tree, Block)
+    assert [statement.lineno for statement in tree.statements] == [2, 3, 3, 5, 6]
+    # A single statement, with or without separators, is not wrapped
+    assert isinstance(interpreter.parse("x = 1;\n"), Assign)
+    assert interpreter.parse("\n# only a comment\n") is None
+
+def test_program_matches_visit_node(interpreter):
+    tree = interpreter.parse(SCRIPT)
+    table = {}
+    assert visit_node(tree, table) == 40
+    assert interpreter.run(SCRIPT) == 40
+    assert table == {name: interpreter.symbol_table[name] for name in "abcd"}
+
+def test_program_line_table(interpreter):
+    program = interpreter.compile(interpreter.parse(SCRIPT))
+    assert program.line_numbers == [2, 3, 5, 6]
+    assert program.line_at(0) == 2
+    assert program.line_at(len(program.code) - 2) == 6
+
+def test_run_file(interpreter, tmp_path):
+    script = tmp_path / "script.txt"
+    script.write_text(SCRIPT)
+    assert interpreter.run_file(str(script)) == 40
+    assert interpreter.symbol_table["c"] == 21
+
+def test_run_file_reports_error_line(interpreter, tmp_path, capsys):
+    script = tmp_path / "script.txt"
+    script.write_text("a = 1\n\nb = a / 0\nc = 3\n")
+    assert interpreter.run_file(str(script)) == "Error"
+    assert "line 3" in capsys.readouterr().out
+    assert "c" not in interpreter.symbol_table
+
+def test_run_file_syntax_error_runs_nothing(interpreter, tmp_path, capsys):
+    script = tmp_path / "script.txt"
+    script.write_text("a = 1\nb = 2 +\nc = 3\n")
+    assert interpreter.run_file(str(script)) == "Error"
+    assert "line 2" in capsys.readouterr().out
+    assert "a" not in interpreter.symbol_table and "c" not in interpreter.symbol_table
+
+def test_call_error_reports_line(interpreter, capsys):
+    interpreter.symbol_table["fail"] = lambda: 1 / 0
+    assert interpreter.run("a = 1\nb = fail()") == "Error"
+    assert "on line 2" in capsys.readouterr().out
+
+# --------------------- TEST CASES FOR FLOWS --------------------
+def test_flow_assignment(interpreter):
+    image = cv2.imread("test.jpg")
+    interpreter.run("flow_src = load_image(\"test.jpg\")")
+    result = interpreter.run("flow_out = flow_src -> cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)")
+    expected = cv2.GaussianBlur(cv2.cvtColor(image, 6), (5, 5), 0)
+    assert np.array_equal(result, expected)
+    assert np.array_equal(interpreter.symbol_table["flow_out"], expected)
+
+def test_flow_matches_visit_node(interpreter):
+    interpreter.run("flow_src = 2")
+    tree = interpreter.parse("flow_out = flow_src -> max(0) -> max(3)")
+    assert interpreter.execute(interpreter.compile(tree)) == 3
+    assert visit_node(tree, interpreter.symbol_table) == 3
+
+def test_flow_pipeline_reuse(interpreter, capsys):
+    pipeline = interpreter.flow("cvtColor(6) -> threshold(127, 255, 0)")
+    assert len(pipeline) == 2
+    assert "Error" not in capsys.readouterr().out
+    image = cv2.imread("test.jpg")
+    for img in (image, cv2.flip(image, 0)):
+        expected = cv2.threshold(cv2.cvtColor(img, 6), 127, 255, 0)
+        out = pipeline(img)
+        assert np.array_equal(out[1], expected[1])
+
+def test_flow_unknown_stage(interpreter):
+    interpreter.run("flow_src = 1")
+    assert interpreter.run("flow_out = flow_src -> not_a_function(1)") == "Error"
+
+# --------------------- TEST CASES FOR BATCH --------------------
+@pytest.fixture
+def batch_inputs(tmp_path):
+    image = cv2.imread("test.jpg")
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for i in range(5):
+        cv2.imwrite(str(inputs / f"img{i}.png"), cv2.resize(image, (64 + i, 48)))
+    (inputs / "broken.png").write_bytes(b"not an image")
+    return inputs
+
+@pytest.mark.parametrize("workers,chunksize", [(0, 1), (2, 2)])
+def test_batch_flow(batch_inputs, tmp_path, workers, chunksize):
+    out = tmp_path / "out"
+    results = list(run_batch("cvtColor(6) -> GaussianBlur(gen_vector(3, 3), 0)", str(batch_inputs / "*.png"),
+                             str(out), workers=workers, chunksize=chunksize))
+    assert len(results) == 6
+    errors = [r for r in results if r.error is not None]
+    assert [os.path.basename(r.path) for r in errors] == ["broken.png"]
+    for r in results:
+        if r.error is None:
+            expected = cv2.GaussianBlur(cv2.cvtColor(cv2.imread(r.path), 6), (3, 3), 0)
+            assert np.array_equal(cv2.imread(r.output, cv2.IMREAD_GRAYSCALE), expected)
+
+def test_batch_script(batch_inputs, tmp_path):
+    out = tmp_path / "out"
+    results = list(run_batch("flip(image, 1)", str(batch_inputs / "img*.png"), str(out), workers=0, mode="script"))
+    assert all(r.error is None for r in results)
+    first = results[0]
+    assert np.array_equal(cv2.imread(first.output), cv2.flip(cv2.imread(first.path), 1))
+
+def test_batch_cli(batch_inputs, tmp_path, capsys):
+    code = batch_main(["cvtColor(6) -> equalizeHist()", str(batch_inputs / "*.png"), "-o", str(tmp_path / "cli"), "-j", "0"])
+    output = capsys.readouterr().out
+    assert code == 1
+    assert "5 processed, 1 errors" in output
+
+def test_batch_io_stats(batch_inputs, tmp_path):
+    stats = IOStats()
+    results = list(run_batch("flip(1)", str(batch_inputs / "*.png"), str(tmp_path / "out"), workers=2,
+                             chunksize=3, read_ahead=2, write_behind=2, io_stats=stats))
+    assert len(results) == 6
+    assert stats.reads == 6
+    assert stats.writes == 5
+
+# --------------------- TEST CASES FOR IMAGE I/O --------------------
+def test_image_reader_order_and_errors(batch_inputs):
+    paths = sorted(str(p) for p in batch_inputs.iterdir())
+
+    def loader(path):
+        if path.endswith("img3.png"):
+            raise IOError("disk error")
+        return path.upper()
+
+    with ImageReader(paths, read_ahead=3, threads=2, loader=loader) as reader:
+        items = list(reader)
+    assert [item[0] for item in items] == paths
+    assert [item[1] for item in items if item[2] is None] == [p.upper() for p in paths if not p.endswith("img3.png")]
+    assert [item[2] for item in items if item[2] is not None] == ["OSError: disk error"]
+    assert reader.stats.reads == len(paths)
+    assert reader.stats.read_depth_max <= 3
+
+def test_image_writer_write_behind():
+    written = []
+    release = threading.Event()
+
+    def saver(path, image):
+        release.wait(1)
+        written.append(path)
+        return True
+
+    stats = IOStats()
+    writer = ImageWriter(write_behind=2, threads=2, stats=stats, saver=saver)
+    futures = [writer.write("a", None), writer.write("b", None)]
+    # Both writes are queued without blocking the caller
+    assert written == []
+    release.set()
+    writer.write("c", None)
+    writer.close()
+    assert sorted(written) == ["a", "b", "c"]
+    assert all(f.result() is True for f in futures)
+    assert stats.writes == 3 and stats.write_depth_max >= 1
+
+# --------------------- TEST CASES FOR IMAGE CACHE --------------------
+def test_image_cache_hits_and_read_only(tmp_path):
+    path = str(tmp_path / "cached.png")
+    cv2.imwrite(path, np.full((8, 8, 3), 7, np.uint8))
+    decodes = []
+
+    def loader(p):
+        decodes.append(p)
+        return cv2.imread(p)
+
+    cache = ImageCache(max_bytes=10 ** 6)
+    first = cache.load(path, loader)
+    second = cache.load(path, loader)
+    assert len(decodes) == 1
+    assert cache.hits == 1 and cache.misses == 1
+    assert np.array_equal(first, second)
+    with pytest.raises(ValueError):
+        first[0, 0, 0] = 1
+    with pytest.raises(ValueError):
+        second.flags.writeable = True
+
+def test_image_cache_read_only_whether_cached_or_not(tmp_path):
+    path = str(tmp_path / "big.png")
+    cv2.imwrite(path, np.full((8, 8, 3), 7, np.uint8))
+    for cache in (ImageCache(max_bytes=0), ImageCache(max_bytes=10)):
+        image = cache.load(path, cv2.imread)
+        assert not image.flags.writeable and cache.stats()["entries"] == 0
+        with pytest.raises(ValueError):
+            image.flags.writeable = True
+    interpreter = Interpreter({"path": path, "corner": (0, 0), "far": (3, 3), "red": (0, 0, 255)})
+    interpreter.run("canvas = copy_image(load_image(path)); rectangle(canvas, corner, far, red, 5)")
+    assert interpreter.symbol_table["canvas"][0, 0].tolist() == [0, 0, 255]
+
+def test_image_cache_counts_missing_files_from_threads(tmp_path):
+    cache = ImageCache()
+    missing = str(tmp_path / "missing.png")
+    def load_many():
+        for _ in range(500):
+            cache.load(missing, lambda path: None)
+    threads = [threading.Thread(target=load_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.misses == 8 * 500 and cache.hits == 0
+
+def test_image_cache_invalidated_by_file_change(tmp_path):
+    path = str(tmp_path / "changing.png")
+    cv2.imwrite(path, np.zeros((4, 4), np.uint8))
+    cache = ImageCache()
+    assert cache.load(path, cv2.imread).max() == 0
+    cv2.imwrite(path, np.full((4, 5), 255, np.uint8))
+    os.utime(path, ns=(0, 10 ** 9))
+    assert cache.load(path, cv2.imread).max() == 255
+    assert cache.misses == 2 and cache.stats()["entries"] == 1
+
+def test_image_cache_lru_budget(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(str(tmp_path / f"lru{i}.png"))
+        cv2.imwrite(paths[-1], np.full((10, 10), i, np.uint8))
+    gray = lambda p: cv2.imread(p, cv2.IMREAD_GRAYSCALE)
+    cache = ImageCache(max_bytes=250)
+    cache.load(paths[0], gray)
+    cache.load(paths[1], gray)
+    cache.load(paths[0], gray)
+    cache.load(paths[2], gray)
+    # lru1 was the least recently used entry
+    assert cache.evictions == 1
+    assert cache.current_bytes == 200
+    cache.load(paths[0], gray)
+    assert cache.hits == 2
+
+# --------------------- TEST CASES FOR PROGRAM CACHE --------------------
+def test_program_cache_hits(capsys):
+    cache = ProgramCache()
+    interp = Interpreter(cache=cache)
+    assert interp.run("cached = 6 * 7") == 42
+    assert interp.run("cached = 6 * 7") == 42
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    # Flags are part of the key
+    Interpreter(cache=cache, optimize=False).run("cached = 6 * 7")
+    assert cache.stats()["misses"] == 2
+    # Syntax errors are reported every time and never cached
+    assert interp.run("cached = 6 *") is None
+    assert interp.run("cached = 6 *") is None
+    assert capsys.readouterr().out.count("Syntax error") == 2
+    assert cache.stats()["entries"] == 2
+
+def test_program_cache_lru():
+    cache = ProgramCache(max_entries=2)
+    interp = Interpreter(cache=cache)
+    for source in ("1 + 1", "2 + 2", "1 + 1", "3 + 3", "2 + 2"):
+        interp.run(source)
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["hits"] == 1
+
+def test_program_cache_on_disk(tmp_path):
+    source = "flipped = flip(gen_matrix(2, 2, 1, 2, 3, 4), 0)"
+    first = Interpreter(cache=ProgramCache(directory=str(tmp_path)))
+    expected = first.run(source)
+    assert first.cache.stats()["disk_writes"] == 1
+
+    # A fresh cache, like a new worker process, loads the program without parsing
+    second = Interpreter(cache=ProgramCache(directory=str(tmp_path)))
+    second.parse = None
+    assert np.array_equal(second.run(source), expected)
+    assert second.cache.stats()["disk_hits"] == 1
+    program = next(iter(second.cache.entries.values()))
+    assert {site[0]: site[2] for site in program.calls}["flip"] is cv2.flip
+
+def test_program_cache_invalidate(tmp_path):
+    cache = ProgramCache(directory=str(tmp_path))
+    interp = Interpreter(cache=cache)
+    interp.run("x = 1")
+    stale = ProgramCache.key("x = 1", "old-grammar")
+    cache.load(stale, lambda: interp.build("x = 2"))
+    assert sorted(os.listdir(tmp_path)) == sorted(["old-grammar", compiler_version()])
+
+    cache.invalidate(keep_version=compiler_version())
+    assert os.listdir(tmp_path) == [compiler_version()]
+    assert cache.stats()["entries"] == 1
+    cache.invalidate()
+    assert os.listdir(tmp_path) == [] and cache.stats()["entries"] == 0
+
+def test_batch_script_program_cache(batch_inputs, tmp_path):
+    cache_dir = str(tmp_path / "programs")
+    results = list(run_batch("flip(image, 1)", str(batch_inputs / "img*.png"), str(tmp_path / "out"), workers=2,
+                             mode="script", cache_dir=cache_dir))
+    assert all(r.error is None for r in results)
+    assert len(os.listdir(os.path.join(cache_dir, compiler_version()))) == 1
+
+# --------------------- TEST CASES FOR PROFILER --------------------
+PROFILED_SCRIPT = """m = gen_matrix(2, 2, 1, 2, 3, 4)
+f = m -> flip(0) -> flip(1)
+t = (2 + 3) * (4 - 1) + max(1, max(2, 7))
+if (t > 3): t * 2 else: 0
+"""
+
+def test_profiler_matches_interpreter(tmp_path):
+    profiler = Profiler()
+    profiled = Interpreter()
+    assert profiler.run(profiled, PROFILED_SCRIPT) == Interpreter().run(PROFILED_SCRIPT) == 44
+    assert np.array_equal(profiled.symbol_table["f"], np.array([[4, 3], [2, 1]]))
+
+    report = profiler.as_dict()
+    assert list(report["phases"]) == ["lex", "parse", "build", "execute"]
+    assert {name: entry["calls"] for name, entry in report["functions"].items()} == \
+        {"gen_matrix": 1, "flip": 2, "max": 2}
+    nodes = report["nodes"]
+    assert nodes["FUNCTION_CALL"]["compiled"] == 3 and nodes["ASSIGN"]["compiled"] == 3
+    assert nodes["FLOW"]["compiled"] == 1
+    for entry in nodes.values():
+        assert entry["cumulative_seconds"] >= entry["self_seconds"] >= 0
+    assert nodes["BLOCK"]["cumulative_seconds"] >= nodes["FUNCTION_CALL"]["cumulative_seconds"]
+
+    profiler.dump(str(tmp_path / "profile.json"))
+    with open(tmp_path / "profile.json") as f:
+        assert json.load(f) == json.loads(json.dumps(report))
+    assert "gen_matrix" in profiler.report()
+
+def test_profiler_accumulates_runs():
+    profiler = Profiler()
+    interp = Interpreter()
+    profiler.run(interp, "x = max(1, 2)")
+    profiler.run(interp, "x = max(x, 3)")
+    assert profiler.phases["execute"][0] == 2
+    assert profiler.functions["max"][0] == 2
+    assert profiler.run(interp, "x = max(1,") is None
+
+def test_profiler_stops_on_trailing_syntax_error(tmp_path):
+    import subprocess
+    import sys
+    profiler = Profiler()
+    interp = Interpreter()
+    assert profiler.run(interp, "x = 1\ny = (") is None
+    assert interp.lexer.syntax_errors == 1 and "x" not in interp.symbol_table
+    assert list(profiler.phases) == ["lex", "parse"]
+    # The CLI reports it like run does instead of printing a profile
+    script = tmp_path / "cut.txt"
+    script.write_text("x = 1\ny = (")
+    here = os.path.dirname(os.path.abspath(__file__))
+    output = subprocess.run([sys.executable, "translator.py", "profile", str(script)], cwd=here, capture_output=True, text=True)
+    assert output.returncode == 1 and "1 syntax errors" in output.stdout and "phase" not in output.stdout
+
+def test_profiler_runs_pipelines_like_the_interpreter(tmp_path):
+    from buffers import BufferPool
+    from streams import FrameStream
+    for i in range(2):
+        cv2.imwrite(str(tmp_path / f"f{i}.png"), np.full((6, 8, 3), 50, np.uint8))
+    source = f'v = open_video("{tmp_path}/f*.png"); g = v -> cvtColor(6)'
+    assert isinstance(Profiler().run(Interpreter(), source), FrameStream)
+    # Stages go through Pipeline.__call__, so a pooled interpreter uses its pool
+    pool = BufferPool()
+    interp = Interpreter({"img": np.zeros((6, 8, 3), np.uint8)}, pool=pool)
+    profiler = Profiler()
+    for _ in range(3):
+        assert profiler.run(interp, "g = img -> cvtColor(6) -> GaussianBlur(gen_vector(3, 3), 0)").shape == (6, 8)
+    assert pool.stats.calls == 6 and pool.stats.reused > 0
+    assert profiler.functions["cvtColor"][0] == 3 and profiler.functions["GaussianBlur"][0] == 3
+    assert "compiled" in profiler.report()
+
+def test_profiler_error_line():
+    profiler = Profiler()
+    with pytest.raises(ZeroDivisionError):
+        profiler.run(Interpreter(), "a = 1\nb = a / 0")
+    assert profiler.nodes["DIVIDE"][0] == 1
+
+# --------------------- TEST CASES FOR BENCHMARK SUITE --------------------
+def test_benchmark_suite_runs():
+    from benchmarks import suite
+    report = suite.run_suite(quick=True, selected=["vm", "flow_blur"], min_time=0.001, repeats=1)
+    assert sorted(report["results"]) == ["flow_blur", "vm"]
+    assert all(result["rate"] > 0 for result in report["results"].values())
+
+def test_benchmark_compare_flags_regressions():
+    from benchmarks import suite
+    baseline = {"results": {"vm": {"rate": 100.0}, "lexer": {"rate": 100.0}, "parser": {"rate": 100.0}}}
+    current = {"results": {"vm": {"rate": 80.0}, "lexer": {"rate": 95.0}, "build": {"rate": 1.0}}}
+    rows = {row[0]: row[4] for row in suite.compare(baseline, current, threshold=0.1)}
+    assert rows == {"vm": "regression", "lexer": "ok", "parser": "missing", "build": "new"}
+
+# --------------------- TEST CASES FOR RAW IMAGES --------------------
+def raw_checksum(path):
+    return float(load_image(path).sum())
+
+@pytest.mark.parametrize("image", [
+    np.arange(24, dtype=np.uint8).reshape(2, 4, 3),
+    np.linspace(0, 1, 20, dtype=np.float32).reshape(4, 5),
+])
+def test_raw_round_trip(image, tmp_path):
+    path = str(tmp_path / "frame.cvraw")
+    assert save_image(path, image) is True
+    loaded = load_image(path)
+    assert loaded.dtype == image.dtype
+    assert np.array_equal(loaded, image)
+    # Mapped read-only, nothing was copied into a writable buffer
+    assert not loaded.flags.writeable
+    assert isinstance(loaded.base, np.memmap)
+
+def test_raw_rejects_other_dtypes(tmp_path, capsys):
+    assert save_image(str(tmp_path / "bad.cvraw"), np.zeros((2, 2), np.int64)) is False
+    assert "raw images" in capsys.readouterr().out
+
+def test_convert_to_raw_and_share(tmp_path, interpreter):
+    raw = convert_to_raw("test.jpg", str(tmp_path / "test.cvraw"))
+    interpreter.run(f"raw = load_image(\"{raw}\")")
+    assert np.array_equal(interpreter.symbol_table["raw"], cv2.imread("test.jpg"))
+    expected = raw_checksum(raw)
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(raw_checksum, [raw] * 4)) == [expected] * 4
+
+# --------------------- TEST CASES FOR FUNCTION REGISTRY --------------------
+class CountingModule:
+    def __init__(self):
+        self.lookups = []
+
+    def __getattr__(self, name):
+        self.lookups.append(name)
+        if name == "blur":
+            return lambda image: image
+        raise AttributeError(name)
+
+def test_registry_positive_and_negative_cache():
+    module = CountingModule()
+    registry = FunctionRegistry(module)
+    for _ in range(3):
+        assert registry.lookup("blur") is not None
+        assert registry.lookup("missing") is None
+    assert module.lookups == ["blur", "missing"]
+    assert registry.stats() == {"hits": 4, "misses": 2, "entries": 2}
+
+def test_registry_preload():
+    registry = FunctionRegistry()
+    assert registry.preload() > 100
+    assert registry.lookup("GaussianBlur") is cv2.GaussianBlur
+    assert registry.misses == 0
+
+def test_call_site_binding(interpreter):
+    program = interpreter.compile(interpreter.parse("flip(gen_matrix(2, 2, 1, 2, 3, 4), 0)"))
+    assert all(site[2] is UNBOUND for site in program.calls)
+    assert np.array_equal(interpreter.execute(program), np.array([[3, 4], [1, 2]]))
+    bindings = {site[0]: site[2] for site in program.calls}
+    assert bindings["flip"] is cv2.flip
+    # Found in the symbol table, never looked up in cv2
+    assert bindings["gen_matrix"] is UNBOUND
+    assert np.array_equal(interpreter.execute(program), np.array([[3, 4], [1, 2]]))
+
+def test_call_site_binding_respects_symbol_table(interpreter):
+    program = interpreter.compile(interpreter.parse("blur(1)"))
+    interpreter.symbol_table["blur"] = lambda x: x + 41
+    assert interpreter.execute(program) == 42
+
+# --------------------- TEST CASES FOR OPTIMIZER --------------------
+@pytest.mark.parametrize("test_input,nodes_before,nodes_after,expected_output", [
+    ("2 ^ 10 * 3", 5, 1, "3072"),
+    ("8 / 2", 3, 1, "4.0"),
+    ("7 - 5", 3, 1, "2"),
+    ("(1 + 2) > 0", 6, 1, "True"),
+    ("(5 > 3) && (2 > 3)", 7, 1, "False"),
+    ("((5 > 3) || (2 > 3)) && ((4 > 2) || (1 > 5))", 15, 1, "True"),
+    ("if (1 == 1): 8-10 else: 9+14", 10, 1, "-2"),
+    ("(4 != 4)?(4):(100)", 6, 1, "100"),
+    ("opt_x = (2 * (3 + 4))", 8, 2, "14"),
+    ("max(1 + 1, (2 + 3))", 8, 3, "5"),
+    ("1 / 0 + 1", 5, 5, None),
+])
+
+def test_optimizer_folding(test_input, nodes_before, nodes_after, expected_output, interpreter):
+    tree = interpreter.parse(test_input)
+    optimized = optimize(tree)
+    assert count_nodes(tree) == nodes_before
+    assert count_nodes(optimized) == nodes_after
+    if expected_output is None:
+        # Operations that raise are left for run time
+        with pytest.raises(ZeroDivisionError):
+            interpreter.execute(interpreter.compile(tree))
+    else:
+        assert str(interpreter.execute(interpreter.compile(tree))) == expected_output
+        assert str(Interpreter(optimize=False).run(test_input)) == expected_output
+
+def test_optimizer_keeps_number_types():
+    assert type(optimize(parser.parse("2 + 3")).value) is int
+    assert type(optimize(parser.parse("2.5 + 3")).value) is float
+    assert type(optimize(parser.parse("6 / 3")).value) is float
+
+def test_optimizer_keeps_variable_operands(interpreter):
+    tree = interpreter.parse("opt_y * (2 + 3)")
+    optimized = optimize(tree)
+    assert count_nodes(optimized) == 3
+    assert optimized.right.value == 5
+    # The input tree is left untouched
+    assert count_nodes(tree) == 6
+    interpreter.symbol_table["opt_y"] = 2
+    assert interpreter.execute(interpreter.compile(tree)) == 10
+
+# --------------------- TEST CASES FOR LAZY EVALUATION --------------------
+@pytest.fixture
+def tracked_interpreter():
+    calls = []
+
+    def track(name, value=0):
+        calls.append(name)
+        return value
+
+    interp = Interpreter({"track": track, "c": 1})
+    interp.calls = calls
+    return interp
+
+@pytest.mark.parametrize("test_input,expected_output,expected_calls", [
+    ("if (c == 1): track(\"a\", 1) else: track(\"b\", 2)", 1, ["a"]),
+    ("if (c != 1): track(\"a\", 1) else: track(\"b\", 2)", 2, ["b"]),
+    ("(c > 0)?(track(\"a\", 3)):(track(\"b\", 4))", 3, ["a"]),
+    ("(c < 0)?(track(\"a\", 3)):(track(\"b\", 4))", 4, ["b"]),
+    ("(c < 0) && (track(\"a\", 1))", False, []),
+    ("(c > 0) && (track(\"a\", 5))", True, ["a"]),
+    ("(c > 0) || (track(\"a\", 1))", True, []),
+    ("(c < 0) || (track(\"a\", 0))", False, ["a"]),
+    ("(track(\"a\", 0)) || ((c > 0) && (track(\"b\", 1)))", True, ["a", "b"]),
+])
+
+def test_lazy_skips_dead_branches(test_input, expected_output, expected_calls, tracked_interpreter):
+    result = tracked_interpreter.run(test_input)
+    assert result == expected_output and type(result) == type(expected_output)
+    assert tracked_interpreter.calls == expected_calls
+
+    tracked_interpreter.calls.clear()
+    assert visit_node(tracked_interpreter.parse(test_input), tracked_interpreter.symbol_table, lazy=True) == expected_output
+    assert tracked_interpreter.calls == expected_calls
+
+def test_eager_mode_evaluates_everything(tracked_interpreter):
+    tracked_interpreter.lazy = False
+    assert tracked_interpreter.run("if (c == 1): track(\"a\", 1) else: track(\"b\", 2)") == 1
+    assert tracked_interpreter.calls == ["a", "b"]
+
+def test_lazy_skips_untaken_image_load(tracked_interpreter):
+    tracked_interpreter.symbol_table["load_image"] = lambda path: tracked_interpreter.calls.append(path) or path
+    tracked_interpreter.run("lazy_img = if (c == 1): load_image(\"a.png\") else: load_image(\"b.png\")")
+    assert tracked_interpreter.calls == ["a.png"]
+
+# --------------------- TEST CASES FOR DEEP EXPRESSIONS --------------------
+@pytest.mark.parametrize("source,expected_output", [
+    (" + ".join(["x"] * 20000), 40000),
+    (" - ".join(["x"] * 20000), 2 - 2 * 19999),
+    ("max(" + ", ".join(str(i) for i in range(20000)) + ")", 19999),
+    ("(" * 5000 + "x" + ")" * 5000, 2),
+    (" * ".join(["1"] * 20000), 1),
+], ids=["sum", "difference", "arguments", "groups", "constants"])
+
+def test_deep_expressions(source, expected_output):
+    # Far beyond the recursion limit, only the iterative compiler and VM can handle these
+    assert Interpreter({"x": 2}).run(source) == expected_output
+    assert Interpreter({"x": 2}, optimize=False).run(source) == expected_output
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_deep_expression_matches_visit_node(lazy):
+    source = " + ".join(f"(x > {i % 3})?({i}):(x)" for i in range(300))
+    interp = Interpreter({"x": 1}, lazy=lazy)
+    tree = interp.parse(source)
+    assert interp.execute(interp.compile(tree)) == visit_node(tree, interp.symbol_table)
+
+# --------------------- TEST CASES FOR STARTUP --------------------
+def test_packaged_tables_match_grammar():
+    import parsetab
+    import translator
+    import ply.yacc as yacc
+    grammar = yacc.ParserReflect(vars(translator))
+    grammar.get_all()
+    assert grammar.signature() == parsetab._lr_signature
+
+def test_startup_defers_heavy_imports():
+    import subprocess
+    import sys
+    here = os.path.dirname(os.path.abspath(__file__))
+    tables = [os.path.join(here, name) for name in ("parsetab.py", "parser.out")]
+    stamps = [os.stat(path).st_mtime_ns for path in tables]
+    script = ("import sys, translator\n"
+              "print(translator.Interpreter().run('x = 2 ^ 3 + max(1, 2)'))\n"
+              "print(sorted(m for m in ('cv2', 'numpy', 'matplotlib', 'networkx', 'pydot') if m in sys.modules))\n")
+    output = subprocess.run([sys.executable, "-c", script], cwd=here, capture_output=True, text=True, check=True)
+    assert output.stdout.split("\n")[:2] == ["10", "[]"]
+    assert output.stderr == ""
+    assert [os.stat(path).st_mtime_ns for path in tables] == stamps
+
+def test_lazy_module_loads_on_first_use():
+    from library import LazyModule
+    module = LazyModule("colorsys")
+    assert "not loaded" in repr(module)
+    assert module.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "not loaded" not in repr(module)
+
+# --------------------- TEST CASES FOR FUSED ARITHMETIC --------------------
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(3)
+    return {"a": rng.integers(0, 256, (300, 257, 3), dtype=np.uint8),
+            "b": rng.integers(0, 256, (300, 257, 3), dtype=np.uint8),
+            "f": rng.random((300, 257, 3)),
+            "row": rng.integers(0, 256, (257, 3), dtype=np.uint8)}
+
+@pytest.mark.parametrize("source,reference", [
+    ("a + b", lambda a, b, f, row: a + b),
+    ("a * 2 - b / 3 + 1", lambda a, b, f, row: a * 2 - b / 3 + 1),
+    ("(a - b) * (a + b)", lambda a, b, f, row: (a - b) * (a + b)),
+    ("f * a + 0.5", lambda a, b, f, row: f * a + 0.5),
+    ("a + row", lambda a, b, f, row: a + row),
+])
+
+def test_fused_wrap_matches_numpy(source, reference, images):
+    fused = Interpreter(dict(images)).run(source)
+    unfused = Interpreter(dict(images), fuse=False).run(source)
+    expected = reference(**images)
+    for result in (fused, unfused):
+        assert result.dtype == expected.dtype
+        assert np.array_equal(result, expected)
+
+def test_fused_saturate_matches_opencv(images):
+    a, b = images["a"], images["b"]
+    interp = Interpreter(dict(images), arithmetic="saturate")
+    assert np.array_equal(interp.run("a + b"), cv2.add(a, b))
+    assert np.array_equal(interp.run("a - b"), cv2.subtract(a, b))
+    expected = np.clip(np.rint(a * 1.5 - b.astype(np.float64) / 3 + 10), 0, 255).astype(np.uint8)
+    result = interp.run("a * 1.5 - b / 3 + 10")
+    assert result.dtype == np.uint8 and np.array_equal(result, expected)
+    # Like cv2.divide a division by zero gives 0
+    assert np.array_equal(interp.run("a / (b - b)"), np.zeros_like(a))
+
+def test_fused_falls_through_for_scalars_and_strings():
+    program = compile_tree(optimize(Interpreter().parse("x * 2 + y")))
+    assert "ELEMENTWISE" in program.disassemble()
+    # A single operator has no temporaries to save
+    assert "ELEMENTWISE" not in compile_tree(Interpreter().parse("x + y")).disassemble()
+    interp = Interpreter({"x": 3, "y": 1, "s": "ab"}, arithmetic="saturate")
+    assert interp.run("x * 2 + y") == 7
+    assert interp.run("x / 2") == 1.5
+    assert interp.run("s + s") == "abab"
+    with pytest.raises(KeyError):
+        interp.run("undefined_name + 1")
+
+def test_fused_memory_stays_near_image_size():
+    import tracemalloc
+    image = np.ones((1024, 1024), dtype=np.float64)
+    interp = Interpreter({"x": image})
+    source = "x * 2 + x * 3 - x / 4 + 1"
+    interp.run(source)
+    tracemalloc.start()
+    try:
+        result = interp.run(source)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert np.array_equal(result, image * 2 + image * 3 - image / 4 + 1)
+    # The result plus block sized temporaries, unfused it takes several full size temporaries
+    assert peak < 1.5 * image.nbytes
+
+def test_arithmetic_mode_is_validated():
+    with pytest.raises(ValueError):
+        VM({}, arithmetic="clamp")
+    with pytest.raises(ValueError):
+        Interpreter(arithmetic="clamp")
+
+# --------------------- TEST CASES FOR MEMOIZATION --------------------
+@pytest.fixture
+def memo_interpreter():
+    from library import pure
+    calls = []
+
+    @pure
+    def brighten(image, amount):
+        calls.append(amount)
+        return image + amount
+
+    def impure(image):
+        calls.append("impure")
+        return image
+
+    image = np.arange(48, dtype=np.uint8).reshape(4, 4, 3)
+    interp = Interpreter({"img": image, "brighten": brighten, "impure": impure}, memo=MemoCache())
+    interp.calls = calls
+    return interp
+
+def test_memo_reuses_pure_results(memo_interpreter):
+    interp = memo_interpreter
+    first = interp.run("a = brighten(img, 2)")
+    second = interp.run("b = if (1 > 0): brighten(img, 2) else: brighten(img, 3)")
+    assert second is first and not first.flags.writeable
+    assert interp.calls == [2]
+    assert np.array_equal(first, interp.symbol_table["img"] + 2)
+
+    interp.run("c = impure(img); d = impure(img)")
+    assert interp.calls == [2, "impure", "impure"]
+    assert interp.memo.stats()["hits"] == 1
+
+def test_memo_keys_arrays_by_content(memo_interpreter):
+    interp = memo_interpreter
+    interp.run("brighten(img, 1)")
+    interp.symbol_table["img"][0, 0, 0] = 200
+    changed = interp.run("brighten(img, 1)")
+    assert changed[0, 0, 0] == 201
+    # A read-only result is keyed by identity, chaining it hashes no pixels
+    interp.run("x = brighten(brighten(img, 1), 1)")
+    interp.run("y = brighten(brighten(img, 1), 1)")
+    assert interp.calls == [1, 1, 1]
+    assert interp.symbol_table["x"] is interp.symbol_table["y"]
+
+def test_memo_cv2_and_shadowed_names():
+    image = np.random.default_rng(1).integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    interp = Interpreter({"img": image}, memo=MemoCache())
+    gray = interp.run("cvtColor(img, 6)")
+    assert interp.run("cvtColor(img, 6)") is gray
+    assert np.array_equal(gray, cv2.cvtColor(image, 6))
+    assert interp.memo.stats()["hits"] == 1
+
+    calls = []
+    interp.symbol_table["cvtColor"] = lambda image, code: calls.append(code) or image
+    interp.run("cvtColor(img, 6); cvtColor(img, 6)")
+    assert calls == [6, 6]
+
+def test_memo_byte_budget():
+    from library import pure
+    memo = MemoCache(max_bytes=2500)
+    make = pure(lambda n: np.zeros(n, dtype=np.uint8))
+    for n in (1000, 1001, 1002):
+        memo.call(make, [n])
+    stats = memo.stats()
+    assert stats["entries"] == 2 and stats["evictions"] == 1 and stats["bytes"] == 2003
+    memo.call(make, [5000])
+    assert memo.stats()["entries"] == 2
+    assert memo.call(pure(lambda value: len(value)), [{"a": 1}]) == 1
+    assert memo.stats()["uncacheable"] == 1
+    # Hashing a large writable array would cost more than the call
+    big = np.zeros(2 * 1024 * 1024, dtype=np.uint8)
+    memo.call(pure(lambda image: image.sum()), [big])
+    assert memo.stats()["uncacheable"] == 2
+
+# --------------------- TEST CASES FOR TILED EXECUTION --------------------
+@pytest.fixture
+def large_image():
+    rng = np.random.default_rng(5)
+    y, x = np.mgrid[0:700, 0:900]
+    base = np.stack([x * 255 // 900, y * 255 // 700, (x + y) % 256], axis=-1)
+    return np.clip(base + rng.integers(0, 48, (700, 900, 3)), 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize("specs", [
+    [("cvtColor", [6]), ("GaussianBlur", [(5, 5), 0])],
+    [("GaussianBlur", [(0, 0), 2.5]), ("dilate", [np.ones((3, 3), np.uint8), None, None, 2]), ("medianBlur", [5])],
+    [("cvtColor", [6]), ("adaptiveThreshold", [255, 0, 0, 11, 2])],
+    [("morphologyEx", [2, np.ones((5, 5), np.uint8)]), ("Sobel", [cv2.CV_16S, 1, 0]), ("convertScaleAbs", [])],
+    # Kernels anchored off their center reach farther on one side
+    [("dilate", [np.ones((9, 9), np.uint8), None, (0, 0)]), ("blur", [(7, 3), None, (6, 0)]),
+     ("filter2D", [-1, np.ones((3, 5), np.float32) / 15, None, (4, 2)])],
+], ids=["blur", "chain", "adaptive", "morphology", "anchored"])
+
+def test_tiled_matches_full_frame(specs, large_image):
+    from pipeline import build_pipeline
+    from tiling import run_tiled
+    pipeline = build_pipeline({}, specs)
+    expected = pipeline(large_image)
+    for tile_size in (128, 300):
+        assert np.array_equal(run_tiled(pipeline, large_image, tile_size=tile_size), expected)
+
+@pytest.mark.parametrize("specs", [
+    [("cvtColor", [6]), ("GaussianBlur", [(5, 5), 0])],
+    [("GaussianBlur", [(0, 0), 2.5]), ("dilate", [np.ones((3, 3), np.uint8), None, None, 2]), ("medianBlur", [5])],
+    [("dilate", [np.ones((9, 9), np.uint8), None, (0, 0)]), ("boxFilter", [-1, (3, 7), None, (1, 6)])],
+], ids=["blur", "chain", "anchored"])
+
+def test_strips_match_full_frame(specs, large_image):
+    from pipeline import build_pipeline
+    from tiling import run_strips
+    pipeline = build_pipeline({}, specs)
+    expected = pipeline(large_image)
+    for workers, strips in ((4, None), (3, 7)):
+        result = run_strips(pipeline, large_image, workers, strips)
+        assert result.flags.c_contiguous and np.array_equal(result, expected)
+
+def test_tiled_raw_output_bounded_memory(large_image, tmp_path):
+    import tracemalloc
+    from tiling import run_tiled
+    source, output = str(tmp_path / "in.cvraw"), str(tmp_path / "out.cvraw")
+    save_raw(source, large_image)
+    pipeline = Interpreter().flow("cvtColor(6) -> GaussianBlur(gen_vector(7, 7), 0)")
+    stats = {}
+    tracemalloc.start()
+    try:
+        assert run_tiled(pipeline, source, output, tile_size=128, stats=stats) == output
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert np.array_equal(load_raw(output), pipeline(large_image))
+    assert stats["tiles"] == 6 * 8 and stats["halo"] == 3
+    # A few tiles with their halos, the input is mapped and the output written to disk
+    assert peak < large_image[:, :, 0].nbytes / 4
+
+def test_tiled_rejects_unsupported_stages(large_image, capsys):
+    from tiling import run_tiled
+    pipeline = Interpreter().flow("resize(gen_vector(100, 100)) -> flip(1)")
+    assert run_tiled(pipeline, large_image) == "Error"
+    assert "resize can't be processed in tiles" in capsys.readouterr().out
+    assert run_tiled(Interpreter().flow("cvtColor(6)"), "image.png") == "Error"
+    from tiling import run_strips
+    assert run_strips(pipeline, large_image, 2) == "Error"
+
+@pytest.fixture
+def long_weak_edge():
+    # A vertical step edge that is strong only in its top 20 rows: hysteresis follows it
+    # all the way down on the full frame, a tile or strip below row 20 never sees the start
+    image = np.zeros((400, 400), np.uint8)
+    image[:, 200:] = 20
+    image[:20, 200:] = 200
+    return image
+
+def test_tiled_rejects_canny(long_weak_edge, capsys):
+    from pipeline import build_pipeline
+    from tiling import run_tiled
+    pipeline = build_pipeline({}, [("Canny", [50, 150])])
+    assert np.count_nonzero(pipeline(long_weak_edge)) == 599
+    assert run_tiled(pipeline, long_weak_edge, tile_size=128) == "Error"
+    assert "Canny can't be processed in tiles" in capsys.readouterr().out
+
+def test_strips_reject_canny(long_weak_edge, capsys):
+    from pipeline import build_pipeline
+    from tiling import run_strips
+    pipeline = build_pipeline({}, [("Canny", [50, 150])])
+    assert run_strips(pipeline, long_weak_edge, 4) == "Error"
+    assert "Canny can't be processed in strips" in capsys.readouterr().out
+
+# --------------------- TEST CASES FOR FRAME STREAMS --------------------
+@pytest.fixture
+def video_path(tmp_path):
+    path = str(tmp_path / "input.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 12, (64, 48), True)
+    for i in range(20):
+        frame = np.zeros((48, 64, 3), np.uint8)
+        cv2.rectangle(frame, (i * 2, 10), (i * 2 + 12, 30), (0, 255 - i * 10, i * 10), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def test_stream_video_through_flow(video_path, tmp_path, interpreter):
+    from streams import FrameSource
+    output = str(tmp_path / "gray.avi")
+    interpreter.symbol_table["input_path"] = video_path
+    interpreter.symbol_table["output_path"] = output
+    stats = interpreter.run("video = open_video(input_path); gray = video -> cvtColor(6) -> GaussianBlur(gen_vector(3, 3), 0); save_video(gray, output_path)")
+    assert stats["read"] == stats["processed"] == stats["written"] == 20
+    assert stats["dropped"] == 0 and stats["input_fps"] == 12
+
+    capture = cv2.VideoCapture(output)
+    assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 20 and capture.get(cv2.CAP_PROP_FPS) == 12
+    capture.release()
+
+    # The stream yields what the flow gives for every decoded frame
+    expected = [cv2.GaussianBlur(cv2.cvtColor(frame, 6), (3, 3), 0) for frame in FrameSource(video_path).frames()]
+    frames = list(interpreter.symbol_table["gray"])
+    assert len(frames) == 20 and all(np.array_equal(a, b) for a, b in zip(frames, expected))
+
+def test_stream_image_sequence(tmp_path):
+    from streams import FrameSource, FrameStream, FrameWriter, StreamStats
+    for i in range(5):
+        cv2.imwrite(str(tmp_path / f"in_{i}.png"), np.full((8, 8, 3), i * 40, np.uint8))
+    pipeline = Interpreter().flow("bitwise_not()")
+    stream = pipeline(FrameSource(str(tmp_path / "in_*.png")))
+    assert isinstance(stream, FrameStream)
+    stats = StreamStats()
+    frames = list(stream.run(FrameWriter(str(tmp_path / "out_{:02d}.png")), stats=stats))
+    assert [frame[0, 0, 0] for frame in frames] == [255, 215, 175, 135, 95]
+    assert stats.written == 5 and cv2.imread(str(tmp_path / "out_04.png"))[0, 0, 0] == 95
+
+def test_stream_live_source_drops_frames(video_path):
+    import time
+    from pipeline import Pipeline
+    from streams import FrameSource, FrameStream, StreamStats
+    slow = Pipeline([("slow", lambda frame: time.sleep(0.02) or frame, ())])
+    stats = StreamStats()
+    frames = list(FrameStream(FrameSource(video_path, live=True), [slow]).run(queue_size=1, stats=stats))
+    assert stats.dropped > 0 and stats.read == 20
+    assert len(frames) == stats.processed == stats.read - stats.dropped
+    # A file source blocks the decoder instead
+    stats = StreamStats()
+    assert len(list(FrameStream(FrameSource(video_path), [slow]).run(queue_size=1, stats=stats))) == 20
+    assert stats.dropped == 0 and stats.fps > 0
+
+def test_stream_writer_failure_does_not_hang(video_path):
+    import threading
+    from streams import FrameSource, FrameStream, FrameWriter, StreamStats
+
+    class BrokenWriter(FrameWriter):
+        def write(self, frame):
+            raise OSError("disk full")
+
+    stats = StreamStats()
+    done = []
+    run = lambda: done.append(list(FrameStream(FrameSource(video_path)).run(BrokenWriter("out.avi"), queue_size=1, stats=stats)))
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive() and done
+    assert stats.errors == 1 and stats.written == 0 and stats.processed < 20
+
+def test_save_video_unwritable_path(video_path, tmp_path):
+    from streams import open_video, save_video
+    # A directory where the video should be, cv2.VideoWriter can't open it
+    output = tmp_path / "out.avi"
+    output.mkdir()
+    stats = save_video(open_video(video_path), str(output), queue_size=1)
+    assert stats["errors"] == 1 and stats["written"] == 0 and stats["processed"] < 20
+
+def test_stream_stops_early(video_path):
+    import threading
+    from streams import FrameSource
+    threads = threading.active_count()
+    for i, frame in enumerate(FrameSource(video_path)):
+        if i == 2:
+            break
+    assert threading.active_count() == threads
+
+# --------------------- TEST CASES FOR THE EVALUATION SERVER --------------------
+def test_server_requests(tmp_path):
+    import asyncio
+    import time
+    from server import EvaluationServer, ServerClient
+    image_path = str(tmp_path / "input.png")
+    cv2.imwrite(image_path, np.full((20, 30, 3), 90, np.uint8))
+    output_path = str(tmp_path / "gray.png")
+
+    async def scenario():
+        server = EvaluationServer(2, timeout=5.0, port=0, symbols={"sleep": lambda s: time.sleep(s) or s})
+        host, port = await server.start()
+        client = await ServerClient.connect(host, port)
+        other = await ServerClient.connect(host, port)
+        try:
+            responses = [
+                await client.request(id=1, script="x = k * 2 + 1", symbols={"k": 4}),
+                await client.request(id=2, script="gray = img -> cvtColor(6)", images={"img": image_path}, output=output_path),
+                # Every request starts from a fresh symbol table
+                await other.request(id=3, script="x"),
+                await client.request(id=4, script="sleep(0.5)", timeout=0.05),
+                await other.request(id=5, script="x = ("),
+            ]
+            client.writer.write(b"not json\n")
+            responses.append(json.loads(await client.reader.readline()))
+            responses.append(await client.request(stats=True))
+            return responses
+        finally:
+            await client.close()
+            await other.close()
+            await server.close()
+
+    square, gray, isolated, slow, syntax, bad, stats = asyncio.run(scenario())
+    assert square == {"id": 1, "ok": True, "result": 9, "seconds": square["seconds"]}
+    assert gray["ok"] and gray["result"] == {"shape": [20, 30], "dtype": "uint8"} and gray["output"] == output_path
+    assert cv2.imread(output_path, cv2.IMREAD_UNCHANGED).shape == (20, 30)
+    assert not isolated["ok"] and "KeyError" in isolated["error"]
+    assert slow == {"id": 4, "ok": False, "error": "timeout", "seconds": slow["seconds"]}
+    assert not syntax["ok"]
+    assert not bad["ok"] and "bad request" in bad["error"]
+    assert stats["ok"] and stats["result"]["requests"] == 7 and stats["result"]["timeouts"] == 1
+    assert stats["result"]["errors"] == 4
+
+def test_server_timeout_drops_queued_request(tmp_path):
+    import asyncio
+    import time
+    from server import EvaluationServer, ServerClient
+    image_path = str(tmp_path / "input.png")
+    cv2.imwrite(image_path, np.full((20, 30, 3), 90, np.uint8))
+    output_path = tmp_path / "gray.png"
+
+    async def scenario():
+        server = EvaluationServer(1, timeout=5.0, port=0, symbols={"sleep": lambda s: time.sleep(s) or s})
+        host, port = await server.start()
+        busy = await ServerClient.connect(host, port)
+        queued = await ServerClient.connect(host, port)
+        try:
+            slow = asyncio.ensure_future(busy.request(id=1, script="sleep(0.5)"))
+            await asyncio.sleep(0.05)
+            # Waits for the only interpreter and times out before getting it
+            dropped = await queued.request(id=2, script="gray = img -> cvtColor(6)", images={"img": image_path},
+                                           output=str(output_path), timeout=0.1)
+            return dropped, await slow
+        finally:
+            await busy.close()
+            await queued.close()
+            await server.close()
+
+    dropped, slow = asyncio.run(scenario())
+    assert dropped["error"] == "timeout" and slow["ok"]
+    time.sleep(0.2)
+    assert not output_path.exists()
+
+def test_server_request_past_deadline_stops():
+    import time
+    from server import EvaluationServer
+    server = EvaluationServer(1, port=0)
+    try:
+        request = {"script": "x = 1", "symbols": {"y": 2}}
+        assert server.run_request(request, time.monotonic() - 1) == {"ok": False, "error": "timeout"}
+        assert server.run_request(request, time.monotonic() + 5)["ok"]
+    finally:
+        server.executor.shutdown()
+
+# --------------------- TEST CASES FOR SHARED MEMORY TRANSPORT --------------------
+def test_shared_images_refcounts():
+    import gc
+    from transport import SharedImages
+    with SharedImages() as shared:
+        descriptor, array = shared.allocate((4, 5, 3), np.uint8)
+        array[...] = 7
+        # Sharing an array that already lives in a segment copies nothing
+        assert shared.share(array) == descriptor and shared.share(array[1:]).offset == 15
+        assert shared.attach(descriptor).sum() == 7 * 60
+        shared.release(descriptor.name)
+        shared.release(descriptor.name)
+        del array
+        gc.collect()
+        assert shared.stats()["segments"] == 0 and shared.stats()["unlinked"] == 1
+        # A plain array is copied in, the descriptor keeps it alive until released
+        copied = shared.share(np.arange(6, dtype=np.float32))
+        assert shared.attach(copied).tolist() == [0, 1, 2, 3, 4, 5]
+        gc.collect()
+        assert shared.stats()["segments"] == 1
+    assert shared.stats()["segments"] == 0 and shared.stats()["unlinked"] == 2
+
+def test_map_images_shared_and_pickled():
+    import gc
+    from transport import SharedImages, map_images
+    images = [np.random.default_rng(i).integers(0, 256, (40, 60, 3), dtype=np.uint8) for i in range(3)]
+    expected = [cv2.GaussianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (5, 5), 0) for image in images]
+    flow = "cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)"
+    shared = SharedImages()
+    results = list(map_images(flow, images, workers=2, shared=shared))
+    assert all(np.array_equal(result, image) for result, image in zip(results, expected))
+    # Inputs are unlinked as soon as their result is back, results when they are collected
+    assert shared.stats()["adopted"] == 3 and shared.stats()["segments"] == 3
+    del results
+    gc.collect()
+    assert shared.stats()["segments"] == 0 and shared.stats()["unlinked"] == 6
+    pickled = list(map_images(flow, images, workers=2, transport='pickle'))
+    assert all(np.array_equal(result, image) for result, image in zip(pickled, expected))
+
+def test_map_images_unlinks_unconsumed_results():
+    import gc
+    from transport import map_images
+    before = set(os.listdir("/dev/shm"))
+    images = [np.full((30, 40, 3), i, np.uint8) for i in range(8)]
+    results = map_images("cvtColor(6)", images, workers=2)
+    first = next(results)
+    results.close()
+    del first
+    gc.collect()
+    assert set(os.listdir("/dev/shm")) == before
+    with pytest.raises(ValueError):
+        list(map_images("cvtColor(image, 6) + gen_vector(1, 2, 3)", images, workers=2, mode="script"))
+    gc.collect()
+    assert set(os.listdir("/dev/shm")) == before
+
+# --------------------- TEST CASES FOR THE BUFFER POOL --------------------
+def test_buffer_pool_pipeline():
+    from buffers import BufferPool
+    from pipeline import Pipeline
+    pool = BufferPool()
+    flow = "cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0) -> dilate(gen_matrix(3, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1)) -> medianBlur(3)"
+    pooled = Interpreter(pool=pool).flow(flow)
+    plain = Pipeline(pooled.stages)
+    results = []
+    for seed in range(4):
+        image = np.random.default_rng(seed).integers(0, 256, (30, 40, 3), dtype=np.uint8)
+        results.append(pooled(image))
+        assert np.array_equal(results[-1], plain(image))
+    # Results handed out are never given to a later run
+    assert not any(np.shares_memory(a, b) for i, a in enumerate(results) for b in results[i + 1:])
+    stats = pool.stats
+    assert stats.calls == 16 and stats.reused > 0 and stats.rejected == 0
+    assert stats.reused + stats.allocated == 12
+
+def test_buffer_pool_script_keeps_variables():
+    from buffers import BufferPool, destination
+    pool = BufferPool()
+    interpreter = Interpreter(pool=pool)
+    source = "g = GaussianBlur(cvtColor(img, 6), gen_vector(5, 5), 0); h = medianBlur(bitwise_not(g), 3)"
+    kept = []
+    for seed in range(3):
+        image = np.random.default_rng(seed).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+        interpreter.symbol_table["img"] = image
+        interpreter.run(source)
+        g = cv2.GaussianBlur(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        assert np.array_equal(interpreter.symbol_table["g"], g)
+        assert np.array_equal(interpreter.symbol_table["h"], cv2.medianBlur(cv2.bitwise_not(g), 3))
+        kept.append(interpreter.symbol_table["g"])
+    # Temporaries came back to the pool, arrays bound to names did not
+    assert pool.stats.recycled > 0 and pool.stats.reused > 0
+    assert not any(np.shares_memory(a, b) for i, a in enumerate(kept) for b in kept[i + 1:])
+    assert not any(np.shares_memory(g, free) for g in kept for arrays in pool.free.values() for free in arrays)
+    # A call already passing dst, or a shadowed name, is left alone
+    assert destination("GaussianBlur", cv2.GaussianBlur, 4) is None
+    assert destination("GaussianBlur", lambda *args: None, 3) is None
+    assert destination("GaussianBlur", cv2.GaussianBlur, 3) == "dst"
+
+def test_buffer_pool_rejected_and_recycle():
+    from buffers import BufferPool
+    pool = BufferPool(max_bytes=1000)
+    image = np.zeros((10, 10, 3), np.uint8)
+    pool.shapes[("site", image.shape, image.dtype.str)] = ((5, 5), "|u1")
+    # A wrong guess makes cv2 allocate, the result is still right
+    assert pool.call("site", "cvtColor", cv2.cvtColor, (image, cv2.COLOR_BGR2GRAY)).shape == (10, 10)
+    assert pool.stats.rejected == 1 and pool.shapes[("site", image.shape, image.dtype.str)] == ((10, 10), "|u1")
+    # The unused guess went back to the pool
+    assert pool.stats.recycled == 1 and pool.free_bytes == 25
+    # Only temporaries go back, not an array the pool didn't produce or one claimed
+    first = pool.call("site", "cvtColor", cv2.cvtColor, (image, cv2.COLOR_BGR2GRAY))
+    pool.recycle(image)
+    kept = pool.call("site", "cvtColor", cv2.cvtColor, (image, cv2.COLOR_BGR2GRAY))
+    pool.claim(kept)
+    pool.recycle(kept)
+    assert pool.stats.recycled == 1
+    pool.recycle(first)
+    pool.recycle(first)
+    assert pool.stats.recycled == 2 and pool.free_bytes == 125
+    big = pool.call("big", "cvtColor", cv2.cvtColor, (np.zeros((40, 50, 3), np.uint8), cv2.COLOR_BGR2GRAY))
+    pool.recycle(big)
+    assert pool.stats.dropped == 1 and "allocations avoided" in pool.report()
+
+def test_buffer_pool_never_recycles_escaped_values():
+    from buffers import BufferPool
+    pool = BufferPool()
+    kept = []
+    interpreter = Interpreter(pool=pool, symbols={"keep": lambda image: kept.append(image) or image})
+    image = np.random.default_rng(1).integers(0, 256, (20, 30, 3), dtype=np.uint8)
+    interpreter.symbol_table["img"] = image
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # Given to a function that keeps it, then consumed by a cv2 call
+    interpreter.run("h = medianBlur(keep(cvtColor(img, 6)), 3)")
+    # A call that raises doesn't recycle its arguments either
+    assert interpreter.run("GaussianBlur(cvtColor(img, 6), gen_vector(4, 4), 0)") == "Error"
+    # A result put in the symbol table by the caller is a name like any other
+    interpreter.symbol_table["r"] = interpreter.run("cvtColor(img, 6)")
+    interpreter.run("x = medianBlur(r, 3)")
+    assert pool.stats.recycled == 0
+    assert np.array_equal(kept[0], gray) and np.array_equal(interpreter.symbol_table["r"], gray)
+    # Recycled as soon as nothing but the VM stack holds it
+    interpreter.run("x = medianBlur(cvtColor(img, 6), 3)")
+    assert pool.stats.recycled == 1
+
+def test_buffer_pool_shared_by_strip_threads(large_image):
+    from buffers import BufferPool
+    from tiling import run_strips
+    pool = BufferPool()
+    pipeline = Interpreter(pool=pool).flow("cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)")
+    expected = cv2.GaussianBlur(cv2.cvtColor(large_image, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+    for _ in range(5):
+        assert np.array_equal(run_strips(pipeline, large_image, 4, 4), expected)
+    # Every stage of every strip counted once
+    assert pool.stats.calls == 2 * 4 * 5
+    # Threads that reach a stage before its shape is learned all run without a pool array
+    assert pool.stats.reused + pool.stats.allocated + len(pool.shapes) <= pool.stats.calls
+
+def test_batch_buffer_pool(tmp_path):
+    from buffers import PoolStats
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"img{i}.png")
+        cv2.imwrite(path, np.full((12, 16, 3), 40 * i, np.uint8))
+        paths.append(path)
+    pool_stats = PoolStats()
+    results = list(run_batch("cvtColor(6) -> GaussianBlur(gen_vector(3, 3), 0) -> bitwise_not()",
+                             str(tmp_path / "*.png"), str(tmp_path / "out"), workers=0, buffer_pool=True,
+                             pool_stats=pool_stats))
+    assert all(result.error is None for result in results)
+    assert pool_stats.calls == 9 and pool_stats.reused > 0
+    # Two intermediates per image, plus the saved results once their write finished
+    assert pool_stats.recycled > 2 * 3
+    assert cv2.imread(str(tmp_path / "out" / "img2.png"), cv2.IMREAD_UNCHANGED)[0, 0] == 255 - 80
+
+def test_server_answers_malformed_requests():
+    import asyncio
+    from server import EvaluationServer, ServerClient
+
+    async def scenario():
+        server = EvaluationServer(1, timeout=5.0, port=0)
+        host, port = await server.start()
+        client = await ServerClient.connect(host, port)
+        try:
+            responses = [
+                await client.request(id=1, script="x = 1", timeout="soon"),
+                await client.request(id=2, script="x = 1", symbols=[1, 2]),
+                await client.request(id=3, script="x = 1", images="a.png"),
+                await client.request(id=4, script=5),
+            ]
+            stats = server.stats()
+            server.run_request = lambda request, deadline: 1 / 0
+            responses.append(await client.request(id=5, script="x = 1"))
+            # The connection is still usable
+            del server.run_request
+            responses.append(await client.request(id=6, script="x = 2"))
+            return responses, stats
+        finally:
+            await client.close()
+            await server.close()
+
+    (*bad, failing, last), stats = asyncio.run(scenario())
+    assert all(not response["ok"] and response["error"].startswith("bad request") for response in bad)
+    assert [response["id"] for response in bad] == [1, 2, 3, 4]
+    assert stats["requests"] == 4 and stats["errors"] == 4
+    assert "timeout" in bad[0]["error"] and "symbols" in bad[1]["error"] and "images" in bad[2]["error"]
+    assert failing == {"id": 5, "ok": False, "error": "ZeroDivisionError: division by zero"}
+    assert last["ok"] and last["result"] == 2
@@ -0,0 +1,267 @@
+import argparse
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from library import np, is_raw, load_raw, create_raw
+from pipeline import Pipeline
+
+# ------------------------------------- HALOS -----------------------------------------------
+# Used by tiled execution (out of core, tile by tile) and strip execution (in memory,
+# horizontal strips on a thread pool). A tile or strip is processed together with a halo of surrounding pixels and cropped back, so a
+# neighborhood filter sees the same neighbors it would see on the full frame. At the
+# image border there is no halo and the filter applies its own border mode, like on the
+# full frame. Chained stages add up their halos: the pixels a stage gets wrong near the
+# edge of a tile are only read by the next stage within its own halo.
+#
+# Every rule takes the stage's extra arguments and returns its halo in pixels. A larger
+# halo is never wrong, only slower, so the rules round up. A kernel anchored off its
+# center reaches farther on one side, its halo is that side's reach. Stages missing from
+# the table (resize, flip and warps, global operations like equalizeHist, threshold which returns
+# a pair) can't be split and a pipeline using them can't be tiled. Canny is one of them:
+# its hysteresis follows a weak edge from a strong one any distance away, no halo is
+# wide enough for every image.
+
+def kernel_radius(ksize):
+    # ksize is an int, a (width, height) pair or a kernel array
+    if hasattr(ksize, 'shape') and len(ksize.shape) == 2:
+        return max(ksize.shape) // 2
+    if isinstance(ksize, (int, float)) or (hasattr(ksize, 'shape') and ksize.shape == ()):
+        return int(ksize) // 2
+    return int(max(ksize)) // 2
+
+def kernel_reach(ksize, anchor=None):
+    # Pixels a kernel reaches away from the one it computes, on its farthest side. anchor
+    # is an (x, y) point inside the kernel, -1 or None centers it on that axis
+    if hasattr(ksize, 'shape') and len(ksize.shape) == 2:
+        sizes = (ksize.shape[1], ksize.shape[0])
+    elif isinstance(ksize, (int, float)) or (hasattr(ksize, 'shape') and ksize.shape == ()):
+        sizes = (int(ksize), int(ksize))
+    else:
+        sizes = (int(ksize[0]), int(ksize[1]))
+    if anchor is None:
+        anchor = (-1, -1)
+    reach = 0
+    for size, point in zip(sizes, anchor):
+        point = int(point)
+        if point < 0:
+            point = size // 2
+        reach = max(reach, point, size - 1 - point)
+    return reach
+
+def gaussian_halo(ksize, sigma_x, dst=None, sigma_y=0, *rest):
+    radius = kernel_radius(ksize)
+    if radius == 0:
+        # OpenCV derives the kernel from sigma, at most 4 sigma on each side
+        radius = math.ceil(4 * max(sigma_x, sigma_y)) + 1
+    return radius
+
+def morphology_halo(kernel=None, dst=None, anchor=None, iterations=1, *rest):
+    # No kernel is a 3x3 rectangle
+    radius = kernel_reach(3 if kernel is None else kernel, anchor)
+    return radius * max(1, int(iterations))
+
+def morphology_ex_halo(op, kernel=None, dst=None, anchor=None, iterations=1, *rest):
+    # Opening, closing, top hat and black hat are two passes
+    return 2 * morphology_halo(kernel, dst, anchor, iterations)
+
+def derivative_halo(ksize):
+    # ksize 1 still uses a 3 wide kernel, -1 is Scharr
+    return max(int(ksize), 3) // 2
+
+HALOS = {
+    'cvtColor': lambda code, *rest: 0,
+    'inRange': lambda lower, upper, *rest: 0,
+    'bitwise_not': lambda *rest: 0,
+    'convertScaleAbs': lambda *rest: 0,
+    'LUT': lambda lut, *rest: 0,
+    'GaussianBlur': gaussian_halo,
+    'blur': lambda ksize, dst=None, anchor=None, *rest: kernel_reach(ksize, anchor),
+    'boxFilter': lambda ddepth, ksize, dst=None, anchor=None, *rest: kernel_reach(ksize, anchor),
+    'medianBlur': lambda ksize, *rest: kernel_radius(ksize),
+    'bilateralFilter': lambda d, sigma_color, sigma_space, *rest: int(d) // 2 if d > 0 else math.ceil(1.5 * sigma_space),
+    'filter2D': lambda ddepth, kernel, dst=None, anchor=None, *rest: kernel_reach(kernel, anchor),
+    'adaptiveThreshold': lambda maxval, method, kind, block_size, c, *rest: kernel_radius(block_size),
+    'dilate': morphology_halo,
+    'erode': morphology_halo,
+    'morphologyEx': morphology_ex_halo,
+    'Sobel': lambda ddepth, dx, dy, dst=None, ksize=3, *rest: derivative_halo(ksize),
+    'Scharr': lambda *rest: 1,
+    'Laplacian': lambda ddepth, dst=None, ksize=1, *rest: derivative_halo(ksize),
+}
+
+def stage_halo(name, args):
+    # Halo of one stage, None when it can't be processed in tiles
+    rule = HALOS.get(name)
+    if rule is None:
+        return None
+    try:
+        return rule(*args)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def pipeline_halo(pipeline):
+    '''
+    Halo the whole pipeline needs, the sum of the halos of its stages. Returns
+    (None, name) naming the first stage that can't be processed in tiles.
+    '''
+    total = 0
+    for name, _, args in pipeline.stages:
+        halo = stage_halo(name, args)
+        if halo is None:
+            return None, name
+        total += halo
+    return total, None
+
+# ------------------------------------- TILED EXECUTION -------------------------------------
+def tiles(height, width, tile_size):
+    # (top, bottom, left, right) of every tile, row by row
+    for top in range(0, height, tile_size):
+        for left in range(0, width, tile_size):
+            yield top, min(top + tile_size, height), left, min(left + tile_size, width)
+
+def process_tile(pipeline, image, bounds, halo):
+    # Runs the pipeline on a tile plus its halo, returns the tile's part of the result
+    top, bottom, left, right = bounds
+    height, width = image.shape[:2]
+    outer_top, outer_left = max(0, top - halo), max(0, left - halo)
+    outer_bottom, outer_right = min(height, bottom + halo), min(width, right + halo)
+    window = np.ascontiguousarray(image[outer_top:outer_bottom, outer_left:outer_right])
+    result = pipeline(window)
+    if not isinstance(result, np.ndarray):
+        return None
+    if result.shape[:2] != window.shape[:2]:
+        raise ValueError(f"the pipeline changes the image size ({window.shape[:2]} -> {result.shape[:2]}), it can't be split")
+    return result[top - outer_top:bottom - outer_top, left - outer_left:right - outer_left]
+
+def run_tiled(pipeline, source, output=None, tile_size=1024, halo=None, stats=None):
+    '''
+    Applies pipeline to source one tile at a time. source is an array or a .cvraw path,
+    which is mapped instead of read so only the tiles being processed are in memory.
+    With an output .cvraw path the result is written tile by tile into that file and the
+    path is returned, else the result is returned as an array. halo defaults to the
+    halo the pipeline's stages need (see HALOS). Peak memory is a few tiles plus halos,
+    the size of the image only matters when the result is returned as an array.
+    Returns "Error" when the pipeline can't be tiled or a stage fails.
+    '''
+    if halo is None:
+        halo, stage = pipeline_halo(pipeline)
+        if halo is None:
+            print(f"Error {stage} can't be processed in tiles")
+            return "Error"
+    if isinstance(source, str):
+        if not is_raw(source):
+            print(f"Error tiled input must be a raw image ({source}), convert it with convert_to_raw")
+            return "Error"
+        source = load_raw(source)
+        if source is None:
+            return "Error"
+    if output is not None and not is_raw(output):
+        print(f"Error tiled output must be a raw image, got {output}")
+        return "Error"
+
+    height, width = source.shape[:2]
+    start = time.perf_counter()
+    result = None
+    count = 0
+    for bounds in tiles(height, width, tile_size):
+        try:
+            tile = process_tile(pipeline, source, bounds, halo)
+        except ValueError as e:
+            print(f"Error {e}")
+            return "Error"
+        if tile is None:
+            return "Error"
+        if result is None:
+            shape = (height, width) + tile.shape[2:]
+            result = np.empty(shape, tile.dtype) if output is None else create_raw(output, shape, tile.dtype)
+            if result is None:
+                return "Error"
+        top, bottom, left, right = bounds
+        result[top:bottom, left:right] = tile
+        count += 1
+        if output is not None and right == width:
+            # A finished row of tiles goes to disk before the next one is computed
+            result.flush()
+
+    if stats is not None:
+        stats.update({'tiles': count, 'halo': halo, 'tile_size': tile_size, 'seconds': time.perf_counter() - start})
+    if output is None:
+        return result
+    del result
+    return output
+
+# ------------------------------------- STRIP EXECUTION -------------------------------------
+def strip_bounds(height, strips):
+    step = -(-height // strips)
+    return [(top, min(top + step, height)) for top in range(0, height, step)]
+
+def run_strips(pipeline, image, workers=None, strips=None, halo=None):
+    '''
+    Applies pipeline to an in memory image split into horizontal strips with halos, the
+    strips run on a pool of workers threads (cv2 releases the GIL) so a single large
+    image uses every core. The strips are written straight into the result, the same as
+    pipeline(image) bit for bit: only stages in HALOS are accepted, the others (Canny
+    among them) make it return "Error" like run_tiled. strips defaults to workers,
+    workers to the number of cores.
+    '''
+    if halo is None:
+        halo, stage = pipeline_halo(pipeline)
+        if halo is None:
+            print(f"Error {stage} can't be processed in strips")
+            return "Error"
+    workers = workers or os.cpu_count() or 1
+    height, width = image.shape[:2]
+    # A strip much thinner than its halos would mostly compute halo rows
+    strips = max(1, min(strips or workers, height // max(1, 2 * halo)))
+    if strips == 1:
+        return pipeline(image)
+
+    result = None
+    lock = threading.Lock()
+
+    def process(bounds):
+        nonlocal result
+        top, bottom = bounds
+        strip = process_tile(pipeline, image, (top, bottom, 0, width), halo)
+        if strip is None:
+            return False
+        if result is None:
+            with lock:
+                if result is None:
+                    result = np.empty((height, width) + strip.shape[2:], strip.dtype)
+        result[top:bottom] = strip
+        return True
+
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, strips)) as executor:
+            done = list(executor.map(process, strip_bounds(height, strips)))
+    except ValueError as e:
+        print(f"Error {e}")
+        return "Error"
+    return result if all(done) else "Error"
+
+# ------------------------------------- CLI -------------------------------------------------
+def build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog='translator.py tiled', description='Apply a flow to an image too large for memory, tile by tile')
+    arg_parser.add_argument('flow', help='flow like "cvtColor(6) -> GaussianBlur(gen_vector(5, 5), 0)"')
+    arg_parser.add_argument('input', help='input .cvraw image (see convert_to_raw)')
+    arg_parser.add_argument('output', help='output .cvraw image')
+    arg_parser.add_argument('--tile', type=int, default=1024, help='tile width and height in pixels')
+    arg_parser.add_argument('--halo', type=int, default=None, help='overlap between tiles, by default what the stages need')
+    return arg_parser
+
+def main(argv=None):
+    from translator import Interpreter
+
+    args = build_arg_parser().parse_args(argv)
+    pipeline = Interpreter().flow(args.flow)
+    if not isinstance(pipeline, Pipeline):
+        return 1
+    stats = {}
+    if run_tiled(pipeline, args.input, args.output, args.tile, args.halo, stats) == "Error":
+        return 1
+    print(f"Finished, {stats['tiles']} tiles of {args.tile}px with a {stats['halo']}px halo in {stats['seconds']:.2f}s")
+    return 0
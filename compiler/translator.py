@@ -1,35 +1,36 @@
+import copy
+import hashlib
+import os
+import sys
 import ply.lex as lex
 import ply.yacc as yacc
-import networkx as nx
-from networkx.drawing.nx_pydot import graphviz_layout
-import matplotlib.pyplot as plt
 from library import *
-from globals import NODE_COUNTER, parseGraph
+from ast_nodes import *
+from bytecode import compile_tree, call_function, VM, ARITHMETIC_MODES
+from pipeline import Pipeline, build_pipeline
+from optimizer import optimize
+from program_cache import program_cache
+from streams import open_video, save_video
 
 
 # --------------------- GRAPH VARIBLES -------------------------------
 draw = False
-# --------------------- GRAPH FUNCTION TO ADD NODE --------------------
-def add_node(attr):
-    global parseGraph
-    global NODE_COUNTER
-
-    attr["counter"] = NODE_COUNTER
-    parseGraph.add_node( NODE_COUNTER , **attr)
-    NODE_COUNTER += 1
-
-    return parseGraph.nodes[NODE_COUNTER-1]
 
 # ---------------------- SYMBOL TABLE ---------------------------------
-symbol_table = dict()
-symbol_table["e"] = 2.718281828459045
-symbol_table["max"] = max
-symbol_table["load_image"] = load_image
-symbol_table["save_image"] = save_image
-symbol_table["gen_matrix"] = gen_matrix
-symbol_table["gen_vector"] = gen_vector
-symbol_table["show_image"] = show_image
-symbol_table["search_cv2"] = search_cv2
+# Builtins every Interpreter starts with, each session works on its own copy
+builtin_symbols = dict()
+builtin_symbols["e"] = 2.718281828459045
+builtin_symbols["max"] = max
+builtin_symbols["load_image"] = load_image
+builtin_symbols["save_image"] = save_image
+builtin_symbols["copy_image"] = copy_image
+builtin_symbols["gen_matrix"] = gen_matrix
+builtin_symbols["gen_vector"] = gen_vector
+builtin_symbols["show_image"] = show_image
+builtin_symbols["search_cv2"] = search_cv2
+builtin_symbols["convert_to_raw"] = convert_to_raw
+builtin_symbols["open_video"] = open_video
+builtin_symbols["save_video"] = save_video
 
 
 PLUS_OP = 1
@@ -70,6 +71,8 @@ tokens = (
     'COLON',
     'AND',
     'OR',
+    'NEWLINE',
+    'SEMI',
 )
 
 # ---------------------------------- REGULAR EXPRESSIONS -----------------------
@@ -98,6 +101,9 @@ t_COLON = r':'
 t_AND = r'&&'
 t_OR = r'\|\|'
 
+t_SEMI = r';'
+t_ignore_COMMENT = r'\#[^\n]*'
+
 # ---------------------------------- REGEX AS FUNCTIONS ----------------------------------
 def t_NUMBER(t):
     r'\d+\.?\d*'
@@ -113,15 +119,17 @@ def t_VARIABLE(t):
     return t
 
 def t_STRING(t):
-    r'\"(.)*\"'
+    r'\"[^\"\n]*\"'
     t.value = t.value[1:-1]
 
     return t
 
-def t_newline(t):
+# New lines separate statements
+def t_NEWLINE(t):
     r'\n+'
     t.lexer.lineno += len(t.value)
-t_ignore = ' \t'
+    return t
+t_ignore = ' \t\r'
 
 def t_error(t):
     print("Error on analysis")
@@ -129,52 +137,95 @@ def t_error(t):
 
 # -------------------------------- INITIALIZING THE LEXER ----------------------------------
 lexer = lex.lex()
+lexer.syntax_errors = 0
 
 # -------------------------------- PARSING RULES -------------------------------------------
+start = 'program'
+
+# PROGRAM -------------------------------------------------------------------------------
+# Statements are separated by new lines or ";", blank lines and comments are empty
+# statements and get dropped. A program with a single statement is that statement.
+def p_program(p):
+    '''
+    program : statements
+    '''
+    statements = p[1]
+    if not statements:
+        p[0] = None
+    elif len(statements) == 1:
+        p[0] = statements[0]
+    else:
+        p[0] = Block(statements, statements[0].lineno)
+
+def p_statements(p):
+    '''
+    statements : statements NEWLINE statement
+               | statements SEMI statement
+               | statement
+    '''
+    if( len(p) > 2):
+        if p[3] is not None:
+            p[1].append(p[3])
+        p[0] = p[1]
+    else:
+        p[0] = [] if p[1] is None else [p[1]]
+
+def p_statement(p):
+    '''
+    statement : assignment
+              | empty
+    '''
+    p[0] = p[1]
+
+def p_empty(p):
+    '''
+    empty :
+    '''
+    p[0] = None
+
 def p_assignment_assign(p):
     '''
     assignment : VARIABLE SETTO expression
     '''
 
-    node = add_node( {'type':'ASSIGN' , 'label':'=' , 'value':''} )
-    node_variable = add_node( {'type':'VARIABLE_ASSIGN' , 'label':f'VAR_{p[1]}' , 'value':p[1]} )
-    parseGraph.add_edge(node["counter"] , node_variable["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-    p[0] = node
+    p[0] = Assign(p[1], p[3], p.lineno(1))
 
 # ASSIGNMENT FLOW ----------------------------------------------------------------------
 def p_assignment_flow(p):
     '''
     assignment : VARIABLE SETTO flow
     '''
-    print("Accessing flows")
-    pass
+    p[0] = Assign(p[1], p[3], p.lineno(1))
 
 def p_flow_form(p):
     '''
     flow : VARIABLE CONNECT flow_functions
     '''
-    pass
+    p[0] = Flow(Name(p[1], p.lineno(1)), p[3], p.lineno(2))
 
 def p_flow_functions(p):
     '''
     flow_functions : flow_function_call CONNECT flow_functions
     '''
-    pass
+    p[0] = [p[1]] + p[3]
 
 def p_flow_function(p):
     '''
     flow_functions : flow_function_call
     '''
-    pass
+    p[0] = [p[1]]
 
 def p_flow_function_call(p):
     '''
     flow_function_call : VARIABLE LPAREN params RPAREN
     '''
-    pass
-
+    p[0] = Call(p[1], p[3], p.lineno(1))
 
+def p_flow_function_call_no_params(p):
+    '''
+    flow_function_call : VARIABLE LPAREN RPAREN
+    '''
+    p[0] = Call(p[1], [], p.lineno(1))
 
 # ASSIGNMENT EXPRESSION ------------------------------------------------------------------
 def p_assignment_expression(p):
@@ -189,11 +240,7 @@ def p_expression_plus(p):
     expression : expression PLUS term
     """
 
-    node = add_node( {'type':'PLUS' , 'label':'+' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-    
-    p[0] = node
+    p[0] = BinOp('PLUS', p[1], p[3], p.lineno(2))
 
 # MINUS EXPRESSION -------------------------------------------------------------------------
 def p_expression_minus(p):
@@ -201,11 +248,7 @@ def p_expression_minus(p):
     expression : expression MINUS term
     """
 
-    node = add_node( {'type':'MINUS' , 'label':'-' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = BinOp('MINUS', p[1], p[3], p.lineno(2))
 
 # EXPRESSION TERM -------------------------------------------------------------------------
 def p_expression_term(p):
@@ -219,7 +262,7 @@ def p_string_def(p):
     '''
     string : STRING
     '''
-    p[0] =  add_node( {'type':'STRING' , 'label':f'str_{p[1]}' , 'value':p[1]} )
+    p[0] = Str(p[1], p.lineno(1))
 
     
 # TERM TIMES -------------------------------------------------------------------------
@@ -228,20 +271,14 @@ def p_term_times(p):
     term : term TIMES exponent
     '''
 
-    node = add_node( {'type':'TIMES' , 'label':'*' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-    p[0] = node
+    p[0] = BinOp('TIMES', p[1], p[3], p.lineno(2))
 
 # TERM DIVIDE -------------------------------------------------------------------------
 def p_term_divide(p):
     '''
     term : term DIVIDE exponent
     '''
-    node = add_node( {'type':'DIVIDE' , 'label':'/' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-    p[0] = node
+    p[0] = BinOp('DIVIDE', p[1], p[3], p.lineno(2))
 
 # EXPONENT -------------------------------------------------------------------------
 def p_term_exponent(p):
@@ -255,10 +292,7 @@ def p_exponent_exp(p):
     exponent : factor EXP factor
     '''
 
-    node = add_node( {'type':'POWER' , 'label':'POW' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-    p[0] = node
+    p[0] = BinOp('POWER', p[1], p[3], p.lineno(2))
 
 def p_exponent_factor(p):
     '''
@@ -271,22 +305,20 @@ def p_exponent_parent(p):
     exponent : LPAREN expression RPAREN
     '''
 
-    node = add_node( {'type':'GROUP' , 'label':'( )' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[2]["counter"])
-    p[0] = node
+    p[0] = Group(p[2], p.lineno(1))
 
 # FACTOR -------------------------------------------------------------------------
 def p_factor_num(p):
     ''' factor : NUMBER
     '''
-    p[0] = add_node(  {'type':'NUMBER' , 'label':f'NUM_{p[1]}' , 'value':p[1]} )
+    p[0] = Const(p[1], p.lineno(1))
 
 
 # VARIABLE -------------------------------------------------------------------------
 def p_factor_id(p):
     ''' factor : VARIABLE
     '''
-    p[0] = add_node(  {'type':'VARIABLE' , 'label':f'VAR_{p[1]}' , 'value':p[1]} )
+    p[0] = Name(p[1], p.lineno(1))
 
 
 # COMPARISON OPERATORS -------------------------------------------------------------------------
@@ -295,85 +327,55 @@ def p_expression_GT(p):
     expression : expression GT expression
     """
 
-    node = add_node( {'type':'GT' , 'label':'>' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('GT', p[1], p[3], p.lineno(2))
 
 def p_expression_LT(p):
     """
     expression : expression LT expression
     """
 
-    node = add_node( {'type':'LT' , 'label':'<' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('LT', p[1], p[3], p.lineno(2))
 
 def p_expression_GE(p):
     """
     expression : expression GE expression
     """
 
-    node = add_node( {'type':'GE' , 'label':'>=' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('GE', p[1], p[3], p.lineno(2))
 
 def p_expression_LE(p):
     """
     expression : expression LE expression
     """
 
-    node = add_node( {'type':'LE' , 'label':'<=' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('LE', p[1], p[3], p.lineno(2))
 
 def p_expression_EQ(p):
     """
     expression : expression EQ expression
     """
 
-    node = add_node( {'type':'EQ' , 'label':'==' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('EQ', p[1], p[3], p.lineno(2))
 
 def p_expression_NE(p):
     """
     expression : expression NE expression
     """
 
-    node = add_node( {'type':'NE' , 'label':'!=' , 'value':''} )
-    parseGraph.add_edge(node["counter"] , p[1]["counter"])
-    parseGraph.add_edge(node["counter"] , p[3]["counter"])
-
-    p[0] = node
+    p[0] = Compare('NE', p[1], p[3], p.lineno(2))
 
 # LOGICAL OPERATORS -------------------------------------------------------------------------
 def p_expression_AND(p):
     '''
     expression : LPAREN expression RPAREN AND LPAREN expression RPAREN
     '''
-    node = add_node({"type":"AND", "label":"&&", "value":""})
-    parseGraph.add_edge(node["counter"], p[2]["counter"])
-    parseGraph.add_edge(node["counter"], p[6]["counter"])
-    p[0] = node
+    p[0] = BoolOp('AND', p[2], p[6], p.lineno(4))
 
 def p_expression_OR(p):
     '''
     expression : LPAREN expression RPAREN OR LPAREN expression RPAREN
     '''
-    node = add_node({"type":"OR", "label":"||", "value":""})
-    parseGraph.add_edge(node["counter"], p[2]["counter"])
-    parseGraph.add_edge(node["counter"], p[6]["counter"])
-    p[0] = node
+    p[0] = BoolOp('OR', p[2], p[6], p.lineno(4))
 
 # FUNCTION CALL -----------------------------------------------------------------------------------------
 def p_factor_function_call(p):
@@ -387,24 +389,23 @@ def p_function_call_no_params(p):
     '''
     function_call : VARIABLE LPAREN  RPAREN
     '''
-    p[0] = add_node(  {'type':'FUNCTION_CALL' , 'label':f'FUN_{p[1]}' , 'value':p[1]} )
+    p[0] = Call(p[1], [], p.lineno(1))
 
 def p_function_call_params(p):
     '''
     function_call : VARIABLE LPAREN params RPAREN
     '''
-    node = add_node(  {'type':'FUNCTION_CALL' , 'label':f'FUN_{p[1]}' , 'value':p[1]} )
-    for n in p[3]:
-        parseGraph.add_edge(node["counter"] , n["counter"])
-    p[0] = node
+    p[0] = Call(p[1], p[3], p.lineno(1))
 
 def p_params(p):
     '''
     params : params COMMA expression 
             | expression
     '''
+    # Appending in place keeps long argument lists linear
     if( len(p) > 2):
-        p[0] = p[1] + [p[3]]
+        p[1].append(p[3])
+        p[0] = p[1]
     else:
         p[0] = [p[1]]
 
@@ -413,176 +414,344 @@ def p_if_else_statement(p):
     '''
     expression : IF LPAREN expression RPAREN COLON expression ELSE COLON expression
     '''
-    node = add_node({'type': 'IF', 'label': 'IF', 'value': ''})
-    condition_node = p[3]
-    true_branch = p[6]
-    false_branch = p[9]
-
-    parseGraph.add_edge(node["counter"], condition_node["counter"], label='condition')
-    parseGraph.add_edge(node["counter"], true_branch["counter"], label='true_branch')
-    parseGraph.add_edge(node["counter"], false_branch["counter"], label='false_branch')
-
-    p[0] = node
+    p[0] = If(p[3], p[6], p[9], p.lineno(1))
 
 # Ternary operator
 def p_expression_ternary(p):
     '''
     expression : LPAREN expression RPAREN TERNARY LPAREN expression RPAREN COLON LPAREN expression RPAREN
     '''
-    node = add_node({'type': 'TERNARY', 'label': '?', 'value': ''})
-
-    condition_node = p[2]
-    expression_node = p[6]
-    else_expression_node = p[10]
-
-    parseGraph.add_edge(node["counter"], condition_node["counter"], label='condition')
-    parseGraph.add_edge(node["counter"], expression_node["counter"], label='expression')
-    parseGraph.add_edge(node["counter"], else_expression_node["counter"], label='else_expression')
-    p[0] = node
+    p[0] = Ternary(p[2], p[6], p[10], p.lineno(1))
 
 
 # BOILER PLATE ------------------------------------------------------------------------------
 def p_error(p):
-    print("Syntax error on input ", p)
+    if p is None:
+        print("Syntax error at end of input")
+        return
+    p.lexer.syntax_errors += 1
+    print(f"Syntax error on line {p.lineno} on input ", p)
 
 # ------------------------------------- PARSE TREE ------------------------------------------
 def execute_parse_tree(tree):
-    root = tree.nodes[0]
-    root_id = 0
-    res = visit_node(tree, root_id, -1)
+    program = default_interpreter.compile(tree)
+    res = VM(symbol_table).run(program)
+    print_result(res)
+    return res
+
+def print_result(res):
     if( type(res) == int or type(res) == float or type(res) == bool):
         print("TREE_RESULT: " , res)
-    return res
 
 def execute_parse_tree_testing(tree):
-    root = next((node for node, data in tree.nodes(data=True) if data.get('type') == 'INITIAL'), None)
-    if root is None:
-        raise Exception("Root node not found in graph")
-    res = visit_node(tree, root, -1)
+    if tree is None:
+        raise Exception("Root node not found in tree")
+    program = default_interpreter.compile(tree)
+    res = VM(symbol_table).run(program)
     return res
 
 # --------------------------------------- FUNCTION TO VISIT NODES -----------------------------
-def visit_node(tree, node_id, from_id):
-    children = tree.neighbors(node_id)
-
-    res = []
-    for c in children:
-        if( c != from_id):
-            res.append(visit_node(tree, c, node_id) )
+def visit_node(node, table=None, lazy=False):
+    if table is None:
+        table = symbol_table
+
+    # Lazy mode evaluates the condition or left operand first and only what it selects
+    if lazy:
+        if( node.type == "IF" or node.type == "TERNARY" ):
+            if visit_node(node.cond, table, lazy):
+                return visit_node(node.then, table, lazy)
+            return visit_node(node.orelse, table, lazy)
+        if( node.type == "AND" ):
+            return True if visit_node(node.left, table, lazy) and visit_node(node.right, table, lazy) else False
+        if( node.type == "OR" ):
+            return True if visit_node(node.left, table, lazy) or visit_node(node.right, table, lazy) else False
+
+    # Flow node logic, stage calls get the image as first argument so they are not visited as calls
+    if( node.type == "FLOW" ):
+        specs = [(stage.name, [visit_node(a, table, lazy) for a in stage.args]) for stage in node.stages]
+        pipeline = build_pipeline(table, specs)
+        image = visit_node(node.source, table, lazy)
+        return pipeline(image) if callable(pipeline) else pipeline
+
+    res = [visit_node(c, table, lazy) for c in node.children()]
+    node_type = node.type
+
+    # Statement list logic, the program value is the one of its last statement
+    if( node_type == "BLOCK" ):
+        return res[-1]
+
+    # Assign node logic
+    if( node_type == "ASSIGN" ):
+        table[ node.name ] = res[0]
+        return res[0]
 
-    current_node = tree.nodes[node_id]
+    # Number and string node logic
+    if( node_type == "NUMBER" or node_type == "STRING" ):
+        return node.value
 
-    # Initial node logic
-    if( current_node["type"] == "INITIAL" ):
-        return res[0]
-    
-    # Assign node logic 
-    if( current_node["type"] == "ASSIGN" ):
-        symbol_table[ res[0] ] = res[1]
-        return res[1]
-    if( current_node["type"] == "VARIABLE_ASSIGN" ):
-        return current_node["value"]
-    
-    # Number node logic
-    if( current_node["type"] == "NUMBER" ):
-        return current_node["value"]
-    
-    #String node logic
-    if( current_node["type"] == "STRING" ):
-        return current_node["value"]
-    
     #Variable node logic
-    if( current_node["type"] == "VARIABLE" ):
-        return symbol_table[current_node["value"]]
-    
+    if( node_type == "VARIABLE" ):
+        return table[node.name]
+
     #Arithmetic operations node logic
-    if( current_node["type"] == "PLUS" ):
+    if( node_type == "PLUS" ):
         return res[0] + res[1]
-    if( current_node["type"] == "MINUS" ):
+    if( node_type == "MINUS" ):
         return res[0] - res[1]
-    if( current_node["type"] == 'TIMES'):
+    if( node_type == 'TIMES'):
         return res[0] * res[1]
-    if( current_node["type"] == 'DIVIDE'):
+    if( node_type == 'DIVIDE'):
         return res[0] / res[1]
-    if( current_node["type"] == "POWER" ):
+    if( node_type == "POWER" ):
         return pow(res[0], res[1])
-    if(current_node["type"] == "GROUP"):
+    if(node_type == "GROUP"):
         return res[0]
-    
 
     #Comparison Operators node logic
-    if current_node["type"] == "GT":
+    if node_type == "GT":
         return res[0] > res[1]
-    if current_node["type"] == "LT":
+    if node_type == "LT":
         return res[0] < res[1]
-    if current_node["type"] == "GE":
+    if node_type == "GE":
         return res[0] >= res[1]
-    if current_node["type"] == "LE":
+    if node_type == "LE":
         return res[0] <= res[1]
-    if current_node["type"] == "EQ":
+    if node_type == "EQ":
         return res[0] == res[1]
-    if current_node["type"] == "NE":
+    if node_type == "NE":
         return res[0] != res[1]
-    
 
     #Logical Operators node logic
-    if current_node["type"] == "AND":
+    if node_type == "AND":
         return True if res[0] and res[1] else False
-    if current_node["type"] == "OR":
+    if node_type == "OR":
         return True if res[0] or res[1] else False
-    
-    #IF ELSE statement node logic
-    if current_node['type'] == 'IF':
-        if res[0]:
-            return res[1]
-        else:
-            return res[2]
 
-    #Ternary Operator node logic
-    if current_node['type'] == 'TERNARY':
+    #IF ELSE statement and Ternary Operator node logic
+    if node_type == 'IF' or node_type == 'TERNARY':
         if res[0]:
             return res[1]
         else:
-            return res[2]  
+            return res[2]
 
     #Function call node logic
-    if( current_node["type"] == "FUNCTION_CALL"):
-        v = current_node["value"]
-        if v in symbol_table:
-            fn = symbol_table[v]
-
-            if( callable(fn) ):
-                try:
-                    res = fn(*res)
-                    return res
-                except Exception as e:
-                    print(f"Error calling function {v} "  , e)
-                    return "Error"
-            else:
-                print(f"Error  function {v} IS NOT a function ")
-                return "Error"
-        else:
-            fn = search_cv2(v)
-            if( fn is not None):
-                if( callable(fn) ):
-                    try:
-                        res = fn(*res)
-                        return res
-                    except Exception as e:
-                        print(f"Error calling function {v} "  , e)
-                        return "Error"
-                else:
-                    print(f"Error  function {v} IS NOT a function ")
-                    return "Error"
-            else:
-                print(f"Error {v} IS NOT on symbol table ")
-                return "Error"
+    if( node_type == "FUNCTION_CALL"):
+        return call_function(table, node.name, res)
 
 # ---------------------------------------- BUILDING THE PARSER ------------------------------------
-parser = yacc.yacc()
+def build_parser(write_tables=False):
+    '''
+    Loads the LALR tables packaged in parsetab.py. PLY compares their signature with the
+    grammar above before using them, so stale tables are never used: they are rebuilt in
+    memory instead (slow, with the conflict warnings on stderr). Nothing is written to the
+    source directory unless write_tables is set, "python translator.py tables" does that
+    and also regenerates parser.out.
+    '''
+    if write_tables:
+        return yacc.yacc(debug=True, write_tables=True)
+    return yacc.yacc(debug=False, write_tables=False)
+
+parser = build_parser()
+
+# ---------------------------------------- COMPILER VERSION ------------------------------------
+# Source files whose changes alter the program compiled from the same text
+COMPILER_MODULES = ('translator.py', 'ast_nodes.py', 'optimizer.py', 'bytecode.py')
+compiler_version_digest = None
+
+def compiler_version():
+    '''
+    Identifies the grammar and the code that turns source text into programs: the LALR
+    table signature plus a hash of the compiler modules. Cached programs are stored
+    under it, so a program is never reused by a different grammar.
+    '''
+    global compiler_version_digest
+    if compiler_version_digest is None:
+        grammar = yacc.ParserReflect(globals())
+        grammar.get_all()
+        digest = hashlib.blake2b(grammar.signature().encode(), digest_size=8)
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in COMPILER_MODULES:
+            with open(os.path.join(directory, name), 'rb') as f:
+                digest.update(f.read())
+        compiler_version_digest = digest.hexdigest()
+    return compiler_version_digest
+
+# ---------------------------------------- INTERPRETER ------------------------------------
+class Interpreter:
+    '''
+    One isolated session: its own symbol table, a clone of the lexer and a copy of the
+    parser (the LALR tables are shared read-only, the parsing stacks are per copy).
+    Separate interpreters can run at the same time in different threads.
+    With optimize the constant folding pass runs between parsing and compiling, with lazy
+    conditionals and logical operators skip the branch or operand they don't need.
+    run and run_file get their programs through cache (a ProgramCache shared by default,
+    None compiles every time).
+    With fuse + - * / expressions over images are evaluated in one blocked pass, arithmetic
+    picks their semantics: 'wrap' like NumPy or 'saturate' like OpenCV (see elementwise.py).
+    Without fuse a saturating expression rounds and clips after every operator.
+    With memo (a MemoCache) calls to pure functions with the same arguments are computed
+    once, off by default. With pool (a BufferPool) cv2 calls and pipelines write into
+    recycled arrays, off by default.
+    '''
+    def __init__(self, symbols=None, optimize=True, lazy=True, cache=program_cache, fuse=True, arithmetic='wrap',
+                 memo=None, pool=None):
+        if arithmetic not in ARITHMETIC_MODES:
+            raise ValueError(f"arithmetic must be one of {ARITHMETIC_MODES}, got {arithmetic!r}")
+        self.optimize = optimize
+        self.lazy = lazy
+        self.fuse = fuse
+        self.arithmetic = arithmetic
+        self.memo = memo
+        self.pool = pool
+        self.cache = cache
+        self.symbol_table = dict(builtin_symbols)
+        if symbols:
+            self.symbol_table.update(symbols)
+        self.lexer = lexer.clone()
+        self.parser = copy.copy(parser)
+
+    def parse(self, data):
+        self.lexer.lineno = 1
+        self.lexer.syntax_errors = 0
+        return self.parser.parse(data, lexer=self.lexer)
+
+    def compile(self, tree):
+        if self.optimize:
+            tree = optimize(tree)
+        return compile_tree(tree, self.lazy, fuse=self.fuse)
+
+    def execute(self, program):
+        return VM(self.symbol_table, self.arithmetic, self.memo, self.pool).run(program)
+
+    def build(self, data):
+        # Parses and compiles data, None when it is empty or has syntax errors
+        tree = self.parse(data)
+        self.count_end_error(tree, data)
+        if tree is None or self.lexer.syntax_errors:
+            return None
+        return self.compile(tree)
+
+    def count_end_error(self, tree, data):
+        # Input cut short fails at its end, where p_error gets no token to count the error
+        # on. Only separators can make an empty program.
+        if tree is None and not self.lexer.syntax_errors:
+            self.lexer.input(data)
+            if any(token.type not in ('NEWLINE', 'SEMI') for token in iter(self.lexer.token, None)):
+                self.lexer.syntax_errors += 1
+
+    def load(self, data):
+        if self.cache is None:
+            return self.build(data)
+        key = self.cache.key(data, compiler_version(), self.optimize, self.lazy, self.fuse)
+        return self.cache.load(key, lambda: self.build(data))
+
+    def run(self, data):
+        program = self.load(data)
+        if program is None:
+            return None
+        return self.execute(program)
+
+    def run_file(self, path):
+        '''
+        Runs a whole script: the file is parsed once, compiled into a single program and
+        executed. Returns the value of the last statement. On a syntax error nothing runs,
+        when a statement raises the rest of the script is skipped, both return "Error".
+        '''
+        with open(path) as f:
+            source = f.read()
+        self.lexer.syntax_errors = 0
+        program = self.load(source)
+        if self.lexer.syntax_errors:
+            print(f"Error {path} has {self.lexer.syntax_errors} syntax errors, nothing was executed")
+            return "Error"
+        if program is None:
+            return None
+
+        vm = VM(self.symbol_table, self.arithmetic, self.memo, self.pool)
+        try:
+            return vm.run(program)
+        except Exception as e:
+            print(f"Error on line {vm.error_line} of {path}: {type(e).__name__}: {e}")
+            return "Error"
+
+    def flow(self, data):
+        '''
+        Builds a reusable Pipeline from "f(a) -> g(b)" (or "src -> f(a) -> g(b)", the
+        source is ignored). Stage arguments are evaluated once against this session.
+        '''
+        if '->' not in data.split('(')[0]:
+            data = 'source -> ' + data
+        tree = self.parse('flow = ' + data)
+        if not isinstance(tree, Assign) or not isinstance(tree.value, Flow):
+            print("Error: not a flow ", data)
+            return "Error"
+        specs = []
+        for stage in tree.value.stages:
+            args = [self.execute(self.compile(a)) for a in stage.args]
+            specs.append((stage.name, args))
+        return build_pipeline(self.symbol_table, specs, self.pool)
+
+    def graph(self, tree):
+        return to_graph(tree)
+
+# The module level names are the default session used by the REPL
+default_interpreter = Interpreter()
+symbol_table = default_interpreter.symbol_table
 
 # ---------------------------------------- LEXER EXECUTION  -------------------------------
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'serve':
+        import server
+        sys.exit(server.main(sys.argv[2:]))
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'tiled':
+        import tiling
+        sys.exit(tiling.main(sys.argv[2:]))
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'run':
+        # python translator.py run script.txt [--memo] [--pool]
+        if '--memo' in sys.argv[3:]:
+            from memo import MemoCache
+            default_interpreter.memo = MemoCache()
+        if '--pool' in sys.argv[3:]:
+            from buffers import BufferPool
+            default_interpreter.pool = BufferPool()
+        result = default_interpreter.run_file(sys.argv[2])
+        if default_interpreter.pool is not None:
+            print(default_interpreter.pool.report())
+        if isinstance(result, str) and result == "Error":
+            sys.exit(1)
+        print_result(result)
+        sys.exit(0)
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'profile':
+        # python translator.py profile script.txt [report.json]
+        from profiler import Profiler
+        profiler = Profiler()
+        with open(sys.argv[2]) as f:
+            source = f.read()
+        try:
+            result = profiler.run(default_interpreter, source)
+            if default_interpreter.lexer.syntax_errors:
+                print(f"Error {sys.argv[2]} has {default_interpreter.lexer.syntax_errors} syntax errors, nothing was executed")
+                sys.exit(1)
+            print_result(result)
+        except Exception as e:
+            print(f"Error: {type(e).__name__}: {e}")
+        print(profiler.report())
+        if len(sys.argv) > 3:
+            profiler.dump(sys.argv[3])
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'tables':
+        build_parser(write_tables=True)
+        print("parsetab.py and parser.out are up to date")
+        sys.exit(0)
+
     while True:
         try:
             data = input(">")
@@ -593,24 +762,33 @@ if __name__ == '__main__':
                 print(symbol_table)
                 continue
 
+            if(data == 'cache'):
+                print(image_cache.stats())
+                continue
+
+            if(data == 'programs'):
+                print(program_cache.stats())
+                continue
+
         except EOFError:
             break
         
         if not data: continue 
         
-        NODE_COUNTER = 0
-        parseGraph = nx.Graph()
-        root = add_node({"type":"INITIAL" , "label":"INIT"})
-        result = parser.parse(data)
-        parseGraph.add_edge(root["counter"], result["counter"])
-        
-        labels = nx.get_node_attributes(parseGraph, 'label')
+        # Lines entered again come from the program cache without being parsed
+        program = default_interpreter.load(data)
+        if program is None: continue
 
         if(draw):
+            # Only drawing needs networkx, pydot and matplotlib
+            import networkx as nx
+            from networkx.drawing.nx_pydot import graphviz_layout
+            parseGraph = to_graph(default_interpreter.parse(data))
+            labels = nx.get_node_attributes(parseGraph, 'label')
             pos = graphviz_layout(parseGraph, prog="dot")
             nx.draw(parseGraph, pos, labels=labels, with_labels = True)
             plt.show()
 
-        execute_parse_tree(parseGraph)
+        print_result(default_interpreter.execute(program))
               
     print("Finished, accepted")
\ No newline at end of file
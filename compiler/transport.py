@@ -0,0 +1,252 @@
+import sys
+import threading
+import weakref
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from library import np
+
+# ------------------------------------- SHARED MEMORY TRANSPORT -----------------------------
+# Images cross process boundaries as descriptors of multiprocessing.shared_memory segments
+# instead of pickled arrays: a pickled image is copied into the pipe, through the kernel
+# and out again in each direction. A descriptor is a few bytes, the receiving side maps
+# the segment and gets an array over the same pages.
+#
+# Every segment has one owner, the process that unlinks it. SharedImages counts the
+# references the owner holds (descriptors handed out, arrays returned by attach) and
+# unlinks a segment when its count drops to zero. A segment created by a worker for its
+# result is adopted by the parent, which becomes its owner.
+
+SharedImage = namedtuple('SharedImage', ['name', 'shape', 'dtype', 'offset'])
+
+def create_segment(shape, dtype):
+    # New segment holding an array of shape and dtype, returns (segment, descriptor, array)
+    dtype = np.dtype(dtype)
+    size = max(1, int(np.prod(shape, dtype=np.int64)) * dtype.itemsize)
+    segment = shared_memory.SharedMemory(create=True, size=size)
+    descriptor = SharedImage(segment.name, tuple(shape), dtype.str, 0)
+    return segment, descriptor, np.ndarray(shape, dtype, buffer=segment.buf, offset=0)
+
+def open_segment(descriptor):
+    segment = shared_memory.SharedMemory(name=descriptor.name)
+    array = np.ndarray(descriptor.shape, np.dtype(descriptor.dtype), buffer=segment.buf, offset=descriptor.offset)
+    return segment, array
+
+def export(array):
+    '''
+    Copies array into a new segment and closes it without unlinking, for a worker
+    handing a result over: whoever adopts the descriptor owns the segment.
+    '''
+    segment, descriptor, shared = create_segment(array.shape, array.dtype)
+    shared[...] = array
+    del shared
+    segment.close()
+    return descriptor
+
+def discard(descriptor):
+    # Unlinks an exported segment that will never be adopted
+    segment = shared_memory.SharedMemory(name=descriptor.name)
+    segment.close()
+    segment.unlink()
+
+class SharedImages:
+    '''
+    Registry of the segments this process owns or has mapped, with reference counts.
+    Arrays returned by allocate / attach / adopt hold a reference until the array and
+    every view of it are garbage collected, a descriptor returned by share holds one
+    until it is released. A segment is unmapped when its count drops to zero and
+    unlinked too when it is owned. close drops every segment left.
+    '''
+    def __init__(self):
+        self.segments = {}
+        self.refs = {}
+        self.addresses = {}
+        self.owned = set()
+        self.lingering = []
+        # Reentrant: a finalizer releasing a segment may run during a collection inside the lock
+        self.lock = threading.RLock()
+        self.created = 0
+        self.adopted = 0
+        self.unlinked = 0
+        self.bytes = 0
+
+    # ------------------------------- OWNER SIDE -------------------------------------------
+    def allocate(self, shape, dtype):
+        # A new owned segment, the caller fills the array in place: no copy at all
+        segment, descriptor, array = create_segment(shape, dtype)
+        self.register(segment, owned=True)
+        with self.lock:
+            self.created += 1
+            self.bytes += segment.size
+        return descriptor, self.track(descriptor.name, array)
+
+    def share(self, array):
+        '''
+        Descriptor of array in shared memory, copied into a new segment unless it
+        already lives in one of ours. The descriptor holds a reference until released.
+        '''
+        descriptor = self.descriptor_of(array)
+        if descriptor is None:
+            descriptor, shared = self.allocate(array.shape, array.dtype)
+            shared[...] = array
+        self.retain(descriptor.name)
+        return descriptor
+
+    def adopt(self, descriptor):
+        # Takes ownership of a segment another process exported, returns an array over it
+        segment, array = open_segment(descriptor)
+        self.register(segment, owned=True)
+        with self.lock:
+            self.adopted += 1
+        return self.track(descriptor.name, array)
+
+    # ------------------------------- ANY SIDE ---------------------------------------------
+    def attach(self, descriptor):
+        # Array over a segment owned by another process, mapped once per process
+        with self.lock:
+            segment = self.segments.get(descriptor.name)
+        if segment is None:
+            segment, array = open_segment(descriptor)
+            self.register(segment, owned=False)
+        else:
+            array = np.ndarray(descriptor.shape, np.dtype(descriptor.dtype), buffer=segment.buf, offset=descriptor.offset)
+        return self.track(descriptor.name, array)
+
+    def register(self, segment, owned):
+        address = np.frombuffer(segment.buf, np.uint8, 1).__array_interface__['data'][0]
+        with self.lock:
+            self.segments[segment.name] = segment
+            self.refs[segment.name] = 0
+            self.addresses[segment.name] = address
+            if owned:
+                self.owned.add(segment.name)
+
+    def descriptor_of(self, array):
+        # Descriptor of a contiguous array lying inside one of our segments, None otherwise
+        if not array.flags.c_contiguous:
+            return None
+        start = array.__array_interface__['data'][0]
+        with self.lock:
+            for name, address in self.addresses.items():
+                if address <= start and start + array.nbytes <= address + self.segments[name].size:
+                    return SharedImage(name, array.shape, array.dtype.str, start - address)
+        return None
+
+    def track(self, name, array):
+        self.retain(name)
+        weakref.finalize(array, self.release, name)
+        return array
+
+    def retain(self, name):
+        with self.lock:
+            self.refs[name] += 1
+
+    def release(self, name):
+        with self.lock:
+            if name not in self.refs:
+                # Already dropped by close
+                return
+            self.refs[name] -= 1
+            if self.refs[name] > 0:
+                return
+        self.drop(name)
+
+    def drop(self, name):
+        # Unmaps the segment and unlinks it when owned, ignores names already dropped
+        with self.lock:
+            segment = self.segments.pop(name, None)
+            if segment is None:
+                return
+            del self.refs[name], self.addresses[name]
+            owned = name in self.owned
+            self.owned.discard(name)
+        try:
+            segment.close()
+        except BufferError:
+            # Dropped by close while an array over it is alive, the mapping stays until exit
+            self.lingering.append(segment)
+        if owned:
+            segment.unlink()
+            with self.lock:
+                self.unlinked += 1
+
+    def close(self):
+        # Drops every segment, arrays still over them stay readable until collected
+        with self.lock:
+            names = list(self.segments)
+        for name in names:
+            self.drop(name)
+
+    def stats(self):
+        with self.lock:
+            return {'segments': len(self.segments), 'owned': len(self.owned), 'created': self.created,
+                    'adopted': self.adopted, 'unlinked': self.unlinked, 'bytes_created': self.bytes}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ------------------------------------- WORKERS ---------------------------------------------
+worker_job = None
+worker_images = None
+
+def init_worker(job, mode):
+    global worker_job, worker_images
+    from batch import BatchJob
+
+    worker_job = BatchJob(job, mode)
+    worker_images = SharedImages()
+
+def process_shared(descriptor, index):
+    # Maps the input, applies the job and exports an array result, no pixels are pickled
+    image = worker_images.attach(descriptor)
+    result = worker_job.apply(image, f"<image {index}>")
+    del image
+    if 'numpy' in sys.modules and isinstance(result, np.ndarray):
+        return export(result)
+    return result
+
+def process_pickled(image, index):
+    return worker_job.apply(image, f"<image {index}>")
+
+def map_images(job, images, workers=None, mode='flow', transport='shared', shared=None):
+    '''
+    Applies job (a Pipeline, a flow or a script, like BatchJob) to in memory images on a
+    pool of processes and yields the results in order. With transport 'shared' images
+    go both ways as SharedImage descriptors, no pixels go through a pipe: inputs are
+    copied once into shared memory (not at all when they already live in a segment of
+    shared, see allocate), workers read them in place and copy each array result once
+    into a new segment (cv2 allocates its output, export moves it where the parent can
+    map it). Results are views over those segments, owned by shared (a new SharedImages
+    by default) and unlinked when they are garbage collected. Results never consumed,
+    because the caller stopped early or a worker raised, are unlinked before returning.
+    transport 'pickle' sends the arrays themselves, for comparison.
+    '''
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(job, mode)) as executor:
+        if transport == 'pickle':
+            yield from executor.map(process_pickled, images, range(len(images)))
+            return
+
+        registry = shared if shared is not None else SharedImages()
+        inputs = [registry.share(image) for image in images]
+        futures = [executor.submit(process_shared, descriptor, index) for index, descriptor in enumerate(inputs)]
+        consumed = 0
+        try:
+            for descriptor, future in zip(inputs, futures):
+                result = future.result()
+                consumed += 1
+                registry.release(descriptor.name)
+                if isinstance(result, SharedImage):
+                    result = registry.adopt(result)
+                yield result
+        finally:
+            for future in futures[consumed:]:
+                future.cancel()
+            for descriptor, future in zip(inputs[consumed:], futures[consumed:]):
+                # Exported by a worker that finished anyway, nobody will adopt it
+                if not future.cancelled() and future.exception() is None and isinstance(future.result(), SharedImage):
+                    discard(future.result())
+                registry.release(descriptor.name)